@@ -0,0 +1,111 @@
+"""
+Guild Actor - Ordered mailbox that runs one guild's playback mutations one at a time
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+logger = logging.getLogger('actor')
+
+
+class Mutation:
+    __slots__ = ("kind", "run", "future", "count", "submitted", "coalesce")
+    
+    def __init__(self, kind: str, run: Callable[[int], Awaitable], coalesce: bool):
+        self.kind = kind
+        self.run = run  # run(count): count = số lần đã gộp (vd. skip x5)
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.count = 1
+        self.submitted = time.monotonic()
+        self.coalesce = coalesce
+
+
+class GuildActor:
+    """
+    Player / queue mutations of one guild (play, skip, jump, stop, track-end
+    advance) go through this mailbox and run strictly in submission order, so
+    two of them never interleave across an await.
+    
+    - Coalescing: a `coalesce` mutation waits `window` seconds at the head of
+      the mailbox; identical mutations submitted meanwhile are merged into it
+      (five `pskip` in 200 ms → one skip-by-5).
+    - Superseding: every user mutation bumps `generation`. Autoplay work
+      remembers the generation it was submitted under and gives up (before
+      any more Lavalink searches or plays) once `superseded(token)`.
+    """
+    
+    def __init__(self, guild_id: int, window: float):
+        self.guild_id = guild_id
+        self.window = window
+        self.generation = 0
+        self._mailbox: deque[Mutation] = deque()
+        self._task: asyncio.Task | None = None
+        self.processed = 0
+        self.coalesced = 0
+    
+    def __len__(self) -> int:
+        return len(self._mailbox)
+    
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[int], Awaitable],
+        *,
+        supersedes: bool = False,
+        coalesce: bool = False,
+    ) -> tuple[asyncio.Future, bool]:
+        """Đưa mutation vào mailbox. Trả về (future kết quả, True nếu đã gộp vào mutation đang chờ)."""
+        if supersedes:
+            self.generation += 1
+        
+        if coalesce and self._mailbox and self._mailbox[-1].kind == kind and self._mailbox[-1].coalesce:
+            pending = self._mailbox[-1]
+            pending.count += 1
+            self.coalesced += 1
+            return pending.future, True
+        
+        mutation = Mutation(kind, run, coalesce)
+        self._mailbox.append(mutation)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return mutation.future, False
+    
+    def superseded(self, token: int) -> bool:
+        return token != self.generation
+    
+    async def _run(self) -> None:
+        while self._mailbox:
+            head = self._mailbox[0]
+            if head.coalesce:
+                # Chờ hết cửa sổ gộp (các mutation cùng loại tới trong lúc này được gộp vào head)
+                delay = head.submitted + self.window - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            
+            self._mailbox.popleft()
+            try:
+                result = await head.run(head.count)
+            except asyncio.CancelledError:
+                if not head.future.done():
+                    head.future.set_result(None)
+                raise
+            except Exception as e:
+                logger.error(f"[ACTOR] Guild {self.guild_id}: {head.kind} lỗi: {e}")
+                head.future.set_exception(e)
+                head.future.exception()  # Đã log, không cần asyncio cảnh báo lần nữa
+            else:
+                head.future.set_result(result)
+            self.processed += 1
+    
+    def close(self) -> None:
+        """Bỏ mọi mutation đang chờ (bot rời voice); người đang chờ nhận kết quả None."""
+        # close() có thể được gọi từ chính mutation đang chạy (vd. pstop): không tự cancel
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        while self._mailbox:
+            future = self._mailbox.popleft().future
+            if not future.done():
+                future.set_result(None)
+        self.generation += 1
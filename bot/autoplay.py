@@ -0,0 +1,84 @@
+"""
+Autoplay Buffer - Per-guild pool of pre-filtered, pre-ranked autoplay candidates
+"""
+from collections import OrderedDict, deque
+from typing import Callable
+
+import wavelink
+
+
+class CandidateBuffer:
+    """
+    Ranked autoplay candidates for one guild, best first.
+
+    The buffer remembers the last `chain_limit` seed and candidate ids added
+    since the last clear (the "chain"), so it can tell whether the track now
+    playing came from this buffer or was picked by a user, in which case the
+    candidates are stale. `epoch` changes on every clear, so a refill started
+    for an abandoned chain can tell its results are no longer wanted.
+    """
+
+    def __init__(self, capacity: int, chain_limit: int | None = None):
+        self.capacity = capacity
+        self.chain_limit = chain_limit or 4 * capacity
+        self.epoch = 0
+        self._items: deque[wavelink.Playable] = deque()
+        self._chain: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    def follows(self, track_id: str) -> bool:
+        """True if the track was a recent seed or candidate of this buffer."""
+        return track_id in self._chain or any(track.identifier == track_id for track in self._items)
+
+    def _link(self, track_id: str) -> None:
+        self._chain[track_id] = None
+        self._chain.move_to_end(track_id)
+        if len(self._chain) > self.chain_limit:
+            self._chain.popitem(last=False)
+
+    def extend(self, seed_id: str, tracks: list[wavelink.Playable]) -> int:
+        """Append ranked candidates that are not buffered yet. Returns how many were added."""
+        self._link(seed_id)
+        buffered = {track.identifier for track in self._items}
+        added = 0
+
+        for track in tracks:
+            if len(self._items) >= self.capacity:
+                break
+            if track.identifier in buffered:
+                continue
+            self._items.append(track)
+            self._link(track.identifier)
+            buffered.add(track.identifier)
+            added += 1
+
+        return added
+
+    def discard(self, exclude: set[str], reject: Callable[[wavelink.Playable], bool] | None = None) -> None:
+        """Drop candidates that were played (or whose duplicate was played) since they were buffered."""
+        def stale(track: wavelink.Playable) -> bool:
+            return track.identifier in exclude or (reject is not None and reject(track))
+
+        if any(stale(track) for track in self._items):
+            self._items = deque(track for track in self._items if not stale(track))
+
+    def peek(self) -> wavelink.Playable | None:
+        return self._items[0] if self._items else None
+
+    def pop(self, exclude: set[str], reject: Callable[[wavelink.Playable], bool] | None = None) -> wavelink.Playable | None:
+        """Take the best candidate that is not in `exclude` and not rejected."""
+        while self._items:
+            track = self._items.popleft()
+            if track.identifier not in exclude and (reject is None or not reject(track)):
+                return track
+        return None
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._chain.clear()
+        self.epoch += 1
@@ -0,0 +1,132 @@
+"""
+Resolve Cache - LRU + SQLite cache for Lavalink loadtracks results
+"""
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+import wavelink
+
+
+def encode_result(result: wavelink.Search) -> dict:
+    """Convert a search result into a JSON-safe payload (encoded tracks, no live objects)."""
+    if isinstance(result, wavelink.Playlist):
+        return {
+            "type": "playlist",
+            "info": {"name": result.name, "selectedTrack": result.selected},
+            "pluginInfo": {
+                key: value
+                for key, value in (
+                    ("type", result.type),
+                    ("url", result.url),
+                    ("artworkUrl", result.artwork),
+                    ("author", result.author),
+                )
+                if value is not None
+            },
+            "tracks": [track.raw_data for track in result.tracks],
+        }
+
+    return {"type": "tracks", "tracks": [track.raw_data for track in result]}
+
+
+def decode_result(payload: dict) -> wavelink.Search:
+    """Rebuild fresh Playable / Playlist objects from a cached payload."""
+    if payload["type"] == "playlist":
+        return wavelink.Playlist(payload)
+    return [wavelink.Playable(data) for data in payload["tracks"]]
+
+
+class ResolveCache:
+    """
+    Two-level cache for resolved queries.
+
+    Level 1 is an in-memory LRU (OrderedDict), level 2 is a SQLite table that
+    survives restarts. Entries are keyed by (kind, query) and expire after the
+    TTL configured for their kind.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, capacity: int, ttls: dict[str, int]):
+        self.conn = conn
+        self.capacity = capacity
+        self.ttls = ttls
+        self._memory: OrderedDict[tuple[str, str], tuple[float, dict]] = OrderedDict()
+
+        # Counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS resolve_cache (
+                kind TEXT NOT NULL,
+                query TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (kind, query)
+            )
+            """
+        )
+        # Dọn các entry đã hết hạn từ lần chạy trước
+        self.conn.execute("DELETE FROM resolve_cache WHERE expires_at < ?", (time.time(),))
+        self.conn.commit()
+
+    def get(self, kind: str, query: str) -> dict | None:
+        """Return the cached payload for a query, or None on miss/expiry."""
+        key = (kind, query)
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, payload = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return payload
+            del self._memory[key]
+
+        row = self.conn.execute(
+            "SELECT payload, expires_at FROM resolve_cache WHERE kind = ? AND query = ?",
+            (kind, query),
+        ).fetchone()
+        if row is not None and row[1] > now:
+            payload = json.loads(row[0])
+            self._remember(key, row[1], payload)
+            self.disk_hits += 1
+            return payload
+
+        self.misses += 1
+        return None
+
+    def put(self, kind: str, query: str, payload: dict) -> None:
+        """Store a payload in memory and on disk."""
+        expires_at = time.time() + self.ttls.get(kind, 0)
+        self._remember((kind, query), expires_at, payload)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO resolve_cache (kind, query, payload, expires_at) VALUES (?, ?, ?, ?)",
+            (kind, query, json.dumps(payload), expires_at),
+        )
+        self.conn.commit()
+
+    def _remember(self, key: tuple[str, str], expires_at: float, payload: dict) -> None:
+        self._memory[key] = (expires_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        """Hit/miss counters for logging and the stats command."""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._memory),
+        }
+
+    def close(self) -> None:
+        self.conn.close()
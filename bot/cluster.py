@@ -0,0 +1,208 @@
+"""
+Cluster - Multi-process launcher (one process per shard range) and stats IPC
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import multiprocessing
+import signal
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+
+import discord
+
+logger = logging.getLogger('cluster')
+
+
+def shard_ranges(shard_count: int, clusters: int) -> list[list[int]]:
+    """Chia shard 0..shard_count-1 thành `clusters` khoảng liên tiếp, lệch nhau tối đa 1 shard."""
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def ipc_key(token: str) -> bytes:
+    """Auth key của kênh stats: worker và tool local có token mới kết nối được."""
+    return hashlib.sha256(f"cluster-ipc:{token}".encode()).digest()
+
+
+def bot_stats(bot: discord.Client, cluster_id: int) -> dict:
+    """Số liệu một worker gửi lên launcher."""
+    players = [vc for vc in bot.voice_clients if getattr(vc, "connected", False)]
+    return {
+        "cluster": cluster_id,
+        "shards": list(getattr(bot, "shard_ids", None) or []),
+        "guilds": len(bot.guilds),
+        "players": len(players),
+        "playing": sum(1 for player in players if getattr(player, "playing", False)),
+        "latency_ms": None if math.isnan(bot.latency) else round(bot.latency * 1000),  # NaN khi chưa connect
+        "updated_at": time.time(),
+    }
+
+
+def aggregate(clusters: dict[int, dict]) -> dict:
+    return {
+        "clusters": len(clusters),
+        "guilds": sum(stats["guilds"] for stats in clusters.values()),
+        "players": sum(stats["players"] for stats in clusters.values()),
+        "playing": sum(stats["playing"] for stats in clusters.values()),
+        "per_cluster": [clusters[cluster_id] for cluster_id in sorted(clusters)],
+    }
+
+
+class StatsServer:
+    """
+    Launcher side of the stats channel (multiprocessing.connection on localhost).
+    
+    Workers send ("report", stats) and get the aggregate of every cluster back;
+    anything else can send ("get",) to just read it (`python run.py stats`).
+    """
+    
+    def __init__(self, address: tuple[str, int], authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self.clusters: dict[int, dict] = {}
+        self._lock = threading.Lock()
+    
+    def start(self) -> None:
+        listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+    
+    def _accept(self, listener: Listener) -> None:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError) as e:
+                logger.warning(f"[CLUSTER] Từ chối kết nối stats: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+    
+    def _serve(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                with self._lock:
+                    if message[0] == "report":
+                        self.clusters[message[1]["cluster"]] = message[1]
+                    result = aggregate(self.clusters)
+                conn.send(result)
+    
+    def forget(self, cluster_id: int) -> None:
+        with self._lock:
+            self.clusters.pop(cluster_id, None)
+
+
+class StatsReporter:
+    """Worker side: reports this cluster's stats and keeps the latest aggregate for pstats."""
+    
+    def __init__(self, bot: discord.Client, cluster_id: int, address: tuple[str, int], authkey: bytes, interval: float):
+        self.bot = bot
+        self.cluster_id = cluster_id
+        self.address = address
+        self.authkey = authkey
+        self.interval = interval
+        self.latest: dict | None = None
+        self._conn: Connection | None = None
+        self._task: asyncio.Task | None = None
+    
+    def _exchange(self, stats: dict) -> dict:
+        # Chạy trong thread (connection của multiprocessing là blocking)
+        if self._conn is None:
+            self._conn = Client(self.address, authkey=self.authkey)
+        try:
+            self._conn.send(("report", stats))
+            return self._conn.recv()
+        except (EOFError, OSError):
+            self._conn.close()
+            self._conn = None
+            raise
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.latest = await asyncio.to_thread(self._exchange, bot_stats(self.bot, self.cluster_id))
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                logger.warning(f"[CLUSTER] Không gửi được stats lên launcher: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self._conn is not None:
+            self._conn.close()
+
+
+def read_stats(address: tuple[str, int], authkey: bytes) -> dict:
+    """Đọc aggregate stats từ launcher đang chạy."""
+    with Client(address, authkey=authkey) as conn:
+        conn.send(("get",))
+        return conn.recv()
+
+
+# ==================== LAUNCHER ====================
+
+def _run_worker(cluster_id: int, shard_ids: list[int], shard_count: int) -> None:
+    from bot.main import main
+    
+    asyncio.run(main(shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id))
+
+
+def launch(shard_count: int, clusters: int, address: tuple[str, int], authkey: bytes) -> None:
+    """
+    Chạy `clusters` process, mỗi process một khoảng shard (gateway, Lavalink,
+    cache riêng). Worker chết bất thường được chạy lại; SIGTERM/SIGINT được
+    chuyển tới mọi worker (mỗi worker tự flush state như khi chạy 1 process).
+    """
+    ctx = multiprocessing.get_context("spawn")
+    ranges = shard_ranges(shard_count, clusters)
+    server = StatsServer(address, authkey)
+    server.start()
+    
+    def spawn(cluster_id: int) -> multiprocessing.Process:
+        process = ctx.Process(
+            target=_run_worker,
+            args=(cluster_id, ranges[cluster_id], shard_count),
+            name=f"cluster-{cluster_id}",
+        )
+        process.start()
+        logger.info(f"[CLUSTER] Cluster {cluster_id}: shards {ranges[cluster_id]} (pid {process.pid})")
+        return process
+    
+    processes = {cluster_id: spawn(cluster_id) for cluster_id in range(len(ranges))}
+    
+    stopping = threading.Event()
+    
+    def shutdown(signum, frame):
+        stopping.set()
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+    
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    
+    while not stopping.is_set():
+        for cluster_id, process in list(processes.items()):
+            if not process.is_alive() and not stopping.is_set():
+                logger.warning(f"[CLUSTER] Cluster {cluster_id} thoát (code {process.exitcode}), chạy lại...")
+                server.forget(cluster_id)
+                processes[cluster_id] = spawn(cluster_id)
+        stopping.wait(5)
+    
+    for process in processes.values():
+        process.join()
@@ -4,6 +4,8 @@ Music Cog - All music commands
 import asyncio
 import random
 import logging
+import time
+from typing import AsyncIterator
 import discord
 from discord.ext import commands
 import wavelink
@@ -15,8 +17,67 @@ from bot.config import (
     DEFAULT_VOLUME, 
     MAX_DURATION_SECONDS,
     IDLE_TIMEOUT_SECONDS,
+    ALONE_TIMEOUT_SECONDS,
+    TIMER_TICK,
+    SKIP_COALESCE_WINDOW,
+    SEARCH_CONCURRENCY,
+    SEARCH_INTERACTIVE_RESERVE,
+    SEARCH_PREFETCH_DEADLINE,
+    GUILD_STATE_TTL,
+    GUILD_SETTINGS_PERSIST,
+    RESOLVE_CACHE_SIZE,
+    RESOLVE_CACHE_TTL,
+    AUTOPLAY_BUFFER_SIZE,
+    AUTOPLAY_BUFFER_LOW_WATER,
+    AUTOPLAY_PREFETCH_LEAD,
+    AUTOPLAY_FALLBACK_FANOUT,
+    AUTOPLAY_FALLBACK_DEADLINE,
+    ANTI_REPEAT_LIMIT,
+    HISTORY_FLUSH_INTERVAL,
+    HISTORY_FLUSH_BATCH,
+    JOURNAL_POSITION_INTERVAL,
+    HISTORY_LIMIT,
+    TASTE_DECAY,
+    DUPLICATE_TITLE_THRESHOLD,
+    MAX_SAME_CHANNEL,
+    CHANNEL_WINDOW,
+    GRAPH_MAX_NEIGHBORS,
+    GRAPH_STALE_AFTER,
+    GRAPH_WALK_DEPTH,
+    GRAPH_SEARCH_WEIGHT,
+    PLAYLIST_BATCH_SIZE,
+    PLAYLIST_PROGRESS_INTERVAL,
+    NOTIFY_RATE,
+    NOTIFY_BURST,
 )
-from bot.filters import is_valid_track, filter_search_results, is_likely_mv
+from bot.filters import is_valid_track, filter_search_results, validate_tracks
+from bot.actor import GuildActor
+from bot.autoplay import CandidateBuffer
+from bot.cache import ResolveCache
+from bot.graph import TrackGraph
+from bot.guild_state import GuildRegistry, GuildSettingsStore
+from bot.history import ListeningHistory
+from bot.journal import SessionJournal
+from bot.nodes import NodeBalancer
+from bot.outbox import CardState, Outbox
+from bot.dedup import TitleIndex
+from bot.diversity import ChannelWindow
+from bot.features import GENRE_BITS, LANG_VI, LANG_JA, extract_features, title_tokens, track_features, FEATURE_CACHE
+from bot.player import MusicPlayer
+from bot.queues import IndexedQueue, PlaylistProgress
+from bot.resolver import TrackResolver
+from bot.scheduler import Priority, SearchExpired, SearchScheduler
+from bot.scoring import rank_candidates
+from bot.storage import open_database
+from bot.timers import TimerWheel
+from bot.views import PageButtons
+from bot.taste import TasteProfile
+
+# Nguồn của candidates autoplay (log + nhãn trên now playing card)
+RELATED_ORIGINS = {
+    "graph": "bài liên quan đã lưu",
+    "mix": "YouTube Mix",
+}
 
 
 class Music(commands.Cog):
@@ -24,23 +85,62 @@ class Music(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        # Per-guild state
-        self.autoplay_enabled: dict[int, bool] = {}  # Default: True
-        self.loop_mode: dict[int, str] = {}  # "off", "track", "queue"
-        self._idle_tasks: dict[int, asyncio.Task] = {}
-        self._recent_ids: dict[int, list[str]] = {}  # Tránh lặp bài
-        self._next_autoplay: dict[int, wavelink.Playable] = {}  # Bài autoplay đã prefetch
+        # Mọi lookup Lavalink đi qua resolver (có cache), request thật xếp hàng theo priority
+        self.resolver = TrackResolver(
+            ResolveCache(
+                # Cache chỉ là bản sao kết quả Lavalink: mỗi cluster process một file, không tranh lock
+                open_database("cache.db", getattr(bot, "cluster_id", None)),
+                RESOLVE_CACHE_SIZE,
+                RESOLVE_CACHE_TTL,
+            ),
+            getattr(bot, "node_balancer", None),
+            SearchScheduler(SEARCH_CONCURRENCY, SEARCH_INTERACTIVE_RESERVE),
+        )
+        # Đồ thị bài liên quan (từ Mix / search) để autoplay không cần gọi Lavalink
+        self.graph = TrackGraph(open_database("graph.db"), GRAPH_MAX_NEIGHBORS, GRAPH_STALE_AFTER)
+        # Mọi deadline theo guild (idle, alone, prefetch) nằm trong một timer wheel, không phải 1 task/guild
+        self.timers = TimerWheel(TIMER_TICK)
+        # Lịch sử nghe (anti-repeat + log trên disk)
+        self.history = ListeningHistory(
+            open_database("history.db"), self.timers, ANTI_REPEAT_LIMIT, HISTORY_FLUSH_INTERVAL, HISTORY_FLUSH_BATCH
+        )
+        # Mọi thông báo khi chuyển bài đi qua outbox (gộp + sửa tại chỗ, không chặn track events)
+        self.outbox = Outbox(self._render_card, NOTIFY_RATE, NOTIFY_BURST)
+        # Per-guild state (autoplay, loop, buffer, ...) trong một registry, evict sau GUILD_STATE_TTL không dùng
+        self.guilds = GuildRegistry(
+            self.timers,
+            GUILD_STATE_TTL,
+            GuildSettingsStore(open_database("settings.db")) if GUILD_SETTINGS_PERSIST else None,
+            on_evict=self._forget_guild,
+        )
+        # Journal queue + player state của bot (mở trong setup_hook), đọc 1 lần để restore
+        self.journal: SessionJournal = bot.journal
+        self._pending_restore: dict[int, dict] = self._load_sessions()
 
     # ... existing methods ...
 
+    def _forget_guild(self, guild_id: int):
+        """State của guild bị evict / bot rời guild: bỏ luôn phần cache còn lại ngoài registry."""
+        self.history.evict(guild_id)
+        self.outbox.forget_guild(guild_id)
+    
+    def cog_unload(self):
+        """Flush journal và đóng các kết nối storage khi unload cog (cả khi bot tắt)."""
+        self._flush_sessions()
+        self.outbox.close()
+        self.guilds.close()
+        self.timers.close()
+        self.resolver.cache.close()
+        self.history.close()
+        self.graph.close()
     
     def get_autoplay(self, guild_id: int) -> bool:
         """Get autoplay status for guild (default: True)."""
-        return self.autoplay_enabled.get(guild_id, True)
+        return self.guilds.get(guild_id).autoplay
     
     def get_loop_mode(self, guild_id: int) -> str:
         """Get loop mode for guild (default: off)."""
-        return self.loop_mode.get(guild_id, "off")
+        return self.guilds.get(guild_id).loop
     
     # ==================== EVENTS ====================
     
@@ -55,24 +155,54 @@ class Music(commands.Cog):
         
         guild_id = player.guild.id
         
+        # Bài đang phát vừa được chuyển sang node khác, không phải bài mới
+        if getattr(player, 'migrating_track', None) is not None and player.migrating_track == track.encoded:
+            player.migrating_track = None
+            logger.info(f"[MIGRATE] Guild {guild_id}: Tiếp tục '{track.title}' trên {player.node.identifier}")
+            self._journal_player(player, node=player.node.identifier)
+            return
+        
         # Log track start
         logger.info(f"[PLAYING] Guild {guild_id}: '{track.title}' by {track.author} ({track.length // 1000}s)")
         
-        # Lưu video_id để tránh lặp khi autoplay
-        self._add_recent_id(guild_id, track.identifier)
-        
-        # Send now playing message
+        # Now playing card (gửi ở background, track start không chờ Discord)
         if hasattr(player, 'text_channel') and player.text_channel:
-            embed = self._create_now_playing_embed(track)
-            await player.text_channel.send(embed=embed)
+            self.outbox.track(player.text_channel, track)
+        
+        await self._track_started(player, track)
+    
+    async def _track_started(self, player: MusicPlayer, track: wavelink.Playable, position: int = 0):
+        """
+        Bookkeeping khi một bài bắt đầu phát trên player: history, taste, journal, prefetch.
+        
+        Dùng cho track start và cho bài được adopt khi resume (không có event track start).
+        """
+        guild_id = player.guild.id
+        
+        # Ghi lịch sử (cũng là anti-repeat window cho autoplay)
+        self.history.record_start(guild_id, track)
+        self._get_taste_profile(guild_id).add(track_features(track))
+        self._get_title_index(guild_id).add(track_features(track).tokens)
+        self._get_channel_window(guild_id).add(track.author)
+        self._journal_player(player, current=track.raw_data, paused=player.paused)
         
         # Cancel idle timer
-        if guild_id in self._idle_tasks:
-            self._idle_tasks[guild_id].cancel()
+        self.timers.cancel((guild_id, "idle"))
         
         # Nếu đây là bài cuối trong queue và autoplay ON, prefetch và hiển thị bài tiếp theo
         if not player.queue and self.get_autoplay(guild_id):
             await self._prefetch_and_notify(player, track)
+        
+        # Gần hết bài: kiểm tra lại buffer (có thể đã cạn do skip / queue thay đổi trong lúc phát)
+        remaining = (track.length - position) / 1000
+        if not track.is_stream and remaining > AUTOPLAY_PREFETCH_LEAD:
+            self.timers.arm(
+                (guild_id, "prefetch"),
+                remaining - AUTOPLAY_PREFETCH_LEAD,
+                lambda: self._refresh_prefetch(player),
+            )
+        else:
+            self.timers.cancel((guild_id, "prefetch"))
     
     @commands.Cog.listener()
     async def on_wavelink_track_end(self, payload: wavelink.TrackEndEventPayload):
@@ -87,6 +217,7 @@ class Music(commands.Cog):
         
         # Log track end with reason
         logger.info(f"[TRACK_END] Guild {guild_id}: '{track_title}' - Reason: {payload.reason}")
+        self.history.record_end(guild_id, payload.track, payload.reason)
         
         # Only handle natural track endings - not replacements, stops, or skips
         # Only handle natural track endings or force stops (skips)
@@ -97,6 +228,23 @@ class Music(commands.Cog):
         
         logger.info(f"[FINISHED] Guild {guild_id}: Track finished ({payload.reason}), checking next action...")
         
+        # Chọn bài tiếp theo trong mailbox của guild (không chạy chồng với pplay / pskip / pjump)
+        actor = self._actor(guild_id)
+        token = actor.generation
+        actor.submit("advance", lambda _: self._advance(player, payload, token))
+    
+    async def _advance(self, player: wavelink.Player, payload: wavelink.TrackEndEventPayload, token: int):
+        """Sau track end: loop / bài tiếp theo trong queue / autoplay / idle."""
+        if not player.guild:
+            return
+        
+        guild_id = player.guild.id
+        
+        # Lệnh khác đã phát bài mới trong lúc chờ tới lượt
+        if player.current is not None:
+            logger.info(f"[ACTOR] Guild {guild_id}: Đã có bài đang phát, bỏ qua track end cũ")
+            return
+        
         # Handle loop modes - Only on natural finish
         loop = self.get_loop_mode(guild_id)
         if loop == "track" and payload.track and payload.reason == "finished":
@@ -114,7 +262,8 @@ class Music(commands.Cog):
         # Custom Autoplay logic
         if self.get_autoplay(guild_id):
             logger.info(f"[AUTOPLAY] Guild {guild_id}: Autoplay enabled, getting next track...")
-            await self._do_autoplay(player)
+            # player.current đã bị wavelink bỏ khi track end → tìm gợi ý theo bài vừa kết thúc
+            await self._do_autoplay(player, token, payload.track)
             return
         else:
             logger.info(f"[AUTOPLAY_OFF] Guild {guild_id}: Autoplay is disabled")
@@ -123,482 +272,503 @@ class Music(commands.Cog):
         logger.info(f"[IDLE] Guild {guild_id}: Starting idle timer ({IDLE_TIMEOUT_SECONDS}s)")
         self._start_idle_timer(player)
     
-    async def _do_autoplay(self, player: wavelink.Player):
-        """Lấy bài tiếp theo từ YouTube Radio Mix hoặc dùng bài đã prefetch."""
+    async def _do_autoplay(self, player: wavelink.Player, token: int, seed: wavelink.Playable | None = None):
+        """
+        Lấy bài tiếp theo từ buffer autoplay hoặc YouTube Radio Mix.
+        `seed`: bài vừa kết thúc (lúc track end wavelink đã bỏ player.current), mặc định bài đang phát.
+        """
         if not player.guild:
             return
         
         guild_id = player.guild.id
+        actor = self._actor(guild_id)
+        
+        def superseded() -> bool:
+            # User đã phát / skip / dừng sau track end này → không search hay play thêm
+            if actor.superseded(token):
+                logger.info(f"[AUTOPLAY] Guild {guild_id}: Bỏ autoplay, đã có lệnh mới hơn")
+                return True
+            return False
         
-        # Kiểm tra nếu đã có bài prefetch
-        if guild_id in self._next_autoplay:
-            chosen = self._next_autoplay.pop(guild_id)
-            logger.info(f"[AUTOPLAY] Guild {guild_id}: Dùng bài đã prefetch: '{chosen.title}'")
+        if superseded():
+            return
+        
+        # Bài đã phát gần đây (gồm cả bài hiện tại, đã ghi lúc track start)
+        recent_ids = self.history.recent_ids(guild_id)
+        
+        # Ưu tiên buffer: candidates đã lọc + xếp hạng sẵn, không cần gọi Lavalink
+        buffer = self._get_buffer(guild_id)
+        chosen = buffer.pop(recent_ids, lambda track: self._should_skip(guild_id, track))
+        if chosen:
+            logger.info(f"[AUTOPLAY] Guild {guild_id}: Dùng bài từ buffer: '{chosen.title}' (còn {len(buffer)} bài)")
             
             try:
-                self._add_recent_id(guild_id, chosen.identifier)
                 await player.play(chosen)
                 
+                if len(buffer) < AUTOPLAY_BUFFER_LOW_WATER:
+                    self._schedule_refill(guild_id, chosen)
+                
                 if hasattr(player, 'text_channel') and player.text_channel:
-                    embed = discord.Embed(
-                        title="🔄 Autoplay",
-                        description=f"**{chosen.title}**",
-                        color=discord.Color.purple()
-                    )
-                    embed.add_field(name="Channel", value=chosen.author, inline=True)
-                    await player.text_channel.send(embed=embed)
+                    self.outbox.source(player.text_channel, chosen, "🔄 Autoplay")
                 return
             except Exception as e:
-                logger.error(f"[AUTOPLAY] Guild {guild_id}: Lỗi phát bài prefetch: {e}")
+                logger.error(f"[AUTOPLAY] Guild {guild_id}: Lỗi phát bài từ buffer: {e}")
                 # Fallback sang search mới
         
-        # Không có prefetch hoặc prefetch fail, search mới
-        if not player.current:
-            logger.warning(f"[AUTOPLAY] Guild {guild_id}: Không có bài hiện tại để tìm gợi ý")
+        # Buffer trống hoặc phát lỗi, search mới theo bài vừa phát
+        seed = seed or player.current
+        if not seed:
+            logger.warning(f"[AUTOPLAY] Guild {guild_id}: Không có bài nào để tìm gợi ý")
             self._start_idle_timer(player)
             return
-            
-        video_id = player.current.identifier
-        current_title = player.current.title
+        
+        video_id = seed.identifier
+        current_title = seed.title
         
         logger.info(f"[AUTOPLAY] Guild {guild_id}: Tìm bài tiếp theo cho '{current_title}'")
         
-        # Lấy danh sách bài đã phát gần đây
-        recent_ids = set(self._recent_ids.get(guild_id, []))
-        recent_ids.add(video_id)  # Thêm bài hiện tại
+        # Lấy thông tin genre/language của seed (đã cache theo identifier)
+        source = track_features(seed)
         
-        # Thử YouTube Radio Mix trước
+        # Thử graph local / YouTube Radio Mix trước
         try:
-            # YouTube Radio Mix URL
-            mix_url = f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
-            logger.info(f"[AUTOPLAY] Guild {guild_id}: Đang load YouTube Mix...")
-            
-            results = await wavelink.Playable.search(mix_url)
+            ranked, origin = await self._related_candidates(guild_id, seed, recent_ids)
+            if superseded():
+                return
             
-            if results and len(results) > 1:
-                # Lọc bỏ bài hiện tại và các bài đã phát
-                non_mv_tracks = []  # Ưu tiên
-                mv_tracks = []      # Fallback
+            if ranked:
+                chosen, chosen_score = ranked[0]
+                logger.info(
+                    f"[AUTOPLAY] Guild {guild_id}: Đã chọn từ {RELATED_ORIGINS[origin]}: "
+                    f"'{chosen.title}' (score={chosen_score:.1f})"
+                )
                 
-                for track in results[1:]:  # Bỏ bài đầu (bài hiện tại)
-                    if track.identifier not in recent_ids:
-                        # Kiểm tra filter (shorts, live, quá dài)
-                        is_valid, _ = is_valid_track(
-                            title=track.title,
-                            duration_ms=track.length,
-                            is_stream=track.is_stream
-                        )
-                        if is_valid:
-                            # Phân loại: MV hay không
-                            if is_likely_mv(track.title):
-                                mv_tracks.append(track)
-                            else:
-                                non_mv_tracks.append(track)
+                # Phần còn lại của candidates vào buffer thay vì bỏ đi
+                buffer.clear()
+                buffer.extend(video_id, [track for track, _ in ranked[1:]])
                 
-                # Ưu tiên bài không phải MV, nếu không có thì dùng MV
-                valid_tracks = non_mv_tracks if non_mv_tracks else mv_tracks
+                await player.play(chosen)
                 
-                if valid_tracks:
-                    # Lấy thông tin genre/language của bài hiện tại
-                    source_info = self._detect_genre_language(
-                        current_title, 
-                        player.current.author if player.current else ""
-                    )
-                    
-                    # Tính điểm cho mỗi track và sắp xếp theo điểm giảm dần
-                    scored_tracks = []
-                    for track in valid_tracks[:10]:  # Chỉ xét 10 bài đầu
-                        score = self._calculate_similarity_score(source_info, track.title, track.author)
-                        scored_tracks.append((track, score))
-                    
-                    # Sắp xếp theo điểm giảm dần
-                    scored_tracks.sort(key=lambda x: x[1], reverse=True)
-                    
-                    # Chọn ngẫu nhiên từ top 3 bài điểm cao nhất để vẫn có sự đa dạng
-                    top_tracks = [t[0] for t in scored_tracks[:3]]
-                    chosen = random.choice(top_tracks) if top_tracks else valid_tracks[0]
-                    
-                    # Log điểm của bài được chọn
-                    chosen_score = next((s for t, s in scored_tracks if t == chosen), 0)
-                    logger.info(f"[AUTOPLAY] Guild {guild_id}: Đã chọn từ Mix: '{chosen.title}' (score={chosen_score})")
-                    
-                    # Lưu vào recent_ids để tránh lặp
-                    self._add_recent_id(guild_id, chosen.identifier)
-                    
-                    await player.play(chosen)
-                    
-                    if hasattr(player, 'text_channel') and player.text_channel:
-                        embed = discord.Embed(
-                            title="🔄 Autoplay (YouTube Mix)",
-                            description=f"**{chosen.title}**",
-                            color=discord.Color.purple()
-                        )
-                        embed.add_field(name="Channel", value=chosen.author, inline=True)
-                        await player.text_channel.send(embed=embed)
-                    return
-                    
+                if hasattr(player, 'text_channel') and player.text_channel:
+                    self.outbox.source(player.text_channel, chosen, f"🔄 Autoplay ({RELATED_ORIGINS[origin]})")
+                return
+        
         except Exception as e:
             logger.warning(f"[AUTOPLAY] Guild {guild_id}: YouTube Mix thất bại: {e}")
         
         # Fallback: Tìm kiếm thông thường với scoring
         logger.info(f"[AUTOPLAY] Guild {guild_id}: Fallback sang search...")
         
-        # Lấy thông tin genre/language của bài hiện tại
-        source_info = self._detect_genre_language(
-            current_title, 
-            player.current.author if player.current else ""
-        )
-        
         # Xác định ngôn ngữ chính để tìm kiếm
-        is_vietnamese = 'vi' in source_info.get('languages', set())
-        is_kpop = 'kpop' in source_info.get('genres', set())
-        is_japanese = 'ja' in source_info.get('languages', set())
+        is_vietnamese = bool(source.languages & LANG_VI)
+        is_kpop = bool(source.genres & GENRE_BITS['kpop'])
+        is_japanese = bool(source.languages & LANG_JA)
         
         # Tạo query phù hợp với ngôn ngữ
         if is_vietnamese:
             fallback_queries = [
-                f"{player.current.author} nhạc" if player.current and player.current.author else None,
+                f"{seed.author} nhạc" if seed.author else None,
                 "nhạc việt hot 2024",
                 f"{current_title.split()[0]} nhạc",  # Dùng từ đầu tiên
             ]
         elif is_kpop:
             fallback_queries = [
-                f"{player.current.author} kpop" if player.current and player.current.author else None,
+                f"{seed.author} kpop" if seed.author else None,
                 "kpop hot 2024",
             ]
         elif is_japanese:
             fallback_queries = [
-                f"{player.current.author}" if player.current and player.current.author else None,
+                f"{seed.author}" if seed.author else None,
                 "jpop music",
             ]
         else:
             fallback_queries = [
-                f"{player.current.author} music" if player.current and player.current.author else None,
+                f"{seed.author} music" if seed.author else None,
                 f"{current_title} similar songs",
             ]
         
         fallback_queries = [q for q in fallback_queries if q]
         
-        for query in fallback_queries:
+        # Chạy song song tất cả query, lấy bài điểm cao nhất từ kết quả hợp lệ đầu tiên
+        scored_tracks = await self._race_fallback_queries(guild_id, fallback_queries, recent_ids, seed)
+        if superseded():
+            return
+        
+        if scored_tracks:
+            # Chọn từ top 3 bài điểm cao nhất
+            chosen, chosen_score = random.choice(scored_tracks[:3])
+            
+            logger.info(f"[AUTOPLAY] Guild {guild_id}: Đã chọn từ search: '{chosen.title}' (score={chosen_score:.1f})")
             try:
-                results = await wavelink.Playable.search(f"ytsearch:{query}")
-                if not results:
-                    continue
-                
-                # Lọc kết quả
-                valid = filter_search_results(results[:10], recent_ids)
+                await player.play(chosen)
                 
-                if valid:
-                    # Áp dụng scoring
-                    scored_tracks = []
-                    for track in valid:
-                        score = self._calculate_similarity_score(source_info, track.title, track.author)
-                        scored_tracks.append((track, score))
-                    
-                    # Sắp xếp theo điểm giảm dần
-                    scored_tracks.sort(key=lambda x: x[1], reverse=True)
-                    
-                    # Chọn từ top 3 bài điểm cao nhất
-                    top_tracks = [t[0] for t in scored_tracks[:3]]
-                    chosen = random.choice(top_tracks) if top_tracks else valid[0]
-                    
-                    chosen_score = next((s for t, s in scored_tracks if t == chosen), 0)
-                    self._add_recent_id(guild_id, chosen.identifier)
-                    
-                    logger.info(f"[AUTOPLAY] Guild {guild_id}: Đã chọn từ search: '{chosen.title}' (score={chosen_score})")
-                    await player.play(chosen)
-                    
-                    if hasattr(player, 'text_channel') and player.text_channel:
-                        embed = discord.Embed(
-                            title="🔄 Autoplay",
-                            description=f"**{chosen.title}**",
-                            color=discord.Color.purple()
-                        )
-                        await player.text_channel.send(embed=embed)
-                    return
-                    
+                if hasattr(player, 'text_channel') and player.text_channel:
+                    self.outbox.source(player.text_channel, chosen, "🔄 Autoplay")
+                return
             except Exception as e:
-                logger.error(f"[AUTOPLAY] Guild {guild_id}: Search thất bại: {e}")
-                continue
+                logger.error(f"[AUTOPLAY] Guild {guild_id}: Lỗi phát bài từ search: {e}")
         
         # Không tìm được bài nào
         logger.warning(f"[AUTOPLAY] Guild {guild_id}: Không tìm được bài tiếp theo")
         if hasattr(player, 'text_channel') and player.text_channel:
-            await player.text_channel.send("🔇 Autoplay: Không tìm được bài phù hợp.")
+            self.outbox.notice(player.text_channel, "🔇 Autoplay: Không tìm được bài phù hợp.")
         
         self._start_idle_timer(player)
     
     async def _prefetch_and_notify(self, player: wavelink.Player, current_track: wavelink.Playable):
-        """Prefetch bài autoplay tiếp theo và thông báo cho user."""
+        """Đảm bảo buffer autoplay có bài và thông báo bài tiếp theo cho user."""
         if not player.guild:
             return
         
         guild_id = player.guild.id
-        video_id = current_track.identifier
+        buffer = self._get_buffer(guild_id)
         
-        logger.info(f"[PREFETCH] Guild {guild_id}: Đang prefetch bài tiếp theo...")
+        # Bài đã phát gần đây (gồm cả bài hiện tại, đã ghi lúc track start)
+        recent_ids = self.history.recent_ids(guild_id)
         
-        # Lấy danh sách bài đã phát gần đây
-        recent_ids = set(self._recent_ids.get(guild_id, []))
-        recent_ids.add(video_id)
+        # Bài hiện tại do user chọn (không đến từ buffer) → candidates cũ không còn liên quan
+        if not buffer.follows(current_track.identifier):
+            buffer.clear()
+        buffer.discard(recent_ids, lambda track: self._should_skip(guild_id, track))
+        
+        logger.info(f"[PREFETCH] Guild {guild_id}: Buffer còn {len(buffer)} bài")
         
         try:
-            # YouTube Radio Mix URL
-            mix_url = f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
-            results = await wavelink.Playable.search(mix_url)
+            if not buffer:
+                # Buffer trống: load Mix ngay (đang ở đầu bài nên không gây im lặng)
+                await self._refill_buffer(guild_id, current_track)
+            elif len(buffer) < AUTOPLAY_BUFFER_LOW_WATER:
+                self._schedule_refill(guild_id, current_track)
             
-            if results and len(results) > 1:
-                # Lọc bỏ bài hiện tại và các bài đã phát
-                non_mv_tracks = []  # Ưu tiên
-                mv_tracks = []      # Fallback
-                
-                for track in results[1:]:
-                    if track.identifier not in recent_ids:
-                        is_valid, _ = is_valid_track(
-                            title=track.title,
-                            duration_ms=track.length,
-                            is_stream=track.is_stream
-                        )
-                        if is_valid:
-                            if is_likely_mv(track.title):
-                                mv_tracks.append(track)
-                            else:
-                                non_mv_tracks.append(track)
+            if not buffer:
+                # Fallback: search với scoring
+                source = track_features(current_track)
                 
-                # Ưu tiên bài không phải MV
-                valid_tracks = non_mv_tracks if non_mv_tracks else mv_tracks
+                # Xác định ngôn ngữ để tạo query phù hợp
+                is_vietnamese = bool(source.languages & LANG_VI)
+                if is_vietnamese:
+                    query = f"{current_track.author} nhạc" if current_track.author else "nhạc việt hot"
+                else:
+                    query = f"{current_track.author} music" if current_track.author else f"{current_track.title} similar"
                 
-                if valid_tracks:
-                    # Chọn ngẫu nhiên từ 5 bài đầu
-                    chosen = random.choice(valid_tracks[:5])
-                    self._next_autoplay[guild_id] = chosen
-                    
-                    logger.info(f"[PREFETCH] Guild {guild_id}: Đã prefetch: '{chosen.title}'")
-                    
-                    # Thông báo bài tiếp theo
-                    if hasattr(player, 'text_channel') and player.text_channel:
-                        embed = discord.Embed(
-                            title="🎵 Bài cuối trong Queue",
-                            description=(
-                                f"Đang phát: **{current_track.title}**\n\n"
-                                f"⏭️ **Tiếp theo (Autoplay):** {chosen.title}"
-                            ),
-                            color=discord.Color.orange()
-                        )
-                        if chosen.artwork:
-                            embed.set_thumbnail(url=chosen.artwork)
-                        await player.text_channel.send(embed=embed)
-                    return
-            
-            # Fallback: search với scoring
-            source_info = self._detect_genre_language(
-                current_track.title, 
-                current_track.author if current_track else ""
-            )
-            
-            # Xác định ngôn ngữ để tạo query phù hợp
-            is_vietnamese = 'vi' in source_info.get('languages', set())
-            if is_vietnamese:
-                query = f"{current_track.author} nhạc" if current_track.author else "nhạc việt hot"
-            else:
-                query = f"{current_track.author} music" if current_track.author else f"{current_track.title} similar"
-            
-            results = await wavelink.Playable.search(f"ytsearch:{query}")
-            if results:
-                valid = filter_search_results(results[:10], recent_ids)
-                if valid:
-                    # Áp dụng scoring
-                    scored_tracks = []
-                    for track in valid:
-                        score = self._calculate_similarity_score(source_info, track.title, track.author)
-                        scored_tracks.append((track, score))
-                    
-                    scored_tracks.sort(key=lambda x: x[1], reverse=True)
-                    top_tracks = [t[0] for t in scored_tracks[:3]]
-                    chosen = random.choice(top_tracks) if top_tracks else valid[0]
-                    
-                    self._next_autoplay[guild_id] = chosen
-                    
-                    chosen_score = next((s for t, s in scored_tracks if t == chosen), 0)
-                    logger.info(f"[PREFETCH] Guild {guild_id}: Đã prefetch (search): '{chosen.title}' (score={chosen_score})")
-                    
-                    if hasattr(player, 'text_channel') and player.text_channel:
-                        embed = discord.Embed(
-                            title="🎵 Bài cuối trong Queue",
-                            description=(
-                                f"Đang phát: **{current_track.title}**\n\n"
-                                f"⏭️ **Tiếp theo (Autoplay):** {chosen.title}"
-                            ),
-                            color=discord.Color.orange()
-                        )
-                        await player.text_channel.send(embed=embed)
-                    return
+                scored_tracks = await self._race_fallback_queries(
+                    guild_id, [query], recent_ids, current_track, Priority.PREFETCH, SEARCH_PREFETCH_DEADLINE
+                )
+                if scored_tracks:
+                    # Bài được chọn (top 3) đứng đầu buffer, các bài còn lại xếp sau theo điểm
+                    chosen, chosen_score = random.choice(scored_tracks[:3])
+                    buffer.extend(current_track.identifier, [chosen] + [t for t, _ in scored_tracks])
                     
+                    logger.info(f"[PREFETCH] Guild {guild_id}: Đã prefetch (search): '{chosen.title}' (score={chosen_score:.1f})")
+        
         except Exception as e:
             logger.error(f"[PREFETCH] Guild {guild_id}: Lỗi: {e}")
         
-        # Không prefetch được
-        logger.warning(f"[PREFETCH] Guild {guild_id}: Không tìm được bài để prefetch")
-    
-    def _add_recent_id(self, guild_id: int, video_id: str):
-        """Thêm video_id vào danh sách đã phát để tránh lặp."""
-        if guild_id not in self._recent_ids:
-            self._recent_ids[guild_id] = []
+        chosen = buffer.peek()
+        if not chosen:
+            # Không prefetch được
+            logger.warning(f"[PREFETCH] Guild {guild_id}: Không tìm được bài để prefetch")
+            return
         
-        self._recent_ids[guild_id].append(video_id)
-        # Giữ tối đa 20 bài gần nhất
-        if len(self._recent_ids[guild_id]) > 20:
-            self._recent_ids[guild_id].pop(0)
+        # Thông báo bài tiếp theo (gộp vào now playing card của bài hiện tại)
+        if hasattr(player, 'text_channel') and player.text_channel:
+            self.outbox.next_up(player.text_channel, current_track, chosen)
     
-    def _is_similar_title(self, title1: str, title2: str) -> bool:
+    async def _race_fallback_queries(
+        self,
+        guild_id: int,
+        queries: list[str],
+        recent_ids: set[str],
+        seed: wavelink.Playable,
+        priority: Priority = Priority.AUTOPLAY,
+        deadline: float | None = None,
+    ) -> list[tuple[wavelink.Playable, float]]:
         """
-        Kiểm tra 2 tên bài có giống nhau/quá tương tự không.
-        Trả về True nếu giống → cần bỏ qua.
+        Chạy các query fallback song song (tối đa AUTOPLAY_FALLBACK_FANOUT cùng lúc).
+        Ngay khi có kết quả hợp lệ thì hủy các query còn lại.
+        Trả về candidates đã chấm điểm, điểm cao nhất trước.
         """
-        import re
-        
-        def clean_title(title: str) -> str:
-            """Loại bỏ ký tự đặc biệt và chuẩn hóa."""
-            # Loại bỏ phần trong ngoặc và dấu đặc biệt
-            title = re.sub(r'\([^)]*\)', '', title)  # (official mv), (lyrics)
-            title = re.sub(r'\[[^\]]*\]', '', title)  # [official video]
-            title = re.sub(r'[^\w\s]', '', title)  # Dấu đặc biệt
-            title = title.lower().strip()
-            # Loại bỏ các từ phổ biến (bao gồm remix, cover, etc)
-            common_words = [
-                'official', 'mv', 'music', 'video', 'audio', 'lyric', 'lyrics', 
-                'hd', '4k', 'visualizer', 'vietsub', 'engsub',
-                'remix', 'cover', 'karaoke', 'instrumental', 'acoustic',
-                'live', 'version', 'ver', 'edit', 'extended', 'radio',
-                'nightcore', 'slowed', 'reverb', 'bass', 'boosted',
-                'pt', 'dj', 'ft', 'feat', 'prod'
+        semaphore = asyncio.Semaphore(AUTOPLAY_FALLBACK_FANOUT)
+        
+        async def run_query(query: str) -> list[wavelink.Playable]:
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    results = await self.resolver.search(f"ytsearch:{query}", priority, guild_id, deadline)
+                except asyncio.CancelledError:
+                    logger.info(f"[FALLBACK] Guild {guild_id}: '{query}' bị hủy sau {(time.monotonic() - started) * 1000:.0f}ms")
+                    raise
+                logger.info(f"[FALLBACK] Guild {guild_id}: '{query}' xong sau {(time.monotonic() - started) * 1000:.0f}ms")
+            
+            if not results:
+                return []
+            return [
+                track for track in filter_search_results(results[:10], recent_ids)
+                if not self._should_skip(guild_id, track)
             ]
-            words = title.split()
-            words = [w for w in words if w not in common_words]
-            return ' '.join(words)
         
-        clean1 = clean_title(title1)
-        clean2 = clean_title(title2)
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + AUTOPLAY_FALLBACK_DEADLINE
+        pending = {asyncio.create_task(run_query(query)) for query in queries}
+        candidates: dict[str, wavelink.Playable] = {}
         
-        # Nếu một trong hai rỗng sau khi clean, không xét
-        if not clean1 or not clean2:
+        try:
+            while pending and not candidates:
+                timeout = expires - loop.time()
+                if timeout <= 0:
+                    logger.warning(f"[FALLBACK] Guild {guild_id}: Hết hạn {AUTOPLAY_FALLBACK_DEADLINE}s, hủy {len(pending)} query")
+                    break
+                
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue  # Request bị hủy từ bên ngoài (task.exception() sẽ raise CancelledError)
+                    if isinstance(task.exception(), SearchExpired):
+                        logger.info(f"[FALLBACK] Guild {guild_id}: Bỏ query (chờ quá deadline)")
+                        continue
+                    if task.exception():
+                        logger.error(f"[FALLBACK] Guild {guild_id}: Search thất bại: {task.exception()}")
+                        continue
+                    for track in task.result():
+                        candidates.setdefault(track.identifier, track)
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        # Kết quả search cũng là bài liên quan của seed (nhưng yếu hơn Mix)
+        self.graph.add_neighbors(seed.identifier, list(candidates.values()), GRAPH_SEARCH_WEIGHT)
+        
+        # Chấm điểm cả batch, điểm cao nhất trước
+        return rank_candidates(
+            seed,
+            list(candidates.values()),
+            profile=self._get_taste_profile(guild_id),
+            channels=self._get_channel_window(guild_id),
+        )
+    
+    def _actor(self, guild_id: int) -> GuildActor:
+        """Mailbox mutation player / queue của guild."""
+        state = self.guilds.get(guild_id)
+        if state.actor is None:
+            state.actor = GuildActor(guild_id, SKIP_COALESCE_WINDOW)
+        return state.actor
+    
+    async def _enqueue(self, player: wavelink.Player, tracks: list[wavelink.Playable]) -> bool:
+        """Đang phát → thêm vào queue; không thì phát bài đầu ngay. True nếu đã bắt đầu phát."""
+        if player.playing:
+            player.queue.put(tracks)
             return False
         
-        # Nếu giống hệt
-        if clean1 == clean2:
-            return True
+        player.queue.put(tracks[1:])
+        await player.play(tracks[0])
+        return True
+    
+    def _get_buffer(self, guild_id: int) -> CandidateBuffer:
+        """Lấy (hoặc tạo) buffer autoplay của guild."""
+        state = self.guilds.get(guild_id)
+        if state.buffer is None:
+            state.buffer = CandidateBuffer(AUTOPLAY_BUFFER_SIZE)
+        return state.buffer
+    
+    def _refresh_prefetch(self, player: wavelink.Player):
+        """Timer prefetch: bài cuối sắp hết mà buffer thấp → refill trước khi autoplay cần tới."""
+        if not player.guild or not player.connected or not player.current or player.queue:
+            return
+        
+        guild_id = player.guild.id
+        if self.get_autoplay(guild_id) and len(self._get_buffer(guild_id)) < AUTOPLAY_BUFFER_LOW_WATER:
+            logger.info(f"[PREFETCH] Guild {guild_id}: Bài sắp hết, refill buffer")
+            self._schedule_refill(guild_id, player.current)
+    
+    def _schedule_refill(self, guild_id: int, seed: wavelink.Playable):
+        """Refill buffer ở background, tối đa 1 task mỗi guild."""
+        state = self.guilds.get(guild_id)
+        if state.refill_task and not state.refill_task.done():
+            return
+        state.refill_task = asyncio.create_task(self._refill_buffer(guild_id, seed))
+    
+    async def _refill_buffer(self, guild_id: int, seed: wavelink.Playable) -> int:
+        """Lấy bài liên quan của seed (graph local hoặc YouTube Mix) và thêm các candidates hợp lệ vào buffer."""
+        buffer = self._get_buffer(guild_id)
+        epoch = buffer.epoch
+        try:
+            ranked, origin = await self._related_candidates(
+                guild_id, seed, self.history.recent_ids(guild_id), Priority.PREFETCH, SEARCH_PREFETCH_DEADLINE
+            )
+        except SearchExpired:
+            logger.info(f"[BUFFER] Guild {guild_id}: Bỏ prefetch Mix (chờ slot quá {SEARCH_PREFETCH_DEADLINE:.0f}s)")
+            return 0
+        except Exception as e:
+            logger.warning(f"[BUFFER] Guild {guild_id}: Load Mix thất bại: {e}")
+            return 0
         
-        # Nếu một cái chứa cái kia (tên ngắn hơn nằm trong tên dài)
-        if len(clean1) > 3 and len(clean2) > 3:
-            if clean1 in clean2 or clean2 in clean1:
-                return True
+        if not ranked:
+            return 0
         
-        # Tính độ giống nhau dựa trên từ chung
-        words1 = set(clean1.split())
-        words2 = set(clean2.split())
-        if len(words1) >= 2 and len(words2) >= 2:
-            common = words1 & words2
-            similarity = len(common) / min(len(words1), len(words2))
-            if similarity >= 0.7:  # 70% từ giống nhau → coi như trùng
-                return True
+        # Trong lúc chờ Lavalink, user đã chọn bài khác (buffer bị clear) → chuỗi của seed này đã bỏ
+        if buffer.epoch != epoch or self._get_buffer(guild_id) is not buffer:
+            logger.info(f"[BUFFER] Guild {guild_id}: Bỏ kết quả refill của '{seed.title}' (không còn theo chuỗi này)")
+            return 0
         
-        return False
+        added = buffer.extend(seed.identifier, [track for track, _ in ranked])
+        logger.info(
+            f"[BUFFER] Guild {guild_id}: +{added} bài từ {RELATED_ORIGINS[origin]} của '{seed.title}' (tổng {len(buffer)})"
+        )
+        return added
     
-    def _detect_genre_language(self, title: str, author: str = "") -> dict:
+    async def _related_candidates(
+        self,
+        guild_id: int,
+        seed: wavelink.Playable,
+        recent_ids: set[str],
+        priority: Priority = Priority.AUTOPLAY,
+        deadline: float | None = None,
+    ) -> tuple[list[tuple[wavelink.Playable, float]], str]:
         """
-        Phát hiện thể loại và ngôn ngữ từ title/author.
-        Trả về dict với 'genres' (set) và 'languages' (set).
+        Candidates liên quan tới seed, đã lọc + xếp hạng, kèm nguồn ("graph" / "mix").
+        Đi graph local trước (không tốn REST call), chỉ load YouTube Mix khi
+        vùng lân cận của seed đã hết bài hợp lệ hoặc đã cũ.
         """
-        text = f"{title} {author}".lower()
-        
-        result = {
-            'genres': set(),
-            'languages': set()
-        }
-        
-        # Phát hiện thể loại
-        genre_keywords = {
-            'pop': ['pop', 'ballad', 'acoustic'],
-            'rock': ['rock', 'metal', 'punk', 'alternative'],
-            'hiphop': ['rap', 'hip hop', 'hiphop', 'trap', 'drill'],
-            'edm': ['edm', 'remix', 'electronic', 'house', 'techno', 'trance', 'dubstep', 'dj'],
-            'rnb': ['r&b', 'rnb', 'soul', 'funk'],
-            'lofi': ['lofi', 'lo-fi', 'chill', 'study', 'relax'],
-            'classical': ['classical', 'piano', 'orchestra', 'symphony'],
-            'jazz': ['jazz', 'blues', 'swing'],
-            'country': ['country', 'folk', 'acoustic'],
-            'kpop': ['kpop', 'k-pop', 'bts', 'blackpink', 'twice', 'exo', 'nct'],
-            'vpop': ['vpop', 'v-pop'],
-            'anime': ['anime', 'ost', 'opening', 'ending', 'naruto', 'one piece'],
-        }
-        
-        for genre, keywords in genre_keywords.items():
-            for kw in keywords:
-                if kw in text:
-                    result['genres'].add(genre)
-                    break
-        
-        # Phát hiện ngôn ngữ (dựa trên ký tự và keywords)
-        # Tiếng Việt
-        vietnamese_chars = 'àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ'
-        vietnamese_keywords = ['việt', 'viet', 'nha', 'nhac', 'bai', 'hat', 'vietsub']
-        if any(c in text for c in vietnamese_chars) or any(kw in text for kw in vietnamese_keywords):
-            result['languages'].add('vi')
-        
-        # Tiếng Hàn
-        korean_keywords = ['한국', 'korea', 'korean', 'kpop', 'k-pop', 'hangul']
-        if any(kw in text for kw in korean_keywords) or any('\uac00' <= c <= '\ud7a3' for c in text):
-            result['languages'].add('ko')
-        
-        # Tiếng Nhật
-        japanese_keywords = ['日本', 'japan', 'japanese', 'anime', 'jpop', 'j-pop']
-        if any(kw in text for kw in japanese_keywords) or any('\u3040' <= c <= '\u30ff' for c in text):
-            result['languages'].add('ja')
-        
-        # Tiếng Anh (mặc định nếu có chữ Latin và không có ngôn ngữ khác)
-        english_keywords = ['english', 'eng', 'lyrics']
-        if any(kw in text for kw in english_keywords) or (not result['languages'] and any(c.isalpha() for c in text)):
-            result['languages'].add('en')
-        
-        return result
+        local = self.graph.walk(seed.identifier, recent_ids, GRAPH_WALK_DEPTH)
+        if local:
+            relatedness = {track.identifier: score for track, score in local}
+            ranked = self._rank_candidates(guild_id, [track for track, _ in local], recent_ids, seed, relatedness)
+            if ranked:
+                logger.info(f"[GRAPH] Guild {guild_id}: {len(ranked)} candidates local cho '{seed.title}'")
+                return ranked, "graph"
+        
+        logger.info(f"[AUTOPLAY] Guild {guild_id}: Đang load YouTube Mix...")
+        results = await self.resolver.search(self._mix_url(seed.identifier), priority, guild_id, deadline)
+        if not results or len(results) < 2:
+            return [], "mix"
+        
+        # Bỏ bài đầu (chính là seed), phần còn lại vào graph rồi lọc + xếp hạng
+        self.graph.add_neighbors(seed.identifier, results[1:])
+        return self._rank_candidates(guild_id, results[1:], recent_ids, seed), "mix"
     
-    def _calculate_similarity_score(self, source_info: dict, track_title: str, track_author: str = "") -> int:
+    def _rank_candidates(
+        self,
+        guild_id: int,
+        tracks: list,
+        recent_ids: set[str],
+        seed: wavelink.Playable,
+        relatedness: dict[str, float] | None = None,
+    ) -> list[tuple[wavelink.Playable, float]]:
         """
-        Tính điểm tương đồng giữa bài nguồn và bài candidate.
-        Điểm cao hơn = ưu tiên hơn.
+        Lọc và xếp hạng candidates từ Mix / graph local (`relatedness`: điểm walk theo track id).
+        Bài không phải MV đứng trước bài MV, trong mỗi nhóm điểm cao đứng trước.
         """
-        target_info = self._detect_genre_language(track_title, track_author)
-        score = 0
-        
-        # Cùng thể loại: +3 điểm mỗi thể loại chung
-        common_genres = source_info['genres'] & target_info['genres']
-        score += len(common_genres) * 3
+        # Lọc bỏ các bài đã phát + bài không hợp lệ (shorts, live, quá dài)
+        non_mv_tracks = []  # Ưu tiên
+        mv_tracks = []      # Fallback
+        
+        candidates = [
+            track for track in tracks
+            if track.identifier not in recent_ids and not self._should_skip(guild_id, track)
+        ]
+        for track, (is_valid, is_mv) in zip(candidates, validate_tracks(candidates)):
+            if is_valid:
+                # Phân loại: MV hay không
+                if is_mv:
+                    mv_tracks.append(track)
+                else:
+                    non_mv_tracks.append(track)
+        
+        # Chấm điểm toàn bộ Mix (mỗi nhóm một batch), chỉ giữ đủ cho buffer + bài được chọn
+        keep = AUTOPLAY_BUFFER_SIZE + 1
+        profile = self._get_taste_profile(guild_id)
+        channels = self._get_channel_window(guild_id)
+        walk_scores = lambda group: [relatedness[track.identifier] for track in group] if relatedness else None
+        ranked = rank_candidates(
+            seed, non_mv_tracks, keep, profile=profile, channels=channels, relatedness=walk_scores(non_mv_tracks)
+        )
+        ranked += rank_candidates(
+            seed, mv_tracks, keep - len(ranked), profile=profile, channels=channels, relatedness=walk_scores(mv_tracks)
+        )
         
-        # Cùng ngôn ngữ: +2 điểm mỗi ngôn ngữ chung
-        common_languages = source_info['languages'] & target_info['languages']
-        score += len(common_languages) * 2
+        # Trộn top 3 để vẫn có sự đa dạng (chỉ trong nhóm ưu tiên)
+        top_count = min(3, len(non_mv_tracks) or len(mv_tracks))
+        top = ranked[:top_count]
+        random.shuffle(top)
+        ranked[:top_count] = top
         
-        return score
+        return ranked
+    
+    def _get_taste_profile(self, guild_id: int) -> TasteProfile:
+        """Lấy (hoặc dựng lại từ lịch sử trên disk) taste profile của guild."""
+        state = self.guilds.get(guild_id)
+        if state.taste is None:
+            state.taste = TasteProfile(HISTORY_LIMIT, TASTE_DECAY)
+            for entry in reversed(self.history.last_tracks(guild_id, HISTORY_LIMIT)):
+                state.taste.add(extract_features(entry.title, entry.author))
+        return state.taste
+    
+    def _get_title_index(self, guild_id: int) -> TitleIndex:
+        """Lấy (hoặc dựng lại từ lịch sử trên disk) index title đã phát của guild."""
+        state = self.guilds.get(guild_id)
+        if state.titles is None:
+            state.titles = TitleIndex(ANTI_REPEAT_LIMIT, DUPLICATE_TITLE_THRESHOLD)
+            for entry in reversed(self.history.last_tracks(guild_id, ANTI_REPEAT_LIMIT)):
+                state.titles.add(title_tokens(entry.title))
+        return state.titles
+    
+    def _is_recent_duplicate(self, guild_id: int, track: wavelink.Playable) -> bool:
+        """Track có phải bản khác (lyrics/remix/re-upload) của bài vừa phát gần đây không."""
+        return self._get_title_index(guild_id).is_duplicate(track_features(track).tokens)
+    
+    def _get_channel_window(self, guild_id: int) -> ChannelWindow:
+        """Lấy (hoặc dựng lại từ lịch sử trên disk) bộ đếm kênh của guild."""
+        state = self.guilds.get(guild_id)
+        if state.channels is None:
+            state.channels = ChannelWindow(CHANNEL_WINDOW, MAX_SAME_CHANNEL)
+            for entry in reversed(self.history.last_tracks(guild_id, CHANNEL_WINDOW)):
+                state.channels.add(entry.author)
+        return state.channels
+    
+    def _should_skip(self, guild_id: int, track: wavelink.Playable) -> bool:
+        """Bỏ qua candidate: bản khác của bài vừa phát, hoặc kênh đã đạt MAX_SAME_CHANNEL."""
+        return self._is_recent_duplicate(guild_id, track) or self._get_channel_window(guild_id).is_capped(track.author)
+    
+    def _mix_url(self, video_id: str) -> str:
+        """YouTube Radio Mix URL của một video."""
+        return f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
     
     def _start_idle_timer(self, player: wavelink.Player):
-        """Start idle disconnect timer."""
+        """Start idle disconnect timer (đặt lại nếu đang chạy)."""
         if not player.guild:
             return
         
-        guild_id = player.guild.id
-        
-        # Cancel existing timer
-        if guild_id in self._idle_tasks:
-            self._idle_tasks[guild_id].cancel()
+        # Hết bài, không còn gì phát: restart lúc này không được phát lại bài vừa xong
+        self._journal_player(player, current=None)
         
         async def idle_disconnect():
-            await asyncio.sleep(IDLE_TIMEOUT_SECONDS)
             if player.connected and not player.playing:
+                self._end_session(player)
                 await player.disconnect()
                 if hasattr(player, 'text_channel') and player.text_channel:
-                    await player.text_channel.send("👋 Rời voice do không hoạt động.")
+                    self.outbox.notice(player.text_channel, "👋 Rời voice do không hoạt động.", final=True)
         
-        self._idle_tasks[guild_id] = asyncio.create_task(idle_disconnect())
+        self.timers.arm((player.guild.id, "idle"), IDLE_TIMEOUT_SECONDS, idle_disconnect)
+    
+    def _cancel_timers(self, guild_id: int):
+        for kind in ("idle", "alone", "prefetch"):
+            self.timers.cancel((guild_id, kind))
+    
+    def _render_card(self, state: CardState) -> tuple[str | None, discord.Embed | None]:
+        """Nội dung now playing card của một channel (content, embed)."""
+        if state.final or state.track is None:
+            return state.notice, None
+        
+        track = state.track
+        embed = self._create_now_playing_embed(track)
+        # Nguồn / bài tiếp theo chỉ hiện nếu thuộc về bài đang phát
+        if state.source and state.source[0] == track.identifier:
+            embed.title = state.source[1]
+            embed.color = discord.Color.purple()
+        if state.next_up and state.next_up[0] == track.identifier:
+            next_track = state.next_up[1]
+            embed.add_field(name="⏭️ Tiếp theo (Autoplay)", value=next_track.title, inline=False)
+        return state.notice, embed
     
     def _create_now_playing_embed(self, track: wavelink.Playable) -> discord.Embed:
         """Create embed for now playing message."""
@@ -627,6 +797,47 @@ class Music(commands.Cog):
             return f"{hours}:{minutes:02d}:{seconds:02d}"
         return f"{minutes}:{seconds:02d}"
     
+    def _queue_page_embed(self, player: MusicPlayer, page: int) -> tuple[discord.Embed, int]:
+        """
+        Embed của một trang queue và tổng số trang.
+        Page body lấy từ cache của queue, chỉ render lại khi queue thay đổi ở trang đó
+        hoặc trước đó; tổng số bài/thời lượng là running totals nên không phải duyệt queue.
+        """
+        queue = player.queue
+        queue_size = len(queue)
+        page_count = queue.pages.page_count(queue_size)
+        page = queue.pages.clamp(page, queue_size)
+        
+        embed = discord.Embed(title="📜 Queue", color=discord.Color.blue())
+        
+        # Current track
+        if player.current:
+            embed.add_field(
+                name="🎵 Đang phát",
+                value=f"**{player.current.title}** - {self._format_duration(player.current.length)}",
+                inline=False
+            )
+        
+        # Queue items
+        if queue_size:
+            body = queue.pages.get(page)
+            if body is None:
+                start = (page - 1) * queue.pages.page_size
+                body = "\n".join(
+                    f"`{i}.` {track.title} - {self._format_duration(track.length)}"
+                    for i, track in enumerate(queue[start:start + queue.pages.page_size], start=start + 1)
+                )
+                queue.pages.put(page, body)
+            
+            footer = f"Trang {page}/{page_count} | Tổng: {queue_size} bài | {self._format_duration(queue.total_length)}"
+            if len(queue.sources) > 1:
+                footer += " | " + ", ".join(f"{source}: {count}" for source, count in queue.sources.most_common())
+            
+            embed.add_field(name="Tiếp theo", value=body or "Trống", inline=False)
+            embed.set_footer(text=footer)
+        
+        return embed, page_count
+    
     def _create_progress_bar(self, current_ms: int, total_ms: int, length: int = 15) -> str:
         """Create text progress bar."""
         if total_ms == 0:
@@ -638,6 +849,181 @@ class Music(commands.Cog):
         
         return "█" * filled + "░" * empty
     
+    # ==================== SESSION JOURNAL ====================
+    
+    def _load_sessions(self) -> dict[int, dict]:
+        """Đọc journal lúc khởi động và dựng lại tracks từ raw_data (không gọi Lavalink)."""
+        sessions = {}
+        owns_guild = getattr(self.bot, "owns_guild", lambda guild_id: True)
+        for guild_id, state in self.journal.load_all().items():
+            # Chạy cluster: journal dùng chung, mỗi process chỉ restore guild thuộc shard của nó
+            if not owns_guild(guild_id):
+                continue
+            if not state.get("voice_channel"):
+                self.journal.forget(guild_id)
+                continue
+            state["queue"] = [wavelink.Playable(data) for data in state.get("queue", [])]
+            if state.get("current"):
+                state["current"] = wavelink.Playable(state["current"])
+            sessions[guild_id] = state
+        
+        if sessions:
+            logger.info(f"[RESTORE] Loaded {len(sessions)} session(s) from journal")
+        return sessions
+    
+    def _session_state(self, player: wavelink.Player) -> dict:
+        """Snapshot đầy đủ của một guild (dùng khi compact journal)."""
+        guild_id = player.guild.id
+        text_channel = getattr(player, 'text_channel', None)
+        return {
+            "voice_channel": player.channel.id if player.channel else None,
+            "text_channel": text_channel.id if text_channel else None,
+            "queue": [track.raw_data for track in player.queue],
+            "current": player.current.raw_data if player.current else None,
+            "loop": self.get_loop_mode(guild_id),
+            "autoplay": self.get_autoplay(guild_id),
+            "volume": player.volume,
+            "paused": player.paused,
+            "node": player.node.identifier,
+        }
+    
+    def _start_journal(self, player: wavelink.Player):
+        """Bắt đầu ghi journal cho player (snapshot hiện tại + mọi thay đổi queue sau đó)."""
+        if not player.guild or not isinstance(player.queue, IndexedQueue):
+            return
+        
+        guild_id = player.guild.id
+        player.queue.journal = lambda op: self._journal_queue(player, op)
+        self.journal.compact(guild_id, self._session_state(player))
+        self.journal.save_position(guild_id, player.position)
+    
+    def _journal_queue(self, player: wavelink.Player, op: list):
+        guild_id = player.guild.id
+        self.journal.append(guild_id, op)
+        if self.journal.needs_compaction(guild_id):
+            self.journal.compact(guild_id, self._session_state(player))
+    
+    def _journal_player(self, player: wavelink.Player, **fields):
+        """Ghi thay đổi state của player nếu guild đang được journal."""
+        if player.guild and getattr(player.queue, 'journal', None) is not None:
+            self.journal.update_player(player.guild.id, **fields)
+            if self.journal.needs_compaction(player.guild.id):
+                self.journal.compact(player.guild.id, self._session_state(player))
+    
+    def _flush_sessions(self):
+        """Ghi snapshot mới nhất (kèm vị trí) của mọi player đang được journal."""
+        for player in self.bot.voice_clients:
+            if isinstance(player, wavelink.Player) and getattr(player.queue, 'journal', None) is not None:
+                self.journal.compact(player.guild.id, self._session_state(player))
+                self.journal.save_position(player.guild.id, player.position)
+    
+    def _end_session(self, player: wavelink.Player):
+        """Phiên nghe kết thúc (stop / rời voice) → ngừng ghi và xóa khỏi journal."""
+        if not player.guild:
+            return
+        
+        if isinstance(player.queue, IndexedQueue):
+            player.queue.journal = None
+        self.journal.forget(player.guild.id)
+        self._cancel_timers(player.guild.id)
+        # Buffer / task nền của phiên bị bỏ, setting giữ tới khi state bị evict
+        self.guilds.disconnected(player.guild.id)
+    
+    @commands.Cog.listener()
+    async def on_wavelink_player_update(self, payload: wavelink.PlayerUpdateEventPayload):
+        """Lưu vị trí đang phát (Lavalink gửi vài giây một lần) để resume đúng chỗ."""
+        player = payload.player
+        if not player or not player.guild or not player.current:
+            return
+        
+        if getattr(player.queue, 'journal', None) is not None:
+            self.journal.save_position(player.guild.id, payload.position)
+            # Ghi theo lô: một transaction cho vị trí của mọi guild mỗi JOURNAL_POSITION_INTERVAL
+            if ("journal", "positions") not in self.timers:
+                self.timers.arm(("journal", "positions"), JOURNAL_POSITION_INTERVAL, self.journal.flush_positions)
+    
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Vào lại voice và phát tiếp các phiên đọc từ journal lúc khởi động."""
+        pending, self._pending_restore = self._pending_restore, {}
+        if not pending:
+            return
+        
+        results = await asyncio.gather(
+            *(self._restore_session(guild_id, state) for guild_id, state in pending.items()),
+            return_exceptions=True,
+        )
+        for guild_id, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.warning(f"[RESTORE] Guild {guild_id}: Không thể khôi phục: {result}")
+                self.journal.forget(guild_id)
+    
+    async def _restore_session(self, guild_id: int, state: dict):
+        guild = self.bot.get_guild(guild_id)
+        channel = guild.get_channel(state["voice_channel"]) if guild else None
+        
+        # Không restore nếu channel không còn, không còn ai nghe, hoặc không có gì để phát
+        queue: list[wavelink.Playable] = state["queue"]
+        current: wavelink.Playable | None = state.get("current") or (queue.pop(0) if queue else None)
+        if (
+            not isinstance(channel, discord.VoiceChannel | discord.StageChannel)
+            or not any(not member.bot for member in channel.members)
+            or guild.voice_client
+            or current is None
+        ):
+            logger.info(f"[RESTORE] Guild {guild_id}: Bỏ qua phiên đã lưu")
+            self.journal.forget(guild_id)
+            return
+        
+        # Player vẫn nằm trên node cũ: nếu session được resume thì nhạc chưa hề dừng
+        if state.get("node") and isinstance(self.resolver.nodes, NodeBalancer):
+            self.resolver.nodes.pinned[guild_id] = state["node"]
+        player = await channel.connect(cls=MusicPlayer)
+        player.text_channel = guild.get_channel(state.get("text_channel"))  # type: ignore
+        player.autoplay = wavelink.AutoPlayMode.disabled
+        guild_state = self.guilds.joined(guild_id)
+        guild_state.loop = state.get("loop", "off")
+        guild_state.autoplay = state.get("autoplay", True)
+        
+        player.queue.put(queue)
+        
+        if await self._resume_lavalink_player(player):
+            # Bài được adopt không phát event track start
+            await self._track_started(player, player.current, player.position)
+            self._start_journal(player)
+            logger.info(
+                f"[RESUME] Guild {guild_id}: '{player.current.title}' vẫn đang phát trên {player.node.identifier} "
+                f"({self._format_duration(player.position)}), {len(queue)} bài trong queue"
+            )
+            return
+        
+        position = state.get("position", 0) if state.get("current") else 0
+        await player.play(
+            current,
+            start=position,
+            volume=state.get("volume", DEFAULT_VOLUME),
+            paused=state.get("paused", False),
+        )
+        self._start_journal(player)
+        
+        logger.info(
+            f"[RESTORE] Guild {guild_id}: '{current.title}' tại {self._format_duration(position)}, "
+            f"{len(queue)} bài trong queue"
+        )
+    
+    async def _resume_lavalink_player(self, player: MusicPlayer) -> bool:
+        """Gắn lại vào player Lavalink của process trước nếu nó còn bài đang phát."""
+        try:
+            info = await player.node.fetch_player_info(player.guild.id)
+        except (wavelink.LavalinkException, wavelink.NodeException):
+            return False
+        
+        if info is None or info.track is None:
+            return False
+        
+        player.adopt(info)
+        return True
+    
     # ==================== COMMANDS ====================
     
     @commands.command(name="play", aliases=["p"])
@@ -654,11 +1040,13 @@ class Music(commands.Cog):
         
         if not player:
             try:
-                player = await voice_channel.connect(cls=wavelink.Player)
+                player = await voice_channel.connect(cls=MusicPlayer)
+                self.guilds.joined(ctx.guild.id)
                 player.text_channel = ctx.channel  # type: ignore
                 # Disable Wavelink's built-in autoplay to use our custom logic
                 player.autoplay = wavelink.AutoPlayMode.disabled
                 await player.set_volume(DEFAULT_VOLUME)
+                self._start_journal(player)
             except Exception as e:
                 return await ctx.send(f"❌ Không thể kết nối voice: {e}")
         
@@ -666,71 +1054,52 @@ class Music(commands.Cog):
         try:
             # Check if it's a URL or search query
             if query.startswith(("http://", "https://")):
-                tracks = await wavelink.Playable.search(query)
+                tracks = await self.resolver.search(query, Priority.INTERACTIVE, ctx.guild.id)
             else:
-                tracks = await wavelink.Playable.search(f"ytsearch:{query}")
+                tracks = await self.resolver.search(f"ytsearch:{query}", Priority.INTERACTIVE, ctx.guild.id)
             
             if not tracks:
                 return await ctx.send("❌ Không tìm thấy kết quả. Thử từ khóa khác?")
             
             # Xử lý playlist (nhiều tracks) vs single track
             if isinstance(tracks, wavelink.Playlist):
-                # Đây là playlist - load toàn bộ
+                # Đây là playlist - phát ngay bài hợp lệ đầu tiên, phần còn lại xử lý dần ở background
                 playlist_name = tracks.name or "Unknown Playlist"
                 playlist_tracks = list(tracks.tracks)
                 
                 if not playlist_tracks:
                     return await ctx.send("❌ Playlist trống hoặc không thể load.")
                 
-                # Validate và filter tracks
-                valid_tracks = []
-                for track in playlist_tracks:
-                    is_valid, _ = is_valid_track(
-                        title=track.title,
-                        duration_ms=track.length,
-                        is_stream=track.is_stream
-                    )
-                    if is_valid:
-                        valid_tracks.append(track)
+                batches = self._playlist_batches(playlist_tracks)
+                first_batch: list[wavelink.Playable] = []
+                processed = 0
+                async for valid, seen in batches:
+                    processed += seen
+                    if valid:
+                        first_batch = valid
+                        break
                 
-                if not valid_tracks:
+                if not first_batch:
                     return await ctx.send("❌ Không có bài nào trong playlist phù hợp (có thể quá dài hoặc bị chặn).")
                 
-                # Tính tổng thời gian
-                total_duration = sum(track.length for track in valid_tracks)
-                total_duration_str = self._format_duration(total_duration)
+                # Đang phát thì thêm vào queue, không thì phát bài đầu (qua mailbox của guild)
+                future, _ = self._actor(ctx.guild.id).submit(
+                    "play", lambda _: self._enqueue(player, first_batch), supersedes=True
+                )
+                started = await future
+                if started is None:
+                    return await batches.aclose()
                 
-                # Add tracks to queue
-                if player.playing:
-                    for track in valid_tracks:
-                        player.queue.put(track)
-                    
-                    embed = discord.Embed(
-                        title="📋 Đã thêm Playlist vào queue",
-                        description=f"**{playlist_name}**",
-                        color=discord.Color.blue()
-                    )
-                    embed.add_field(name="Số bài", value=f"{len(valid_tracks)} bài", inline=True)
-                    embed.add_field(name="Tổng thời gian", value=total_duration_str, inline=True)
-                    embed.add_field(name="Bỏ qua", value=f"{len(playlist_tracks) - len(valid_tracks)} bài", inline=True)
-                    await ctx.send(embed=embed)
+                progress = PlaylistProgress(playlist_name, len(playlist_tracks), playing=started)
+                progress.add(first_batch, processed)
+                
+                message = await ctx.send(embed=self._playlist_embed(progress))
+                
+                # Các batch còn lại: validate + thêm vào queue ở background, cập nhật cùng một message
+                if progress.done:
+                    await batches.aclose()
                 else:
-                    # Play first track, add rest to queue
-                    first_track = valid_tracks[0]
-                    for track in valid_tracks[1:]:
-                        player.queue.put(track)
-                    
-                    await player.play(first_track)
-                    
-                    if len(valid_tracks) > 1:
-                        embed = discord.Embed(
-                            title="📋 Đang phát Playlist",
-                            description=f"**{playlist_name}**",
-                            color=discord.Color.green()
-                        )
-                        embed.add_field(name="Số bài", value=f"{len(valid_tracks)} bài", inline=True)
-                        embed.add_field(name="Tổng thời gian", value=total_duration_str, inline=True)
-                        await ctx.send(embed=embed)
+                    self._start_playlist_ingest(player, batches, progress, message)
             
             else:
                 # Single track (hoặc list with 1 track)
@@ -747,13 +1116,10 @@ class Music(commands.Cog):
                     return await ctx.send(reason)
                 
                 # Add to queue or play
-                if player.playing:
-                    # Xóa prefetch autoplay nếu có (vì user đã add bài mới)
-                    if ctx.guild and ctx.guild.id in self._next_autoplay:
-                        del self._next_autoplay[ctx.guild.id]
-                        logger.info(f"[PLAY] Guild {ctx.guild.id}: Xóa prefetch autoplay vì user add bài mới")
-                    
-                    player.queue.put(track)
+                future, _ = self._actor(ctx.guild.id).submit(
+                    "play", lambda _: self._enqueue(player, [track]), supersedes=True
+                )
+                if await future is False:
                     position = len(player.queue)
                     embed = discord.Embed(
                         title="📝 Đã thêm vào queue",
@@ -763,12 +1129,88 @@ class Music(commands.Cog):
                     embed.add_field(name="Vị trí", value=f"#{position}", inline=True)
                     embed.add_field(name="Thời lượng", value=self._format_duration(track.length), inline=True)
                     await ctx.send(embed=embed)
-                else:
-                    await player.play(track)
             
         except Exception as e:
             await ctx.send(f"❌ Lỗi khi tìm bài: {e}")
     
+    async def _playlist_batches(self, tracks: list[wavelink.Playable]) -> AsyncIterator[tuple[list[wavelink.Playable], int]]:
+        """Validate playlist theo từng batch, nhường event loop giữa các batch. Yield (bài hợp lệ, số bài đã xét)."""
+        for start in range(0, len(tracks), PLAYLIST_BATCH_SIZE):
+            batch = tracks[start:start + PLAYLIST_BATCH_SIZE]
+            yield [track for track, (is_valid, _) in zip(batch, validate_tracks(batch)) if is_valid], len(batch)
+            await asyncio.sleep(0)
+    
+    def _start_playlist_ingest(
+        self,
+        player: wavelink.Player,
+        batches: AsyncIterator[tuple[list[wavelink.Playable], int]],
+        progress: PlaylistProgress,
+        message: discord.Message,
+    ):
+        """Chạy ingest ở background; playlist sau chờ playlist trước để giữ đúng thứ tự trong queue."""
+        state = self.guilds.get(player.guild.id)
+        previous = state.ingest_task
+        state.ingest_task = asyncio.create_task(
+            self._ingest_playlist(player, batches, progress, message, previous)
+        )
+    
+    async def _ingest_playlist(
+        self,
+        player: wavelink.Player,
+        batches: AsyncIterator[tuple[list[wavelink.Playable], int]],
+        progress: PlaylistProgress,
+        message: discord.Message,
+        previous: asyncio.Task | None,
+    ):
+        """Thêm các batch còn lại của playlist vào queue, sửa message tiến độ tối đa mỗi PLAYLIST_PROGRESS_INTERVAL giây."""
+        guild_id = player.guild.id
+        if previous and not previous.done():
+            await asyncio.wait([previous])
+        
+        started = time.monotonic()
+        last_edit = started
+        try:
+            async for valid, seen in batches:
+                if not player.connected:
+                    logger.info(f"[PLAYLIST] Guild {guild_id}: Player đã ngắt kết nối, dừng ingest")
+                    return
+                
+                player.queue.put(valid)
+                progress.add(valid, seen)
+                
+                # Lần sửa cuối (đã xong) nằm sau vòng lặp
+                if not progress.done and time.monotonic() - last_edit >= PLAYLIST_PROGRESS_INTERVAL:
+                    last_edit = time.monotonic()
+                    await self._edit_playlist_message(message, progress)
+        finally:
+            await batches.aclose()
+        
+        logger.info(
+            f"[PLAYLIST] Guild {guild_id}: '{progress.name}' xong - {progress.added}/{progress.total} bài "
+            f"sau {(time.monotonic() - started) * 1000:.0f}ms"
+        )
+        await self._edit_playlist_message(message, progress)
+    
+    async def _edit_playlist_message(self, message: discord.Message, progress: PlaylistProgress):
+        try:
+            await message.edit(embed=self._playlist_embed(progress))
+        except discord.HTTPException as e:
+            logger.warning(f"[PLAYLIST] Không sửa được message tiến độ: {e}")
+    
+    def _playlist_embed(self, progress: PlaylistProgress) -> discord.Embed:
+        """Embed tiến độ playlist (dùng cho cả message đầu và các lần sửa)."""
+        embed = discord.Embed(
+            title="📋 Đang phát Playlist" if progress.playing else "📋 Đã thêm Playlist vào queue",
+            description=f"**{progress.name}**",
+            color=discord.Color.green() if progress.playing else discord.Color.blue()
+        )
+        embed.add_field(name="Số bài", value=f"{progress.added} bài", inline=True)
+        embed.add_field(name="Tổng thời gian", value=self._format_duration(progress.total_length), inline=True)
+        embed.add_field(name="Bỏ qua", value=f"{progress.skipped} bài", inline=True)
+        if not progress.done:
+            embed.set_footer(text=f"⏳ Đang xử lý {progress.processed}/{progress.total} bài...")
+        return embed
+    
     @commands.command(name="skip", aliases=["s"])
     async def skip(self, ctx: commands.Context):
         """Skip bài hiện tại."""
@@ -778,8 +1220,38 @@ class Music(commands.Cog):
             return await ctx.send("❌ Không có gì đang phát.")
         
         current_title = player.current.title if player.current else "Unknown"
+        # Các lệnh skip tới trong SKIP_COALESCE_WINDOW được gộp thành một lần skip nhiều bài
+        future, merged = self._actor(ctx.guild.id).submit(
+            "skip", lambda count: self._skip(player, count), supersedes=True, coalesce=True
+        )
+        if merged:
+            return
+        
+        skipped = await future
+        if skipped == 1:
+            await ctx.send(f"⏭️ Đã skip: **{current_title}**")
+        elif skipped:
+            await ctx.send(f"⏭️ Đã skip {skipped} bài (từ **{current_title}**)")
+    
+    async def _skip(self, player: wavelink.Player, count: int) -> int:
+        """Skip `count` bài: bỏ count-1 bài đầu queue rồi skip bài đang phát. Trả về số bài đã skip."""
+        if not player.playing:
+            return 0
+        
+        guild_id = player.guild.id
+        if count > 1:
+            logger.info(f"[ACTOR] Guild {guild_id}: Gộp {count} lệnh skip")
+        
+        drop = min(count - 1, len(player.queue))
+        if 0 < drop < len(player.queue):
+            # Phát thẳng bài đích (một lần play thay vì skip từng bài)
+            await player.play(player.queue.jump(drop))
+            return drop + 1
+        
+        if drop:
+            player.queue.clear()
         await player.skip()
-        await ctx.send(f"⏭️ Đã skip: **{current_title}**")
+        return drop + 1
     
     @commands.command(name="pause")
     async def pause(self, ctx: commands.Context):
@@ -790,6 +1262,7 @@ class Music(commands.Cog):
             return await ctx.send("❌ Không có gì đang phát.")
         
         await player.pause(True)
+        self._journal_player(player, paused=True)
         await ctx.send("⏸️ Đã tạm dừng")
     
     @commands.command(name="resume", aliases=["unpause"])
@@ -804,6 +1277,7 @@ class Music(commands.Cog):
             return await ctx.send("❌ Nhạc không bị tạm dừng.")
         
         await player.pause(False)
+        self._journal_player(player, paused=False)
         await ctx.send("▶️ Tiếp tục phát")
     
     @commands.command(name="stop")
@@ -814,22 +1288,20 @@ class Music(commands.Cog):
         if not player:
             return await ctx.send("❌ Bot không trong voice channel.")
         
-        player.queue.clear()
-        await player.stop()
-        await player.disconnect()
-        
-        # Clear guild state
-        if ctx.guild:
-            guild_id = ctx.guild.id
-            self._recent_ids.pop(guild_id, None)
-            self._next_autoplay.pop(guild_id, None)
+        async def stop_and_leave(_):
+            self._end_session(player)
+            player.queue.clear()
+            await player.stop()
+            await player.disconnect()
         
+        future, _ = self._actor(ctx.guild.id).submit("stop", stop_and_leave, supersedes=True)
+        await future
         await ctx.send("⏹️ Đã dừng và rời voice")
     
     @commands.command(name="queue", aliases=["q"])
     async def queue(self, ctx: commands.Context, page: int = 1):
         """Xem danh sách bài chờ."""
-        player: wavelink.Player = ctx.voice_client  # type: ignore
+        player: MusicPlayer = ctx.voice_client  # type: ignore
         
         if not player:
             return await ctx.send("❌ Bot không trong voice channel.")
@@ -837,38 +1309,20 @@ class Music(commands.Cog):
         if not player.queue and not player.current:
             return await ctx.send("📭 Queue trống.")
         
-        items_per_page = 10
-        start = (page - 1) * items_per_page
-        end = start + items_per_page
-        
-        queue_list = list(player.queue)
-        total_pages = (len(queue_list) - 1) // items_per_page + 1 if queue_list else 1
+        # Trang ngoài khoảng → kẹp về trang đầu/cuối thay vì hiện trang trống
+        page = player.queue.pages.clamp(page, len(player.queue))
+        embed, page_count = self._queue_page_embed(player, page)
+        if page_count == 1:
+            return await ctx.send(embed=embed)
         
-        embed = discord.Embed(title="📜 Queue", color=discord.Color.blue())
-        
-        # Current track
-        if player.current:
-            embed.add_field(
-                name="🎵 Đang phát",
-                value=f"**{player.current.title}** - {self._format_duration(player.current.length)}",
-                inline=False
-            )
-        
-        # Queue items
-        if queue_list:
-            description = ""
-            for i, track in enumerate(queue_list[start:end], start=start + 1):
-                description += f"`{i}.` {track.title} - {self._format_duration(track.length)}\n"
-            
-            embed.add_field(name="Tiếp theo", value=description or "Trống", inline=False)
-            embed.set_footer(text=f"Trang {page}/{total_pages} | Tổng: {len(queue_list)} bài")
-        
-        await ctx.send(embed=embed)
+        # Nhiều trang → thêm nút chuyển trang (dùng lại các trang đã cache)
+        view = PageButtons(lambda p: self._queue_page_embed(player, p), page, page_count)
+        view.message = await ctx.send(embed=embed, view=view)
     
     @commands.command(name="remove")
     async def remove(self, ctx: commands.Context, index: int):
         """Xóa bài ở vị trí chỉ định khỏi queue."""
-        player: wavelink.Player = ctx.voice_client  # type: ignore
+        player: MusicPlayer = ctx.voice_client  # type: ignore
         
         if not player or not player.queue:
             return await ctx.send("❌ Queue trống.")
@@ -877,13 +1331,7 @@ class Music(commands.Cog):
             return await ctx.send(f"❌ Index không hợp lệ. Chọn từ 1-{len(player.queue)}")
         
         # Convert to 0-based index
-        queue_list = list(player.queue)
-        removed = queue_list.pop(index - 1)
-        
-        # Rebuild queue
-        player.queue.clear()
-        for track in queue_list:
-            player.queue.put(track)
+        removed = player.queue.remove_at(index - 1)
         
         await ctx.send(f"🗑️ Đã xóa: **{removed.title}**")
     
@@ -902,25 +1350,20 @@ class Music(commands.Cog):
     @commands.command(name="shuffle")
     async def shuffle(self, ctx: commands.Context):
         """Trộn ngẫu nhiên queue."""
-        player: wavelink.Player = ctx.voice_client  # type: ignore
+        player: MusicPlayer = ctx.voice_client  # type: ignore
         
         if not player or len(player.queue) < 2:
             return await ctx.send("❌ Cần ít nhất 2 bài trong queue để shuffle.")
         
-        # Shuffle
-        queue_list = list(player.queue)
-        random.shuffle(queue_list)
+        # Shuffle tại chỗ
+        player.queue.shuffle()
         
-        player.queue.clear()
-        for track in queue_list:
-            player.queue.put(track)
-        
-        await ctx.send(f"🔀 Đã trộn {len(queue_list)} bài")
+        await ctx.send(f"🔀 Đã trộn {len(player.queue)} bài")
     
     @commands.command(name="jump", aliases=["j", "skipto"])
     async def jump(self, ctx: commands.Context, index: int):
         """Nhảy đến bài ở vị trí chỉ định trong queue."""
-        player: wavelink.Player = ctx.voice_client  # type: ignore
+        player: MusicPlayer = ctx.voice_client  # type: ignore
         
         if not player or not player.queue:
             return await ctx.send("❌ Queue trống.")
@@ -928,23 +1371,20 @@ class Music(commands.Cog):
         if index < 1 or index > len(player.queue):
             return await ctx.send(f"❌ Index không hợp lệ. Chọn từ 1-{len(player.queue)}")
         
-        # Lấy danh sách queue hiện tại
-        queue_list = list(player.queue)
+        async def jump_to(_) -> wavelink.Playable | None:
+            # Queue có thể đã đổi trong lúc chờ tới lượt
+            if index > len(player.queue):
+                return None
+            # Bỏ các bài trước bài đích và lấy bài đích ra khỏi queue, phát ngay
+            target = player.queue.jump(index - 1)
+            await player.play(target)
+            return target
         
-        # Bài muốn nhảy đến
-        target_track = queue_list[index - 1]
-        
-        # Xóa tất cả bài từ đầu đến trước bài đích
         skipped_count = index - 1
-        remaining_tracks = queue_list[index:]  # Bao gồm bài đích ở vị trí 0
-        
-        # Rebuild queue với các bài còn lại (không bao gồm bài đích vì sẽ phát ngay)
-        player.queue.clear()
-        for track in remaining_tracks[1:]:  # Bỏ bài đích
-            player.queue.put(track)
-        
-        # Phát bài đích
-        await player.play(target_track)
+        future, _ = self._actor(ctx.guild.id).submit("jump", jump_to, supersedes=True)
+        target_track = await future
+        if target_track is None:
+            return await ctx.send("❌ Queue đã thay đổi, không còn bài ở vị trí này.")
         
         embed = discord.Embed(
             title="⏭️ Nhảy đến bài",
@@ -953,9 +1393,24 @@ class Music(commands.Cog):
         )
         if skipped_count > 0:
             embed.add_field(name="Đã bỏ qua", value=f"{skipped_count} bài", inline=True)
-        embed.add_field(name="Còn lại", value=f"{len(remaining_tracks) - 1} bài", inline=True)
+        embed.add_field(name="Còn lại", value=f"{len(player.queue)} bài", inline=True)
         await ctx.send(embed=embed)
     
+    @commands.command(name="move", aliases=["mv"])
+    async def move(self, ctx: commands.Context, index: int, position: int):
+        """Chuyển bài ở vị trí index tới vị trí position trong queue."""
+        player: MusicPlayer = ctx.voice_client  # type: ignore
+        
+        if not player or not player.queue:
+            return await ctx.send("❌ Queue trống.")
+        
+        size = len(player.queue)
+        if not 1 <= index <= size or not 1 <= position <= size:
+            return await ctx.send(f"❌ Index không hợp lệ. Chọn từ 1-{size}")
+        
+        moved = player.queue.move(index - 1, position - 1)
+        await ctx.send(f"↕️ Đã chuyển **{moved.title}** tới vị trí {position}")
+    
     @commands.command(name="nowplaying", aliases=["np"])
     async def nowplaying(self, ctx: commands.Context):
         """Hiển thị bài đang phát với progress bar."""
@@ -1001,7 +1456,9 @@ class Music(commands.Cog):
         if mode not in ("off", "track", "queue"):
             return await ctx.send("❌ Chế độ không hợp lệ. Dùng: `off`, `track`, hoặc `queue`")
         
-        self.loop_mode[guild_id] = mode
+        self.guilds.get(guild_id).loop = mode
+        if ctx.voice_client:
+            self._journal_player(ctx.voice_client, loop=mode)
         
         emoji = {"off": "➡️", "track": "🔂", "queue": "🔁"}
         await ctx.send(f"{emoji[mode]} Loop: **{mode}**")
@@ -1021,15 +1478,17 @@ class Music(commands.Cog):
         
         setting = setting.lower()
         if setting == "on":
-            self.autoplay_enabled[guild_id] = True
+            self.guilds.get(guild_id).autoplay = True
             # Disable built-in, use custom
             if player:
                 player.autoplay = wavelink.AutoPlayMode.disabled
+                self._journal_player(player, autoplay=True)
             await ctx.send("🔄 Autoplay: **ON** (Smart Recommend)")
         elif setting == "off":
-            self.autoplay_enabled[guild_id] = False
+            self.guilds.get(guild_id).autoplay = False
             if player:
                 player.autoplay = wavelink.AutoPlayMode.disabled
+                self._journal_player(player, autoplay=False)
             await ctx.send("🔄 Autoplay: **OFF**")
         else:
             await ctx.send("❌ Dùng: `on`, `off`, hoặc `status`")
@@ -1054,6 +1513,110 @@ class Music(commands.Cog):
         embed.add_field(name="Volume", value=f"{DEFAULT_VOLUME}%", inline=True)
         embed.add_field(name="Idle Timeout", value=f"{IDLE_TIMEOUT_SECONDS // 60} phút", inline=True)
         
+        # Đa dạng kênh trong autoplay
+        channels = self._get_channel_window(guild_id)
+        top_channels = "\n".join(
+            f"{name or 'Unknown'}: {count}/{MAX_SAME_CHANNEL}"
+            for name, count in channels.most_common(3)
+        )
+        embed.add_field(
+            name="Đa dạng kênh",
+            value=f"Tối đa {MAX_SAME_CHANNEL} bài/kênh trong {CHANNEL_WINDOW} bài gần nhất\n{top_channels}".strip(),
+            inline=False
+        )
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name="stats")
+    async def stats(self, ctx: commands.Context):
+        """Xem thống kê hiệu năng (cache, ...)."""
+        cache = self.resolver.cache.stats()
+        lookups = cache["memory_hits"] + cache["disk_hits"] + cache["misses"]
+        hit_rate = (cache["memory_hits"] + cache["disk_hits"]) / lookups * 100 if lookups else 0
+        
+        embed = discord.Embed(title="📊 Thống kê", color=discord.Color.dark_gray())
+        embed.add_field(
+            name="Resolve Cache",
+            value=(
+                f"Hit RAM: {cache['memory_hits']}\n"
+                f"Hit disk: {cache['disk_hits']}\n"
+                f"Miss: {cache['misses']}\n"
+                f"Hit rate: {hit_rate:.1f}%\n"
+                f"Entries: {cache['size']}"
+            ),
+            inline=True
+        )
+        embed.add_field(name="Request gộp", value=str(self.resolver.coalesced), inline=True)
+        scheduler = self.resolver.scheduler.stats()
+        waiting = scheduler["waiting"]
+        embed.add_field(
+            name="Search scheduler",
+            value=(
+                f"Đang chạy: {scheduler['active']}/{scheduler['limit']}\n"
+                f"Chờ: {waiting['interactive']} user | {waiting['autoplay']} autoplay | {waiting['prefetch']} prefetch\n"
+                f"Prefetch bỏ (quá hạn): {scheduler['expired']}"
+            ),
+            inline=True
+        )
+        outbox = self.outbox.stats()
+        embed.add_field(
+            name="Now playing card",
+            value=f"Gửi mới: {outbox['sent']} | Sửa: {outbox['edited']} | {outbox['channels']} channel",
+            inline=True
+        )
+        guilds = self.guilds.report()
+        embed.add_field(
+            name="Guild state",
+            value=(
+                f"{guilds['guilds']} guild ({guilds['connected']} trong voice) | "
+                f"~{guilds['bytes'] / 1024:.0f} KB | Đã evict: {guilds['evicted']}"
+            ),
+            inline=True
+        )
+        embed.add_field(name="Timers", value=f"Đang chờ: {len(self.timers)} | Đã chạy: {self.timers.fired}", inline=True)
+        
+        graph = self.graph.stats()
+        embed.add_field(
+            name="Graph",
+            value=(
+                f"{graph['tracks']} bài | {graph['edges']} edges\n"
+                f"Phục vụ local: {graph['hits']} | Cần Mix: {graph['misses']}"
+            ),
+            inline=True
+        )
+        
+        features_total = FEATURE_CACHE.hits + FEATURE_CACHE.misses
+        features_rate = FEATURE_CACHE.hits / features_total * 100 if features_total else 0
+        embed.add_field(
+            name="Feature Cache",
+            value=f"{len(FEATURE_CACHE)} bài | Hit rate: {features_rate:.1f}%",
+            inline=True
+        )
+        
+        balancer = self.resolver.nodes
+        if balancer is not None:
+            lines = [
+                f"`{node.identifier}` {node.status.name.lower()} | {len(node.players)} player | "
+                f"penalty {balancer.penalties.get(node.identifier, 0):.0f} | {balancer.searches[node.identifier]} search"
+                for node in wavelink.Pool.nodes.values()
+            ]
+            if balancer.migrations:
+                average = sum(balancer.migrations) / len(balancer.migrations)
+                lines.append(
+                    f"Chuyển node: {len(balancer.migrations)} lần, TB {average:.2f}s, "
+                    f"gần nhất {balancer.migrations[-1]:.2f}s, lỗi {balancer.failed_migrations}"
+                )
+            embed.add_field(name="Lavalink Nodes", value="\n".join(lines) or "Không có node", inline=False)
+        
+        cluster_stats = getattr(self.bot, "cluster_stats", None)
+        if cluster_stats is not None and cluster_stats.latest:
+            total = cluster_stats.latest
+            embed.add_field(
+                name=f"Cluster {self.bot.cluster_id} / {total['clusters']}",
+                value=f"{total['guilds']} guild | {total['players']} player ({total['playing']} đang phát)",
+                inline=False
+            )
+        
         await ctx.send(embed=embed)
     
     @commands.command(name="volume", aliases=["vol"])
@@ -1069,6 +1632,7 @@ class Music(commands.Cog):
         
         vol = min(max(vol, 0), 100)
         await player.set_volume(vol)
+        self._journal_player(player, volume=vol)
         await ctx.send(f"🔊 Âm lượng: **{vol}%**")
     
     @commands.command(name="musichelp", aliases=["mhelp", "huongdan"])
@@ -1098,6 +1662,7 @@ class Music(commands.Cog):
             value=(
                 "`pqueue` - Xem danh sách chờ\n"
                 "`premove <số>` - Xóa bài khỏi queue\n"
+                "`pmove <từ> <đến>` - Đổi vị trí bài trong queue\n"
                 "`pclear` - Xóa toàn bộ queue\n"
                 "`pshuffle` - Trộn ngẫu nhiên queue"
             ),
@@ -1110,7 +1675,8 @@ class Music(commands.Cog):
             value=(
                 "`pnowplaying` - Bài đang phát + progress\n"
                 "`pvolume [0-100]` - Điều chỉnh âm lượng\n"
-                "`psettings` - Xem cấu hình hiện tại"
+                "`psettings` - Xem cấu hình hiện tại\n"
+                "`pstats` - Thống kê hiệu năng"
             ),
             inline=True
         )
@@ -1145,44 +1711,72 @@ class Music(commands.Cog):
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         """Tự động rời voice khi không còn ai (trừ bot)."""
-        # Chỉ xử lý khi ai đó rời voice channel
-        if before.channel is None:
+        # Bot bị ngắt khỏi voice (kick, disconnect từ ngoài) → phiên kết thúc
+        if self.bot.user and member.id == self.bot.user.id and before.channel and after.channel is None:
+            player = member.guild.voice_client
+            if isinstance(player, wavelink.Player) and player.guild:
+                if not getattr(player, "detached", False):
+                    self._end_session(player)
+                return
+            # Player đã bị gỡ: vẫn phải xóa journal, không thì restart sẽ vào lại voice
+            self.journal.forget(member.guild.id)
+            self._cancel_timers(member.guild.id)
+            self.guilds.disconnected(member.guild.id)
             return
         
-        # Kiểm tra nếu channel cũ có bot trong đó
-        guild = before.channel.guild
+        if member.bot or before.channel == after.channel:
+            return
+        
+        guild = member.guild
         player: wavelink.Player = guild.voice_client  # type: ignore
         
         if not player or not player.channel:
             return
         
-        # Kiểm tra nếu đây là channel mà bot đang ở
-        if player.channel.id != before.channel.id:
+        # Có người vào lại channel của bot → hủy đếm ngược
+        if after.channel is not None and player.channel.id == after.channel.id:
+            if self.timers.cancel((guild.id, "alone")):
+                logger.info(f"[ALONE] Guild {guild.id}: Có người quay lại, ở lại voice")
+            return
+        
+        # Chỉ xử lý khi ai đó rời channel mà bot đang ở
+        if before.channel is None or player.channel.id != before.channel.id:
             return
         
         # Đếm số người thật trong channel (không tính bot)
         human_members = [m for m in before.channel.members if not m.bot]
         
         if len(human_members) == 0:
-            logger.info(f"[ALONE] Guild {guild.id}: Không còn ai trong voice, rời sau 30s...")
+            logger.info(f"[ALONE] Guild {guild.id}: Không còn ai trong voice, rời sau {ALONE_TIMEOUT_SECONDS}s...")
+            
+            # Đợi trước khi rời (trong trường hợp ai đó quay lại)
+            self.timers.arm((guild.id, "alone"), ALONE_TIMEOUT_SECONDS, lambda: self._alone_disconnect(player))
+    
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        """Bot rời / bị kick khỏi guild → bỏ mọi state của guild."""
+        self._cancel_timers(guild.id)
+        self.guilds.removed(guild.id)
+        self.journal.forget(guild.id)
+        logger.info(f"[STATE] Guild {guild.id}: Bot rời guild, đã xóa state")
+    
+    async def _alone_disconnect(self, player: wavelink.Player):
+        """Timer alone hết hạn: kiểm tra lại rồi rời voice."""
+        if not player.channel or not player.guild:
+            return
+        
+        current_members = [m for m in player.channel.members if not m.bot]
+        if len(current_members) == 0 and player.connected:
+            self._end_session(player)
+            player.queue.clear()
+            if player.playing:
+                await player.stop()
+            await player.disconnect()
             
-            # Đợi 30 giây trước khi rời (trong trường hợp ai đó quay lại)
-            await asyncio.sleep(30)
+            if hasattr(player, 'text_channel') and player.text_channel:
+                self.outbox.notice(player.text_channel, "👋 Rời voice vì không còn ai nghe.", final=True)
             
-            # Kiểm tra lại sau 30s
-            if player.channel:
-                current_members = [m for m in player.channel.members if not m.bot]
-                if len(current_members) == 0 and player.connected:
-                    player.queue.clear()
-                    if player.playing:
-                        await player.stop()
-                    await player.disconnect()
-                    
-                    if hasattr(player, 'text_channel') and player.text_channel:
-                        await player.text_channel.send("👋 Rời voice vì không còn ai nghe.")
-                    
-                    logger.info(f"[ALONE] Guild {guild.id}: Đã rời voice")
-
+            logger.info(f"[ALONE] Guild {player.guild.id}: Đã rời voice")
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Music(bot))
@@ -15,16 +15,82 @@ LAVALINK_HOST = os.getenv("LAVALINK_HOST", "localhost")
 LAVALINK_PORT = int(os.getenv("LAVALINK_PORT", 2333))
 LAVALINK_PASSWORD = os.getenv("LAVALINK_PASSWORD", "youshallnotpass")
 LAVALINK_SSL = os.getenv("LAVALINK_SSL", "false").lower() == "true"
+# Nhiều node: "host:port,password@host2:port,https://host3:443" (rỗng = chỉ node ở trên)
+LAVALINK_NODES = os.getenv("LAVALINK_NODES", "")
+NODE_STATS_INTERVAL = 15.0  # Seconds between node load (stats) refreshes
+LAVALINK_RESUME_TIMEOUT = 120  # Seconds Lavalink keeps players alive for the bot to resume after a restart
+NODE_DEFICIT_LIMIT = 0.05  # Share of audio frames a node may miss before it counts as degraded
+NODE_DEGRADED_CHECKS = 2  # Consecutive degraded stats refreshes before players move off the node
+
+# Sharding - CLUSTER_COUNT > 1 thì run.py chạy nhiều process, mỗi process một khoảng shard
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0))  # 0 = để Discord đề xuất (1 process) / = CLUSTER_COUNT
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", 1))
+CLUSTER_STATS_PORT = int(os.getenv("CLUSTER_STATS_PORT", 8765))  # IPC stats giữa launcher và workers (localhost)
+CLUSTER_STATS_INTERVAL = 10.0  # Seconds between worker stats reports
 
 # Bot Settings
 DEFAULT_VOLUME = 50
 MAX_DURATION_SECONDS = 90 * 60  # 90 minutes
 IDLE_TIMEOUT_SECONDS = 300  # 5 minutes
+ALONE_TIMEOUT_SECONDS = 30  # Leave this long after the last listener leaves voice
+TIMER_TICK = 1.0  # Resolution (seconds) of the timer wheel behind every per-guild deadline
+GUILD_STATE_TTL = 30 * 60  # Drop a guild's in-memory state this long after it leaves voice
+GUILD_SETTINGS_PERSIST = True  # Keep autoplay/loop of evicted guilds on disk (settings.db)
+PLAYLIST_BATCH_SIZE = 100  # Playlist tracks validated/queued per background step
+PLAYLIST_PROGRESS_INTERVAL = 2.0  # Min seconds between playlist progress message edits
+QUEUE_PAGE_SIZE = 10  # Tracks per pqueue page
+SKIP_COALESCE_WINDOW = 0.2  # Skips sent within this many seconds are merged into one skip-by-N
+NOTIFY_RATE = 1.0  # Now-playing card sends/edits per second per channel (Discord allows ~5 per 5s)
+NOTIFY_BURST = 3  # ... with up to this many back to back
+JOURNAL_COMPACT_AFTER = 500  # Queue/player ops per guild before the journal is folded into a snapshot
+JOURNAL_POSITION_INTERVAL = 10.0  # Seconds playback positions are buffered before one batched write
+
+# Storage - SQLite files (cache, ...) sống qua restart
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SQLITE_BUSY_TIMEOUT = 2.0  # Seconds a write waits for another cluster process's lock before giving up
+
+# Resolve cache - cache kết quả loadtracks của Lavalink
+RESOLVE_CACHE_SIZE = 2000  # Max entries kept in memory (LRU)
+RESOLVE_CACHE_TTL = {  # Seconds, per query kind
+    "mix": 6 * 60 * 60,  # YouTube Radio Mix (watch?v=...&list=RD...)
+    "search": 60 * 60,  # ytsearch: queries
+    "url": 12 * 60 * 60,  # Direct video / playlist URLs
+}
 
 # Recommendation Settings
 HISTORY_LIMIT = 10  # Token learning from last N songs
+TASTE_DECAY = 0.8  # Weight kept by older songs each time a new one starts
+DUPLICATE_TITLE_THRESHOLD = 0.7  # Shared-word ratio that marks a title as a re-upload
 ANTI_REPEAT_LIMIT = 20  # Don't repeat last N songs
+HISTORY_FLUSH_INTERVAL = 5.0  # Max seconds a finished play waits before it is written to disk
+HISTORY_FLUSH_BATCH = 20  # Write history early once this many plays are pending
 MAX_SAME_CHANNEL = 3  # Max songs from same channel in recommendations
+CHANNEL_WINDOW = 10  # ... counted over the last N songs
+AUTOPLAY_BUFFER_SIZE = 15  # Candidates kept ready per guild
+AUTOPLAY_BUFFER_LOW_WATER = 3  # Refill in background below this many
+AUTOPLAY_PREFETCH_LEAD = 30  # Seconds before the last track ends to top the buffer up again
+AUTOPLAY_FALLBACK_FANOUT = 3  # Fallback searches run concurrently
+AUTOPLAY_FALLBACK_DEADLINE = 5.0  # Seconds to wait for a valid fallback result
+SEARCH_CONCURRENCY = 4  # Lavalink searches in flight at once (cache misses only)
+SEARCH_INTERACTIVE_RESERVE = 1  # ... of which this many are kept free for user searches
+SEARCH_PREFETCH_DEADLINE = 15.0  # Prefetch searches still waiting for a slot after this many seconds are dropped
+FEATURE_CACHE_SIZE = 5000  # Tracks whose genre/language features stay memoized
+GRAPH_MAX_NEIGHBORS = 50  # Related tracks kept per track in the local graph
+GRAPH_STALE_AFTER = 7 * 24 * 60 * 60  # Edges older than this are refreshed from YouTube
+GRAPH_WALK_DEPTH = 2  # Hops autoplay may walk before fetching a new Mix
+GRAPH_SEARCH_WEIGHT = 0.5  # Search results count less than Mix results
+
+# Autoplay ranking weights (bot/scoring.py)
+SCORE_WEIGHTS = {
+    "genre": 3.0,  # Per genre shared with the seed track
+    "language": 2.0,  # Per language shared with the seed track
+    "duration": 1.0,  # Penalty per doubling/halving of length vs the seed
+    "profile_genre": 2.0,  # Guild taste: share of recent tracks with the candidate's genres
+    "profile_language": 1.0,  # Guild taste: share of recent tracks with its languages
+    "profile_tokens": 1.0,  # Guild taste: share of recent tracks with its title words
+    "channel_repeat": 1.5,  # Penalty per recent song from the candidate's channel
+    "graph": 2.0,  # Local graph walk score (closest neighbor of the seed = 1)
+}
 
 # Blocked keywords (lowercase) - Block hoàn toàn, không cho phát
 BLOCKED_KEYWORDS = [
@@ -0,0 +1,85 @@
+"""
+Duplicate Titles - Token index of recently played titles to skip re-uploads
+"""
+from collections import Counter, deque
+
+
+class TitleIndex:
+    """
+    Near-duplicate detector over the last `window` played titles of a guild.
+    
+    Titles are compared as sets of normalized tokens (bot.features.title_tokens,
+    so "(Official MV)", "[Lyrics]", "vietsub", "remix", ... are already gone).
+    An exact token set is answered by a hash lookup; otherwise only entries
+    sharing at least one token are visited through an inverted index, so the
+    cost depends on token overlap, not on the window size.
+    """
+    
+    def __init__(self, window: int, threshold: float):
+        self.window = window
+        self.threshold = threshold
+        
+        self._entries: deque[tuple[int, frozenset[str]]] = deque()
+        self._next_id = 0
+        self._keys: Counter[frozenset[str]] = Counter()  # Token set chính xác
+        self._postings: dict[str, set[int]] = {}  # token -> entry ids
+        self._tokens: dict[int, frozenset[str]] = {}  # entry id -> token set
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def add(self, tokens: tuple[str, ...]) -> None:
+        """Thêm title vừa phát (đẩy title cũ nhất ra nếu đầy)."""
+        key = frozenset(tokens)
+        if not key:
+            return
+        
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries.append((entry_id, key))
+        self._keys[key] += 1
+        self._tokens[entry_id] = key
+        for token in key:
+            self._postings.setdefault(token, set()).add(entry_id)
+        
+        if len(self._entries) > self.window:
+            self._evict()
+    
+    def _evict(self) -> None:
+        entry_id, key = self._entries.popleft()
+        self._keys[key] -= 1
+        if not self._keys[key]:
+            del self._keys[key]
+        del self._tokens[entry_id]
+        for token in key:
+            postings = self._postings[token]
+            postings.discard(entry_id)
+            if not postings:
+                del self._postings[token]
+    
+    def is_duplicate(self, tokens: tuple[str, ...]) -> bool:
+        """
+        True nếu title là biến thể (lyrics/remix/vietsub/re-upload) của một bài
+        trong window: cùng token set, hoặc tỷ lệ token chung / title ngắn hơn
+        >= threshold (title 1 từ thì từ đó phải dài hơn 3 ký tự).
+        """
+        key = frozenset(tokens)
+        if not key:
+            return False
+        if key in self._keys:
+            return True
+        
+        # Đếm số token chung với từng entry qua inverted index
+        shared: Counter[int] = Counter()
+        for token in key:
+            shared.update(self._postings.get(token, ()))
+        
+        for entry_id, common in shared.items():
+            other = self._tokens[entry_id]
+            shortest = min(len(key), len(other))
+            if shortest == 1 and len("".join(key if len(key) == 1 else other)) <= 3:
+                continue
+            if common / shortest >= self.threshold:
+                return True
+        
+        return False
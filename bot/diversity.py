@@ -0,0 +1,50 @@
+"""
+Channel Diversity - Sliding-window count of recently played channels per guild
+"""
+from collections import Counter, deque
+
+
+def channel_key(author: str | None) -> str:
+    """Chuẩn hóa tên kênh ("Artist - Topic" và "artist" là cùng một kênh)."""
+    key = (author or "").casefold().strip()
+    if key.endswith(" - topic"):
+        key = key[:-len(" - topic")]
+    return key
+
+
+class ChannelWindow:
+    """
+    How many of the last `window` tracks each channel uploaded.
+    
+    A deque keeps the order and a Counter the totals, so recording a track
+    start and looking up a channel are both O(1).
+    """
+    
+    def __init__(self, window: int, limit: int):
+        self.window = window
+        self.limit = limit
+        self._recent: deque[str] = deque()
+        self._counts: Counter[str] = Counter()
+    
+    def __len__(self) -> int:
+        return len(self._recent)
+    
+    def add(self, author: str | None) -> None:
+        key = channel_key(author)
+        self._recent.append(key)
+        self._counts[key] += 1
+        if len(self._recent) > self.window:
+            oldest = self._recent.popleft()
+            self._counts[oldest] -= 1
+            if not self._counts[oldest]:
+                del self._counts[oldest]
+    
+    def count(self, author: str | None) -> int:
+        return self._counts.get(channel_key(author), 0)
+    
+    def is_capped(self, author: str | None) -> bool:
+        """Kênh đã đủ `limit` bài trong window → không chọn thêm."""
+        return self.count(author) >= self.limit
+    
+    def most_common(self, n: int) -> list[tuple[str, int]]:
+        return self._counts.most_common(n)
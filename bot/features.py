@@ -0,0 +1,159 @@
+"""
+Track Features - Compact, memoized genre/language/token features for scoring
+"""
+import re
+from collections import OrderedDict
+
+import wavelink
+
+from bot.config import FEATURE_CACHE_SIZE
+
+# Phát hiện thể loại - mỗi thể loại là một bit
+GENRE_KEYWORDS = {
+    'pop': ['pop', 'ballad', 'acoustic'],
+    'rock': ['rock', 'metal', 'punk', 'alternative'],
+    'hiphop': ['rap', 'hip hop', 'hiphop', 'trap', 'drill'],
+    'edm': ['edm', 'remix', 'electronic', 'house', 'techno', 'trance', 'dubstep', 'dj'],
+    'rnb': ['r&b', 'rnb', 'soul', 'funk'],
+    'lofi': ['lofi', 'lo-fi', 'chill', 'study', 'relax'],
+    'classical': ['classical', 'piano', 'orchestra', 'symphony'],
+    'jazz': ['jazz', 'blues', 'swing'],
+    'country': ['country', 'folk', 'acoustic'],
+    'kpop': ['kpop', 'k-pop', 'bts', 'blackpink', 'twice', 'exo', 'nct'],
+    'vpop': ['vpop', 'v-pop'],
+    'anime': ['anime', 'ost', 'opening', 'ending', 'naruto', 'one piece'],
+}
+GENRE_BITS = {genre: 1 << i for i, genre in enumerate(GENRE_KEYWORDS)}
+
+LANG_VI = 1 << 0
+LANG_KO = 1 << 1
+LANG_JA = 1 << 2
+LANG_EN = 1 << 3
+
+# Từ phổ biến không mang nghĩa bài hát (official, mv, lyrics, remix, ...)
+NOISE_WORDS = frozenset([
+    'official', 'mv', 'music', 'video', 'audio', 'lyric', 'lyrics',
+    'hd', '4k', 'visualizer', 'vietsub', 'engsub',
+    'remix', 'cover', 'karaoke', 'instrumental', 'acoustic',
+    'live', 'version', 'ver', 'edit', 'extended', 'radio',
+    'nightcore', 'slowed', 'reverb', 'bass', 'boosted',
+    'pt', 'dj', 'ft', 'feat', 'prod',
+])
+
+
+def _keyword_masks() -> dict[str, int]:
+    masks: dict[str, int] = {}
+    for genre, keywords in GENRE_KEYWORDS.items():
+        for kw in keywords:
+            masks[kw] = masks.get(kw, 0) | GENRE_BITS[genre]
+    # Regex chỉ trả về keyword dài nhất tại mỗi vị trí, nên keyword đó phải
+    # mang luôn bit của các keyword ngắn hơn là tiền tố của nó
+    return {
+        kw: mask | _prefix_mask(kw, masks)
+        for kw, mask in masks.items()
+    }
+
+
+def _prefix_mask(keyword: str, masks: dict[str, int]) -> int:
+    mask = 0
+    for other, other_mask in masks.items():
+        if other != keyword and keyword.startswith(other):
+            mask |= other_mask
+    return mask
+
+
+_GENRE_MASKS = _keyword_masks()
+# Lookahead để tìm keyword ở mọi vị trí, kể cả khi chồng lên nhau ("pop" trong "kpop")
+_GENRE_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for kw in sorted(_GENRE_MASKS, key=len, reverse=True)) + "))"
+)
+
+_VIETNAMESE_PATTERN = re.compile(
+    "[àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]"
+    "|việt|viet|nha|nhac|bai|hat|vietsub"
+)
+_KOREAN_PATTERN = re.compile("[\uac00-\ud7a3]|한국|korea|korean|kpop|k-pop|hangul")
+_JAPANESE_PATTERN = re.compile("[\u3040-\u30ff]|日本|japan|japanese|anime|jpop|j-pop")
+_ENGLISH_PATTERN = re.compile("english|eng|lyrics")
+_LETTER_PATTERN = re.compile(r"[^\W\d_]")
+
+_BRACKETS_PATTERN = re.compile(r'\([^)]*\)|\[[^\]]*\]')  # (official mv), [lyrics]
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+class TrackFeatures:
+    """Genre/language bitmasks and normalized title tokens of one track."""
+    
+    __slots__ = ("genres", "languages", "tokens")
+    
+    def __init__(self, genres: int, languages: int, tokens: tuple[str, ...]):
+        self.genres = genres
+        self.languages = languages
+        self.tokens = tokens
+    
+    def __repr__(self) -> str:
+        return f"TrackFeatures(genres={self.genres:#x}, languages={self.languages:#x}, tokens={self.tokens})"
+
+
+def title_tokens(title: str) -> tuple[str, ...]:
+    """Normalized title words: no bracketed parts, no punctuation, no noise words."""
+    words = _WORD_PATTERN.findall(_BRACKETS_PATTERN.sub('', title).lower())
+    return tuple(dict.fromkeys(w for w in words if w not in NOISE_WORDS))
+
+
+def extract_features(title: str, author: str = "") -> TrackFeatures:
+    """Phát hiện thể loại và ngôn ngữ từ title/author (không cache)."""
+    text = f"{title} {author}".lower()
+    
+    genres = 0
+    for match in _GENRE_PATTERN.finditer(text):
+        genres |= _GENRE_MASKS[match.group(1)]
+    
+    # Phát hiện ngôn ngữ (dựa trên ký tự và keywords)
+    languages = 0
+    if _VIETNAMESE_PATTERN.search(text):
+        languages |= LANG_VI
+    if _KOREAN_PATTERN.search(text):
+        languages |= LANG_KO
+    if _JAPANESE_PATTERN.search(text):
+        languages |= LANG_JA
+    # Tiếng Anh (mặc định nếu có chữ Latin và không có ngôn ngữ khác)
+    if _ENGLISH_PATTERN.search(text) or (not languages and _LETTER_PATTERN.search(text)):
+        languages |= LANG_EN
+    
+    return TrackFeatures(genres, languages, title_tokens(title))
+
+
+class FeatureCache:
+    """Bounded LRU of TrackFeatures keyed by track identifier, shared by all guilds."""
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: OrderedDict[str, TrackFeatures] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, track: wavelink.Playable) -> TrackFeatures:
+        features = self._items.get(track.identifier)
+        if features is not None:
+            self._items.move_to_end(track.identifier)
+            self.hits += 1
+            return features
+        
+        self.misses += 1
+        features = extract_features(track.title, track.author or "")
+        self._items[track.identifier] = features
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+        return features
+    
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+FEATURE_CACHE = FeatureCache(FEATURE_CACHE_SIZE)
+
+
+def track_features(track: wavelink.Playable) -> TrackFeatures:
+    """Features of a track, computed once per identifier."""
+    return FEATURE_CACHE.get(track)
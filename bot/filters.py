@@ -1,48 +1,134 @@
 """
 Track Filter - Validates tracks against configured rules
 """
+import re
+from bisect import bisect_right
+
 from bot.config import MAX_DURATION_SECONDS, BLOCKED_KEYWORDS, MV_KEYWORDS
 
 
+class KeywordMatcher:
+    """
+    Keyword matcher built once from the config keyword lists.
+    
+    Each category is compiled into a single alternation regex (longest keyword
+    first, so "8d audio" wins over "8d"), so a title is scanned by the regex
+    engine instead of one Python-level `in` check per keyword. Categories are
+    checked in the order given: the first category that matches wins.
+    """
+    
+    def __init__(self, categories: dict[str, list[str]]):
+        self._patterns: dict[str, re.Pattern] = {}
+        for category, keywords in categories.items():
+            ordered = sorted(set(keywords), key=len, reverse=True)
+            self._patterns[category] = re.compile("|".join(re.escape(kw) for kw in ordered))
+    
+    def search(self, title: str, category: str) -> str | None:
+        """Return the first keyword of one category found in the title."""
+        match = self._patterns[category].search(title.lower())
+        return match.group(0) if match else None
+    
+    def match(self, title: str) -> tuple[str, str] | None:
+        """Return (keyword, category) for the first matching category, or None."""
+        title_lower = title.lower()
+        for category, pattern in self._patterns.items():
+            match = pattern.search(title_lower)
+            if match:
+                return match.group(0), category
+        return None
+    
+    def match_many(self, titles: list[str]) -> list[tuple[str, str] | None]:
+        """
+        Batch version of match(): all titles are joined and scanned once per category.
+        Returns one result per title, in order.
+        """
+        results: list[tuple[str, str] | None] = [None] * len(titles)
+        if not titles:
+            return results
+        
+        # Keywords không chứa xuống dòng nên match không thể vượt qua ranh giới giữa 2 title
+        lowered = [title.replace("\n", " ").lower() for title in titles]
+        starts = []
+        offset = 0
+        for title in lowered:
+            starts.append(offset)
+            offset += len(title) + 1
+        text = "\n".join(lowered)
+        
+        for category, pattern in self._patterns.items():
+            for match in pattern.finditer(text):
+                index = bisect_right(starts, match.start()) - 1
+                if results[index] is None:
+                    results[index] = (match.group(0), category)
+        
+        return results
+
+
+# Built once at import - "blocked" is checked before "mv"
+KEYWORD_MATCHER = KeywordMatcher({"blocked": BLOCKED_KEYWORDS, "mv": MV_KEYWORDS})
+
+
 def is_likely_mv(title: str) -> bool:
     """
     Kiểm tra title có chứa từ khóa MV/Official Music Video không.
     Dùng để hạn chế (không block) trong autoplay.
     """
-    title_lower = title.lower()
-    for keyword in MV_KEYWORDS:
-        if keyword in title_lower:
-            return True
-    return False
+    return KEYWORD_MATCHER.search(title, "mv") is not None
 
 
-def is_valid_track(title: str, duration_ms: int, is_stream: bool) -> tuple[bool, str]:
-    """
-    Check if a track passes all filters.
-    
-    Returns:
-        (is_valid, reason) - reason is empty if valid, else explains why rejected
-    """
-    title_lower = title.lower()
-    
+def _check_limits(duration_ms: int, is_stream: bool) -> str:
+    """Return the rejection reason for stream/duration limits, or empty string."""
     # Check if live stream
     if is_stream:
-        return False, "❌ Không hỗ trợ live stream"
+        return "❌ Không hỗ trợ live stream"
     
     # Check duration
     duration_sec = duration_ms / 1000
     if duration_sec > MAX_DURATION_SECONDS:
         minutes = int(duration_sec / 60)
-        return False, f"❌ Video quá dài ({minutes} phút > 90 phút)"
+        return f"❌ Video quá dài ({minutes} phút > 90 phút)"
+    
+    return ""
+
+
+def is_valid_track(title: str, duration_ms: int, is_stream: bool) -> tuple[bool, str]:
+    """
+    Check if a track passes all filters.
+    
+    Returns:
+        (is_valid, reason) - reason is empty if valid, else explains why rejected
+    """
+    reason = _check_limits(duration_ms, is_stream)
+    if reason:
+        return False, reason
     
     # Check blocked keywords
-    for keyword in BLOCKED_KEYWORDS:
-        if keyword in title_lower:
-            return False, f"❌ Video bị chặn (chứa '{keyword}')"
+    keyword = KEYWORD_MATCHER.search(title, "blocked")
+    if keyword:
+        return False, f"❌ Video bị chặn (chứa '{keyword}')"
     
     return True, ""
 
 
+def validate_tracks(tracks: list) -> list[tuple[bool, bool]]:
+    """
+    Validate a whole list of tracks with a single keyword scan.
+    
+    Returns:
+        (is_valid, is_mv) for each track, in the same order
+    """
+    matches = KEYWORD_MATCHER.match_many([track.title for track in tracks])
+    results = []
+    
+    for track, match in zip(tracks, matches):
+        if (match and match[1] == "blocked") or _check_limits(track.length, track.is_stream):
+            results.append((False, False))
+        else:
+            results.append((True, match is not None))
+    
+    return results
+
+
 def filter_search_results(tracks: list, recent_ids: set[str]) -> list:
     """
     Filter a list of tracks, removing invalid ones.
@@ -54,21 +140,12 @@ def filter_search_results(tracks: list, recent_ids: set[str]) -> list:
     Returns:
         Filtered list of valid tracks
     """
-    valid_tracks = []
-    
-    for track in tracks:
-        # Skip if recently played
-        if track.identifier in recent_ids:
-            continue
-        
-        # Check against filters
-        is_valid, _ = is_valid_track(
-            title=track.title,
-            duration_ms=track.length,
-            is_stream=track.is_stream
-        )
-        
-        if is_valid:
-            valid_tracks.append(track)
+    # Skip if recently played
+    candidates = [track for track in tracks if track.identifier not in recent_ids]
     
-    return valid_tracks
+    # Check against filters
+    return [
+        track
+        for track, (is_valid, _) in zip(candidates, validate_tracks(candidates))
+        if is_valid
+    ]
@@ -0,0 +1,166 @@
+"""
+Track Graph - Persisted co-occurrence graph built from Mix / search results
+"""
+import json
+import sqlite3
+import time
+
+import wavelink
+
+from bot.storage import is_locked
+
+
+class TrackGraph:
+    """
+    Weighted adjacency index: track id -> related track ids (with encoded tracks).
+    
+    Every Mix or search response for a seed adds edges seed -> result, weighted
+    by position (the first results are the most related). Autoplay walks the
+    graph locally and only falls back to Lavalink when the fresh neighborhood
+    of the seed is exhausted.
+    """
+    
+    def __init__(self, conn: sqlite3.Connection, max_neighbors: int, stale_after: int):
+        self.conn = conn
+        self.max_neighbors = max_neighbors
+        self.stale_after = stale_after
+        
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.dropped_writes = 0  # add_neighbors bỏ qua vì database bị khóa
+        
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS graph_tracks (
+                track_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS graph_edges (
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                weight REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (source, target)
+            )
+            """
+        )
+        # Dọn edges đã cũ và các track không còn edge nào trỏ tới
+        self.conn.execute("DELETE FROM graph_edges WHERE updated_at < ?", (time.time() - self.stale_after,))
+        self.conn.execute(
+            "DELETE FROM graph_tracks WHERE track_id NOT IN (SELECT target FROM graph_edges)"
+        )
+        self.conn.commit()
+    
+    def add_neighbors(self, source_id: str, tracks: list[wavelink.Playable], weight: float = 1.0) -> None:
+        """Thêm/cộng dồn edges source -> tracks (bài đứng trước nặng hơn)."""
+        now = time.time()
+        neighbors = [track for track in tracks if track.identifier != source_id][:self.max_neighbors]
+        if not neighbors:
+            return
+        
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO graph_tracks (track_id, payload, updated_at) VALUES (?, ?, ?)",
+                [(track.identifier, json.dumps(track.raw_data), now) for track in neighbors],
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO graph_edges (source, target, weight, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (source, target) DO UPDATE SET
+                    weight = weight + excluded.weight,
+                    updated_at = excluded.updated_at
+                """,
+                [
+                    (source_id, track.identifier, weight / (rank + 1), now)
+                    for rank, track in enumerate(neighbors)
+                ],
+            )
+            # Chỉ giữ max_neighbors edges nặng nhất của mỗi track
+            self.conn.execute(
+                """
+                DELETE FROM graph_edges WHERE source = ? AND target NOT IN (
+                    SELECT target FROM graph_edges WHERE source = ? ORDER BY weight DESC LIMIT ?
+                )
+                """,
+                (source_id, source_id, self.max_neighbors),
+            )
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            # Process khác đang giữ lock quá lâu: graph chỉ là cache, Mix lần sau thêm lại edges
+            self.conn.rollback()
+            self.dropped_writes += 1
+    
+    def walk(self, source_id: str, exclude, depth: int) -> list[tuple[wavelink.Playable, float]]:
+        """
+        Candidates reachable from source_id within `depth` hops over fresh edges,
+        best first, with their walk score scaled so the best one is 1.0. Each
+        extra hop halves the score. Returns [] when the neighborhood is
+        exhausted (everything excluded) or stale.
+        """
+        cutoff = time.time() - self.stale_after
+        frontier = {source_id: 1.0}
+        visited = {source_id}
+        scores: dict[str, float] = {}
+        
+        for hop in range(depth):
+            placeholders = ",".join("?" * len(frontier))
+            rows = self.conn.execute(
+                f"SELECT source, target, weight FROM graph_edges "
+                f"WHERE source IN ({placeholders}) AND updated_at >= ?",
+                (*frontier, cutoff),
+            ).fetchall()
+            
+            reached: dict[str, float] = {}
+            for source, target, weight in rows:
+                if target in visited:
+                    continue
+                reached[target] = reached.get(target, 0.0) + frontier[source] * weight
+            if not reached:
+                break
+            
+            for track_id, score in reached.items():
+                if track_id not in exclude:
+                    scores[track_id] = score / (2 ** hop)
+            
+            visited.update(reached)
+            # Chỉ đi tiếp từ các node mạnh nhất
+            frontier = dict(sorted(reached.items(), key=lambda x: x[1], reverse=True)[:self.max_neighbors])
+        
+        if not scores:
+            self.misses += 1
+            return []
+        
+        best = sorted(scores, key=scores.get, reverse=True)[:self.max_neighbors]
+        placeholders = ",".join("?" * len(best))
+        payloads = dict(self.conn.execute(
+            f"SELECT track_id, payload FROM graph_tracks WHERE track_id IN ({placeholders})",
+            best,
+        ).fetchall())
+        
+        self.hits += 1
+        top = scores[best[0]]
+        return [
+            (wavelink.Playable(json.loads(payloads[track_id])), scores[track_id] / top)
+            for track_id in best if track_id in payloads
+        ]
+    
+    def stats(self) -> dict[str, int]:
+        """Kích thước graph và hit/miss cho stats command."""
+        return {
+            "tracks": self.conn.execute("SELECT COUNT(*) FROM graph_tracks").fetchone()[0],
+            "edges": self.conn.execute("SELECT COUNT(*) FROM graph_edges").fetchone()[0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "dropped_writes": self.dropped_writes,
+        }
+    
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,260 @@
+"""
+Guild State - Per-guild music state and the registry that owns its lifecycle
+"""
+import asyncio
+import logging
+import sqlite3
+import sys
+import time
+from typing import Callable
+
+from bot.actor import GuildActor
+from bot.autoplay import CandidateBuffer
+from bot.dedup import TitleIndex
+from bot.diversity import ChannelWindow
+from bot.storage import is_locked
+from bot.taste import TasteProfile
+from bot.timers import TimerWheel
+
+logger = logging.getLogger('guild_state')
+
+DEFAULT_AUTOPLAY = True
+DEFAULT_LOOP = "off"
+
+
+class GuildMusicState:
+    """Everything the cog keeps for one guild (settings + rebuildable caches + background tasks)."""
+    
+    __slots__ = (
+        "guild_id",
+        "autoplay",
+        "loop",
+        "buffer",
+        "refill_task",
+        "ingest_task",
+        "actor",
+        "taste",
+        "titles",
+        "channels",
+        "connected",
+        "last_active",
+    )
+    
+    def __init__(self, guild_id: int, autoplay: bool = DEFAULT_AUTOPLAY, loop: str = DEFAULT_LOOP):
+        self.guild_id = guild_id
+        self.autoplay = autoplay
+        self.loop = loop  # "off", "track", "queue"
+        self.buffer: CandidateBuffer | None = None  # Candidates autoplay đã prefetch
+        self.refill_task: asyncio.Task | None = None
+        self.ingest_task: asyncio.Task | None = None  # Playlist đang được thêm dần vào queue
+        self.actor: GuildActor | None = None  # Mailbox mutation player / queue
+        self.taste: TasteProfile | None = None  # Khẩu vị HISTORY_LIMIT bài gần nhất
+        self.titles: TitleIndex | None = None  # Title đã phát gần đây (bắt re-upload)
+        self.channels: ChannelWindow | None = None  # Số bài mỗi kênh trong các bài gần đây
+        self.connected = False
+        self.last_active = time.monotonic()
+    
+    @property
+    def has_custom_settings(self) -> bool:
+        return self.autoplay != DEFAULT_AUTOPLAY or self.loop != DEFAULT_LOOP
+    
+    def release(self) -> None:
+        """Bỏ phần chỉ có nghĩa trong một phiên nghe (buffer, task chạy nền, mutation đang chờ)."""
+        for task in (self.refill_task, self.ingest_task):
+            if task is not None:
+                task.cancel()
+        if self.actor is not None:
+            self.actor.close()
+        self.refill_task = None
+        self.ingest_task = None
+        self.actor = None
+        self.buffer = None
+
+
+class GuildSettingsStore:
+    """autoplay / loop của các guild đã bị evict khỏi RAM (SQLite)."""
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS guild_settings (
+                guild_id INTEGER PRIMARY KEY,
+                autoplay INTEGER NOT NULL,
+                loop TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+    
+    def load(self, guild_id: int) -> tuple[bool, str] | None:
+        row = self.conn.execute(
+            "SELECT autoplay, loop FROM guild_settings WHERE guild_id = ?", (guild_id,)
+        ).fetchone()
+        return (bool(row[0]), row[1]) if row else None
+    
+    def save(self, state: GuildMusicState) -> bool:
+        """False nếu process khác giữ lock quá SQLITE_BUSY_TIMEOUT (không ghi được)."""
+        try:
+            # Setting mặc định thì không cần lưu
+            if state.has_custom_settings:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO guild_settings (guild_id, autoplay, loop) VALUES (?, ?, ?)",
+                    (state.guild_id, int(state.autoplay), state.loop),
+                )
+            else:
+                self.conn.execute("DELETE FROM guild_settings WHERE guild_id = ?", (state.guild_id,))
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            self.conn.rollback()
+            return False
+        return True
+    
+    def delete(self, guild_id: int) -> None:
+        self.conn.execute("DELETE FROM guild_settings WHERE guild_id = ?", (guild_id,))
+        self.conn.commit()
+    
+    def close(self) -> None:
+        self.conn.close()
+
+
+def deep_size(obj, seen: set[int] | None = None) -> int:
+    """Ước lượng số byte của obj và mọi thứ nó giữ (sys.getsizeof đệ quy, mỗi object tính 1 lần)."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, (type, asyncio.Task)) or callable(obj):
+        return 0
+    seen.add(id(obj))
+    
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == "deque":
+        size += sum(deep_size(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool)):
+        if hasattr(obj, "__dict__"):
+            size += deep_size(vars(obj), seen)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += deep_size(getattr(obj, name), seen)
+    return size
+
+
+class GuildRegistry:
+    """
+    Owner of every GuildMusicState.
+    
+    The cog reports lifecycle events: joined (bot connected to voice),
+    disconnected (stop / idle / alone / kicked) and removed (bot left the
+    guild). A state that is not connected is evicted `ttl` seconds after its
+    last use via one timer per guild on the shared wheel, so memory follows
+    the number of active guilds instead of every guild ever seen. Custom
+    settings are spilled to `store` on eviction and read back on next use
+    (without a store they reset to the defaults).
+    """
+    
+    def __init__(
+        self,
+        timers: TimerWheel,
+        ttl: float,
+        store: GuildSettingsStore | None = None,
+        on_evict: Callable[[int], None] | None = None,
+    ):
+        self.timers = timers
+        self.ttl = ttl
+        self.store = store
+        self.on_evict = on_evict
+        self._states: dict[int, GuildMusicState] = {}
+        self.evicted = 0
+    
+    def __len__(self) -> int:
+        return len(self._states)
+    
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._states
+    
+    def get(self, guild_id: int) -> GuildMusicState:
+        """State của guild (tạo mới, đọc setting đã spill nếu có)."""
+        state = self._states.get(guild_id)
+        if state is None:
+            saved = self.store.load(guild_id) if self.store else None
+            state = GuildMusicState(guild_id, *saved) if saved else GuildMusicState(guild_id)
+            self._states[guild_id] = state
+        
+        state.last_active = time.monotonic()
+        if not state.connected:
+            self.timers.arm((guild_id, "evict"), self.ttl, lambda: self.evict(guild_id))
+        return state
+    
+    # ==================== LIFECYCLE ====================
+    
+    def joined(self, guild_id: int) -> GuildMusicState:
+        state = self.get(guild_id)
+        state.connected = True
+        self.timers.cancel((guild_id, "evict"))
+        return state
+    
+    def disconnected(self, guild_id: int) -> None:
+        state = self._states.get(guild_id)
+        if state is None:
+            return
+        
+        state.release()
+        state.connected = False
+        state.last_active = time.monotonic()
+        self.timers.arm((guild_id, "evict"), self.ttl, lambda: self.evict(guild_id))
+    
+    def evict(self, guild_id: int) -> bool:
+        """Bỏ state khỏi RAM (setting được spill xuống disk nếu có store)."""
+        state = self._states.get(guild_id)
+        if state is None or state.connected:
+            return False
+        
+        if self.store and not self.store.save(state):
+            # Chưa spill được setting: giữ state trong RAM, thử lại sau
+            self.timers.arm((guild_id, "evict"), self.ttl, lambda: self.evict(guild_id))
+            logger.warning(f"[STATE] Guild {guild_id}: Database bị khóa, hoãn evict")
+            return False
+        state.release()
+        del self._states[guild_id]
+        self.evicted += 1
+        if self.on_evict:
+            self.on_evict(guild_id)
+        logger.info(f"[STATE] Guild {guild_id}: Evict state (không hoạt động {self.ttl:.0f}s)")
+        return True
+    
+    def removed(self, guild_id: int) -> None:
+        """Bot bị kick / rời guild: bỏ state và setting đã lưu."""
+        self.timers.cancel((guild_id, "evict"))
+        state = self._states.pop(guild_id, None)
+        if state is not None:
+            state.release()
+        if self.store:
+            self.store.delete(guild_id)
+        if self.on_evict:
+            self.on_evict(guild_id)
+    
+    # ==================== REPORT ====================
+    
+    def report(self) -> dict:
+        """Số state trong RAM và ước lượng bộ nhớ (duyệt toàn bộ state, chỉ dùng cho pstats)."""
+        seen: set[int] = set()
+        size = sum(deep_size(state, seen) for state in self._states.values())
+        return {
+            "guilds": len(self._states),
+            "connected": sum(1 for state in self._states.values() if state.connected),
+            "evicted": self.evicted,
+            "bytes": size,
+        }
+    
+    def close(self) -> None:
+        """Spill setting của mọi guild (bot tắt)."""
+        for guild_id in list(self._states):
+            self.timers.cancel((guild_id, "evict"))
+            if self.store:
+                self.store.save(self._states[guild_id])
+        if self.store:
+            self.store.close()
@@ -0,0 +1,213 @@
+"""
+Listening History - Per-guild play log (in-memory anti-repeat window + SQLite)
+"""
+import logging
+import sqlite3
+import time
+from collections import Counter, deque
+from typing import KeysView, NamedTuple
+
+import wavelink
+
+from bot.storage import is_locked
+from bot.timers import TimerWheel
+
+logger = logging.getLogger('history')
+
+# end_reason do bot tự ghi (không phải lý do từ Lavalink)
+END_SUPERSEDED = "superseded"  # Bài khác bắt đầu trước khi nhận track end của bài này
+END_UNMATCHED = "unmatched"  # Track end của một bài không được ghi lúc bắt đầu
+
+
+class HistoryEntry(NamedTuple):
+    track_id: str
+    title: str
+    author: str
+    length: int
+    played_at: float
+    end_reason: str | None  # None = chưa kết thúc (bot tắt giữa bài)
+
+
+class ListeningHistory:
+    """
+    Every track a guild played, with how it ended.
+    
+    The last `window` track ids of each guild are kept in memory (deque for
+    order + Counter for O(1) membership) so anti-repeat checks never touch the
+    disk. Finished plays are buffered and written behind to SQLite in batches:
+    once `flush_batch` rows are pending, or by a timer on the shared wheel at
+    most `flush_interval` seconds after the first pending row. The memory
+    window is rebuilt from disk on first use after a restart.
+    """
+    
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        timers: TimerWheel,
+        window: int,
+        flush_interval: float,
+        flush_batch: int,
+    ):
+        self.conn = conn
+        self.timers = timers
+        self.window = window
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        
+        self._recent: dict[int, deque[str]] = {}
+        self._counts: dict[int, Counter[str]] = {}
+        self._playing: dict[int, tuple] = {}  # guild_id -> row của bài đang phát
+        self._pending: list[tuple] = []  # Rows chờ ghi xuống disk
+        
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history (
+                guild_id INTEGER NOT NULL,
+                track_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                played_at REAL NOT NULL,
+                end_reason TEXT
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS history_guild_played ON history (guild_id, played_at)"
+        )
+        self.conn.commit()
+    
+    # ==================== MEMORY WINDOW ====================
+    
+    def _load_window(self, guild_id: int) -> None:
+        if guild_id in self._recent:
+            return
+        
+        # Rows còn trong buffer cũng thuộc window (guild vừa bị evict rồi quay lại)
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT track_id FROM history WHERE guild_id = ? ORDER BY played_at DESC LIMIT ?",
+            (guild_id, self.window),
+        ).fetchall()
+        self._recent[guild_id] = deque(row[0] for row in reversed(rows))
+        self._counts[guild_id] = Counter(self._recent[guild_id])
+    
+    def _remember(self, guild_id: int, track_id: str) -> None:
+        self._load_window(guild_id)
+        recent = self._recent[guild_id]
+        counts = self._counts[guild_id]
+        
+        recent.append(track_id)
+        counts[track_id] += 1
+        if len(recent) > self.window:
+            oldest = recent.popleft()
+            counts[oldest] -= 1
+            if not counts[oldest]:
+                del counts[oldest]
+    
+    def recent_ids(self, guild_id: int) -> KeysView[str]:
+        """Live, read-only view of the ids in the anti-repeat window (no copy)."""
+        self._load_window(guild_id)
+        return self._counts[guild_id].keys()
+    
+    def is_recent(self, guild_id: int, track_id: str) -> bool:
+        self._load_window(guild_id)
+        return track_id in self._counts[guild_id]
+    
+    def evict(self, guild_id: int) -> None:
+        """Bỏ window của guild khỏi RAM (đọc lại từ disk ở lần dùng sau)."""
+        self._recent.pop(guild_id, None)
+        self._counts.pop(guild_id, None)
+    
+    # ==================== RECORDING ====================
+    
+    @staticmethod
+    def _row(guild_id: int, track: wavelink.Playable) -> tuple:
+        return guild_id, track.identifier, track.title, track.author or "", track.length, time.time()
+    
+    def record_start(self, guild_id: int, track: wavelink.Playable) -> None:
+        """Ghi nhận bài bắt đầu phát (vào anti-repeat window ngay lập tức)."""
+        self._remember(guild_id, track.identifier)
+        unfinished = self._playing.get(guild_id)
+        if unfinished is not None:
+            # Chưa nhận track end của bài trước (event đến muộn / bị mất)
+            self._append(unfinished + (END_SUPERSEDED,))
+        self._playing[guild_id] = self._row(guild_id, track)
+    
+    def record_end(self, guild_id: int, track: wavelink.Playable | None, reason: str) -> None:
+        """Ghi nhận bài kết thúc và lý do (finished, stopped, replaced, loadFailed, ...)."""
+        row = self._playing.get(guild_id)
+        if row is not None and (track is None or row[1] == track.identifier):
+            del self._playing[guild_id]
+            self._append(row + (reason,))
+            return
+        if track is None:
+            return
+        
+        # Bài kết thúc không phải bài đang phát: nếu nó vừa bị ghi `superseded` (track end đến
+        # sau track start của bài mới) thì sửa lại lý do thật, không thì ghi riêng là `unmatched`
+        for index in range(len(self._pending) - 1, -1, -1):
+            pending = self._pending[index]
+            if pending[0] == guild_id and pending[1] == track.identifier and pending[6] == END_SUPERSEDED:
+                self._pending[index] = pending[:6] + (reason,)
+                return
+        self._append(self._row(guild_id, track) + (END_UNMATCHED,))
+    
+    def _append(self, row: tuple) -> None:
+        self._pending.append(row)
+        if len(self._pending) >= self.flush_batch:
+            self.flush()
+        elif ("history", "flush") not in self.timers:
+            self.timers.arm(("history", "flush"), self.flush_interval, self.flush)
+    
+    def flush(self) -> None:
+        """Ghi các rows đang chờ xuống SQLite trong một transaction."""
+        self.timers.cancel(("history", "flush"))
+        if not self._pending:
+            return
+        
+        try:
+            self.conn.executemany(
+                "INSERT INTO history (guild_id, track_id, title, author, length, played_at, end_reason) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            # Process khác đang giữ lock: giữ rows trong buffer, thử lại sau flush_interval
+            self.conn.rollback()
+            self.timers.arm(("history", "flush"), self.flush_interval, self.flush)
+            logger.warning(f"[HISTORY] Database bị khóa, hoãn ghi {len(self._pending)} bài")
+            return
+        self._pending.clear()
+    
+    # ==================== QUERIES ====================
+    
+    def last_tracks(self, guild_id: int, limit: int) -> list[HistoryEntry]:
+        """N bài phát gần nhất của guild, mới nhất trước."""
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT track_id, title, author, length, played_at, end_reason FROM history "
+            "WHERE guild_id = ? ORDER BY played_at DESC LIMIT ?",
+            (guild_id, limit),
+        ).fetchall()
+        return [HistoryEntry(*row) for row in rows]
+    
+    def played_since(self, guild_id: int, hours: float) -> list[HistoryEntry]:
+        """Các bài đã phát trong T giờ qua, mới nhất trước."""
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT track_id, title, author, length, played_at, end_reason FROM history "
+            "WHERE guild_id = ? AND played_at >= ? ORDER BY played_at DESC",
+            (guild_id, time.time() - hours * 3600),
+        ).fetchall()
+        return [HistoryEntry(*row) for row in rows]
+    
+    def close(self) -> None:
+        """Flush buffer (bài đang phát được ghi với end_reason NULL) và đóng kết nối."""
+        self._pending.extend(row + (None,) for row in self._playing.values())
+        self._playing.clear()
+        self.flush()
+        self.conn.close()
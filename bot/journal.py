@@ -0,0 +1,235 @@
+"""
+Session Journal - Append-only log of queue mutations and player state per guild
+"""
+import json
+import logging
+import sqlite3
+import time
+
+from bot.storage import is_locked
+
+logger = logging.getLogger('journal')
+
+
+class SessionJournal:
+    """
+    Crash-safe record of every guild's playback session.
+    
+    Queue mutations and player-state changes are appended as small ops (tracks
+    stored as Lavalink-encoded raw data, so restoring never searches again).
+    Once a guild has `compact_after` ops they are folded into one snapshot.
+    The playback position changes every few seconds, so it lives in its own
+    upserted row instead of growing the log, and is buffered in memory and
+    written for every guild in one transaction by flush_positions().
+    
+    The file is shared by cluster processes. A write that loses the lock
+    (is_locked) is not retried inline: a lost op forces the guild's next
+    write to be a full snapshot, and a lost forget is retried on close.
+    """
+    
+    def __init__(self, conn: sqlite3.Connection, compact_after: int):
+        self.conn = conn
+        self.compact_after = compact_after
+        self._op_counts: dict[int, int] = {}
+        self._unforgotten: set[int] = set()  # Phiên đã kết thúc nhưng chưa xóa được (database bị khóa)
+        self._positions: dict[int, int] = {}  # guild_id -> vị trí (ms) chờ ghi xuống disk
+        
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal_snapshots (
+                guild_id INTEGER PRIMARY KEY,
+                state TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal_ops (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                op TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal_positions (
+                guild_id INTEGER PRIMARY KEY,
+                position INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lavalink_sessions (
+                node TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS journal_ops_guild ON journal_ops (guild_id, seq)")
+        self.conn.commit()
+        
+        for guild_id, count in self.conn.execute("SELECT guild_id, COUNT(*) FROM journal_ops GROUP BY guild_id"):
+            self._op_counts[guild_id] = count
+    
+    # ==================== WRITE ====================
+    
+    def append(self, guild_id: int, op: list) -> None:
+        """
+        Ghi một op:
+            ["insert", index, [raw_data, ...]]
+            ["delete", start, stop]
+            ["set", index, raw_data]
+            ["reset", [raw_data, ...]]
+            ["player", {field: value}]
+        """
+        try:
+            self.conn.execute(
+                "INSERT INTO journal_ops (guild_id, op) VALUES (?, ?)",
+                (guild_id, json.dumps(op)),
+            )
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            self.conn.rollback()
+            # Thiếu một op thì replay không còn đúng → lần ghi sau phải là snapshot
+            self._op_counts[guild_id] = self.compact_after
+            logger.warning(f"[JOURNAL] Guild {guild_id}: Database bị khóa, bỏ op {op[0]} (sẽ ghi snapshot)")
+            return
+        self._op_counts[guild_id] = self._op_counts.get(guild_id, 0) + 1
+    
+    def update_player(self, guild_id: int, **fields) -> None:
+        """Ghi thay đổi state của player (current, loop, autoplay, volume, paused, channels)."""
+        self.append(guild_id, ["player", fields])
+    
+    def save_position(self, guild_id: int, position: int) -> None:
+        """Vị trí phát mới nhất của guild (chỉ trong RAM tới lần flush_positions sau)."""
+        self._positions[guild_id] = position
+    
+    def flush_positions(self) -> None:
+        """Ghi vị trí đang chờ của mọi guild trong một transaction."""
+        if not self._positions:
+            return
+        
+        now = time.time()
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO journal_positions (guild_id, position, updated_at) VALUES (?, ?, ?)",
+                [(guild_id, position, now) for guild_id, position in self._positions.items()],
+            )
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            self.conn.rollback()  # Giữ lại buffer, ghi ở lần flush sau
+            logger.warning(f"[JOURNAL] Database bị khóa, hoãn ghi vị trí của {len(self._positions)} guild")
+            return
+        self._positions.clear()
+    
+    def needs_compaction(self, guild_id: int) -> bool:
+        # Phiên cũ chưa xóa được còn nằm trên disk: phiên mới phải ghi snapshot đè lên
+        return self._op_counts.get(guild_id, 0) >= self.compact_after or guild_id in self._unforgotten
+    
+    def compact(self, guild_id: int, state: dict) -> None:
+        """Thay toàn bộ ops của guild bằng một snapshot (state lấy từ player đang chạy)."""
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO journal_snapshots (guild_id, state) VALUES (?, ?)",
+                    (guild_id, json.dumps(state)),
+                )
+                self.conn.execute("DELETE FROM journal_ops WHERE guild_id = ?", (guild_id,))
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            # Op count giữ nguyên → thử compact lại ở lần ghi sau
+            logger.warning(f"[JOURNAL] Guild {guild_id}: Database bị khóa, hoãn compact")
+            return
+        self._op_counts[guild_id] = 0
+        self._unforgotten.discard(guild_id)  # Snapshot mới đã thay phiên cũ
+    
+    def forget(self, guild_id: int) -> None:
+        """Phiên của guild đã kết thúc (pstop, rời voice) → không restore nữa."""
+        self._op_counts.pop(guild_id, None)
+        self._positions.pop(guild_id, None)
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM journal_snapshots WHERE guild_id = ?", (guild_id,))
+                self.conn.execute("DELETE FROM journal_ops WHERE guild_id = ?", (guild_id,))
+                self.conn.execute("DELETE FROM journal_positions WHERE guild_id = ?", (guild_id,))
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            logger.warning(f"[JOURNAL] Guild {guild_id}: Database bị khóa, xóa phiên lúc tắt bot")
+            self._unforgotten.add(guild_id)
+            return
+        self._unforgotten.discard(guild_id)
+    
+    def save_lavalink_session(self, node: str, session_id: str) -> None:
+        """Session id hiện tại của một Lavalink node (để resume sau khi bot restart)."""
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO lavalink_sessions (node, session_id, updated_at) VALUES (?, ?, ?)",
+                (node, session_id, time.time()),
+            )
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            self.conn.rollback()
+            logger.warning(f"[JOURNAL] {node}: Database bị khóa, không lưu được session id")
+    
+    # ==================== RESTORE ====================
+    
+    def lavalink_sessions(self, max_age: float) -> dict[str, str]:
+        """node -> session id, chỉ các session lưu trong `max_age` giây gần đây (còn resume được)."""
+        rows = self.conn.execute(
+            "SELECT node, session_id FROM lavalink_sessions WHERE updated_at >= ?",
+            (time.time() - max_age,),
+        )
+        return dict(rows.fetchall())
+    
+    def load_all(self) -> dict[int, dict]:
+        """
+        Dựng lại state của mọi guild: snapshot + replay ops theo thứ tự, trong
+        3 câu SELECT (không phụ thuộc số guild hay số bài).
+        """
+        states: dict[int, dict] = {
+            guild_id: json.loads(state)
+            for guild_id, state in self.conn.execute("SELECT guild_id, state FROM journal_snapshots")
+        }
+        
+        for guild_id, op in self.conn.execute("SELECT guild_id, op FROM journal_ops ORDER BY seq"):
+            state = states.setdefault(guild_id, {"queue": []})
+            self._apply(state, json.loads(op))
+        
+        for guild_id, position in self.conn.execute("SELECT guild_id, position FROM journal_positions"):
+            if guild_id in states:
+                states[guild_id]["position"] = position
+        
+        return states
+    
+    @staticmethod
+    def _apply(state: dict, op: list) -> None:
+        kind = op[0]
+        queue = state.setdefault("queue", [])
+        if kind == "insert":
+            queue[op[1]:op[1]] = op[2]
+        elif kind == "delete":
+            del queue[op[1]:op[2]]
+        elif kind == "set":
+            queue[op[1]] = op[2]
+        elif kind == "reset":
+            state["queue"] = op[1]
+        elif kind == "player":
+            state.update(op[1])
+    
+    def close(self) -> None:
+        self.flush_positions()
+        for guild_id in list(self._unforgotten):
+            self.forget(guild_id)
+        self.conn.close()
@@ -3,6 +3,8 @@ Discord Music Bot - Main Entry Point
 """
 import asyncio
 import logging
+import os
+import signal
 import discord
 from discord.ext import commands
 import wavelink
@@ -14,7 +16,20 @@ from bot.config import (
     LAVALINK_PORT,
     LAVALINK_PASSWORD,
     LAVALINK_SSL,
+    LAVALINK_NODES,
+    NODE_STATS_INTERVAL,
+    NODE_DEFICIT_LIMIT,
+    NODE_DEGRADED_CHECKS,
+    LAVALINK_RESUME_TIMEOUT,
+    JOURNAL_COMPACT_AFTER,
+    CLUSTER_STATS_PORT,
+    CLUSTER_STATS_INTERVAL,
 )
+from bot.cluster import StatsReporter, ipc_key
+from bot.journal import SessionJournal
+from bot.nodes import NodeBalancer, parse_nodes
+from bot.player import MusicPlayer
+from bot.storage import open_database
 
 # Setup logging
 logging.basicConfig(
@@ -25,10 +40,21 @@ logging.basicConfig(
 logger = logging.getLogger('bot')
 
 
-class MusicBot(commands.Bot):
-    """Custom bot class with wavelink integration."""
+class MusicBot(commands.AutoShardedBot):
+    """
+    Custom bot class with wavelink integration.
     
-    def __init__(self):
+    Chạy 1 process: mọi shard (số shard do Discord đề xuất). Chạy cluster
+    (run.py, CLUSTER_COUNT > 1): chỉ các shard `shard_ids`, có Lavalink
+    connection và cache riêng, báo stats về launcher.
+    """
+    
+    def __init__(
+        self,
+        shard_ids: list[int] | None = None,
+        shard_count: int | None = None,
+        cluster_id: int | None = None,
+    ):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.voice_states = True
@@ -37,26 +63,113 @@ class MusicBot(commands.Bot):
             command_prefix=self._get_prefix,
             intents=intents,
             case_insensitive=True,  # pPLAY, PPLAY, pplay all work
+            shard_ids=shard_ids,
+            shard_count=shard_count,
         )
+        self.cluster_id = cluster_id
+        self.cluster_stats: StatsReporter | None = None
+        # Chọn node cho player mới / search (MusicPlayer và resolver dùng chung)
+        self.node_balancer = NodeBalancer(self, NODE_STATS_INTERVAL, NODE_DEFICIT_LIMIT, NODE_DEGRADED_CHECKS)
     
     def _get_prefix(self, bot, message: discord.Message) -> list[str]:
         """Return command prefixes (case-insensitive handled by Bot)."""
         return [COMMAND_PREFIX]
     
+    def owns_guild(self, guild_id: int) -> bool:
+        """Guild thuộc shard của process này (luôn True khi chạy 1 process)."""
+        if self.shard_ids is None or not self.shard_count:
+            return True
+        return (guild_id >> 22) % self.shard_count in self.shard_ids
+    
+    def _session_key(self, node_identifier: str) -> str:
+        # Mỗi cluster có session Lavalink riêng trên cùng một node
+        if self.cluster_id is None:
+            return node_identifier
+        return f"{node_identifier}@cluster{self.cluster_id}"
+    
     async def setup_hook(self) -> None:
         """Called when bot is starting up."""
-        # Connect to Lavalink - use https if SSL enabled
-        protocol = "https" if LAVALINK_SSL else "http"
-        node = wavelink.Node(
-            uri=f"{protocol}://{LAVALINK_HOST}:{LAVALINK_PORT}",
-            password=LAVALINK_PASSWORD,
-        )
-        await wavelink.Pool.connect(nodes=[node], client=self, cache_capacity=100)
-        logger.info(f"Connected to Lavalink at {protocol}://{LAVALINK_HOST}:{LAVALINK_PORT}")
+        # Journal queue/player + Lavalink session ids (restore sau khi restart)
+        self.journal = SessionJournal(open_database("journal.db"), JOURNAL_COMPACT_AFTER)
+        
+        # Connect to Lavalink - một hoặc nhiều node (LAVALINK_NODES), use https if SSL enabled
+        specs = parse_nodes(LAVALINK_NODES, LAVALINK_HOST, LAVALINK_PORT, LAVALINK_PASSWORD, LAVALINK_SSL)
+        nodes = [
+            wavelink.Node(
+                identifier=spec.identifier,
+                uri=spec.uri,
+                password=spec.password,
+                resume_timeout=LAVALINK_RESUME_TIMEOUT,
+            )
+            for spec in specs
+        ]
+        # Gửi lại session id cũ: Lavalink giữ nguyên các player đang phát của process trước.
+        # wavelink 3.5 không có tham số / API public cho việc này: Node chỉ gửi header
+        # Session-Id (resume) từ thuộc tính private `_session_id`, nên phải gán trực tiếp.
+        sessions = self.journal.lavalink_sessions(LAVALINK_RESUME_TIMEOUT)
+        for node in nodes:
+            if self._session_key(node.identifier) in sessions:
+                node._session_id = sessions[self._session_key(node.identifier)]
+        await wavelink.Pool.connect(nodes=nodes, client=self, cache_capacity=100)
+        logger.info(f"Connected to Lavalink: {', '.join(spec.uri for spec in specs)}")
+        self.node_balancer.start()
         
         # Load cogs
         await self.load_extension("bot.cogs.music")
         logger.info("Loaded music cog")
+        
+        if self.cluster_id is not None:
+            self.cluster_stats = StatsReporter(
+                self,
+                self.cluster_id,
+                ("127.0.0.1", CLUSTER_STATS_PORT),
+                ipc_key(DISCORD_TOKEN),
+                CLUSTER_STATS_INTERVAL,
+            )
+            self.cluster_stats.start()
+            logger.info(f"Cluster {self.cluster_id}: shards {self.shard_ids} / {self.shard_count}")
+    
+    def _save_sessions(self) -> None:
+        """Lưu lại session id kèm thời điểm tắt: resume_timeout của Lavalink tính từ lúc này."""
+        for node in wavelink.Pool.nodes.values():
+            if node.session_id:
+                self.journal.save_lavalink_session(self._session_key(node.identifier), node.session_id)
+    
+    def _detach_players(self) -> None:
+        """Player trên Lavalink không bị hủy khi tắt bot, process sau resume lại được."""
+        for player in self.voice_clients:
+            if isinstance(player, MusicPlayer):
+                player.detached = True
+    
+    async def close(self) -> None:
+        """Shutdown: journal được flush khi unload cog, player Lavalink được giữ lại."""
+        self.node_balancer.stop()
+        if self.cluster_stats is not None:
+            self.cluster_stats.stop()
+        self._detach_players()
+        if hasattr(self, "journal"):
+            self._save_sessions()
+        await super().close()
+        if hasattr(self, "journal"):
+            self.journal.close()
+    
+    async def handoff(self) -> None:
+        """
+        SIGTERM (docker stop / deploy): flush state rồi thoát ngay, không đóng gateway.
+        
+        Discord bỏ voice state của bot khi gateway đóng sạch (code 1000). Thoát
+        kiểu này giữ bot trong voice, Lavalink tiếp tục phát, và process mới
+        resume session + gắn lại player mà không ngắt tiếng.
+        """
+        logger.info("SIGTERM: flushing state, keeping Lavalink players for the next process")
+        self.node_balancer.stop()
+        self._detach_players()
+        for extension in tuple(self.extensions):
+            await self.unload_extension(extension)
+        self._save_sessions()
+        self.journal.close()
+        logging.shutdown()
+        os._exit(0)
     
     async def on_ready(self):
         """Called when bot is ready."""
@@ -72,7 +185,13 @@ class MusicBot(commands.Bot):
     
     async def on_wavelink_node_ready(self, payload: wavelink.NodeReadyEventPayload):
         """Called when Lavalink node is ready."""
-        logger.info(f"Wavelink node ready: {payload.node.identifier}")
+        logger.info(f"Wavelink node ready: {payload.node.identifier} (resumed: {payload.resumed})")
+        self.journal.save_lavalink_session(self._session_key(payload.node.identifier), payload.session_id)
+    
+    async def on_wavelink_node_disconnected(self, payload: wavelink.NodeDisconnectedEventPayload):
+        """Node mất kết nối → chuyển các player của node đó sang node khác."""
+        logger.warning(f"Wavelink node disconnected: {payload.node.identifier}")
+        await self.node_balancer.evacuate(payload.node)
     
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError):
         """Global error handler."""
@@ -92,13 +211,23 @@ class MusicBot(commands.Bot):
         await ctx.send("❌ Đã xảy ra lỗi. Vui lòng thử lại.")
 
 
-async def main():
-    """Main entry point."""
+async def main(
+    shard_ids: list[int] | None = None,
+    shard_count: int | None = None,
+    cluster_id: int | None = None,
+):
+    """Main entry point (cũng là entry của mỗi worker khi chạy cluster, xem bot/cluster.py)."""
     if not DISCORD_TOKEN:
         logger.error("DISCORD_TOKEN not found in environment!")
         return
     
-    bot = MusicBot()
+    bot = MusicBot(shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id)
+    
+    # docker stop / deploy gửi SIGTERM: flush state và bàn giao player cho process mới
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.handoff()))
+    except NotImplementedError:
+        pass  # Windows (start.bat) không hỗ trợ, Ctrl+C vẫn đi qua bot.close()
     
     async with bot:
         await bot.start(DISCORD_TOKEN)
@@ -0,0 +1,275 @@
+"""
+Lavalink Nodes - Node list from config and load-aware node selection
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections import Counter, deque
+from typing import Iterator, NamedTuple
+
+import aiohttp
+import discord
+import wavelink
+
+logger = logging.getLogger('nodes')
+
+
+class NodeSpec(NamedTuple):
+    identifier: str
+    uri: str
+    password: str
+
+
+def parse_nodes(spec: str, host: str, port: int, password: str, ssl: bool) -> list[NodeSpec]:
+    """
+    Đọc LAVALINK_NODES: danh sách cách nhau bởi dấu phẩy, mỗi node dạng
+    `[http(s)://][password@]host:port`. Rỗng → một node từ LAVALINK_HOST/PORT.
+    
+        LAVALINK_NODES=localhost:2333,localhost:2334,secret@lava2.example.com:443
+    """
+    protocol = "https" if ssl else "http"
+    entries = [entry.strip() for entry in spec.split(",") if entry.strip()]
+    if not entries:
+        return [NodeSpec(f"{host}:{port}", f"{protocol}://{host}:{port}", password)]
+    
+    nodes = []
+    for entry in entries:
+        scheme = protocol
+        if "://" in entry:
+            scheme, entry = entry.split("://", 1)
+        node_password = password
+        if "@" in entry:
+            node_password, entry = entry.rsplit("@", 1)
+        if ":" not in entry:
+            entry = f"{entry}:{443 if scheme == 'https' else 2333}"
+        nodes.append(NodeSpec(entry, f"{scheme}://{entry}", node_password))
+    return nodes
+
+
+def node_penalty(stats: wavelink.StatsResponsePayload) -> float:
+    """
+    Tải của một node theo công thức penalty của Lavalink client: số player đang
+    phát + CPU (tăng theo hàm mũ) + frame thiếu / rỗng trong phút vừa qua.
+    """
+    penalty = stats.playing
+    penalty += 1.05 ** (100 * stats.cpu.system_load) * 10 - 10
+    if stats.frames is not None:
+        penalty += 1.03 ** (500 * (stats.frames.deficit / 3000)) * 600 - 600
+        penalty += (1.03 ** (500 * (stats.frames.nulled / 3000)) * 300 - 300) * 2
+    return penalty
+
+
+class NodeBalancer:
+    """
+    Picks Lavalink nodes: new players go to the connected node with the
+    lowest penalty, searches go to the node with the fewest searches in
+    flight (independent of playback load).
+    
+    Stats are polled every `interval` seconds; players assigned in between
+    count as one extra penalty each so a burst of joins doesn't all land on
+    the same node.
+    
+    Players are moved off a node (wavelink's live switch_node: current track,
+    position, volume, filters and pause state; the queue and the cog's
+    per-guild state stay on the same Player object) when it disconnects, or
+    when it misses more than `deficit_limit` of its audio frames for
+    `degraded_checks` polls in a row.
+    """
+    
+    def __init__(self, client: discord.Client, interval: float, deficit_limit: float, degraded_checks: int):
+        self.client = client
+        self.interval = interval
+        self.deficit_limit = deficit_limit
+        self.degraded_checks = degraded_checks
+        self.penalties: dict[str, float] = {}
+        self._assigned: Counter[str] = Counter()  # Player mới từ lần lấy stats trước
+        self._searching: Counter[str] = Counter()  # Search đang chạy trên mỗi node
+        self.searches: Counter[str] = Counter()  # Tổng số search đã gửi tới mỗi node
+        self._strikes: Counter[str] = Counter()  # Số lần lấy stats liên tiếp node thiếu frame
+        self._evacuating: set[str] = set()
+        self._evacuations: dict[str, asyncio.Task] = {}  # Evacuate do thiếu frame đang chạy
+        self.pinned: dict[int, str] = {}  # guild -> node giữ player từ process trước (session resume)
+        self.migrations: deque[float] = deque(maxlen=100)  # Thời gian (giây) các lần chuyển node gần đây
+        self.failed_migrations = 0
+        self._task: asyncio.Task | None = None
+    
+    @staticmethod
+    def connected_nodes() -> list[wavelink.Node]:
+        return [node for node in wavelink.Pool.nodes.values() if node.status is wavelink.NodeStatus.CONNECTED]
+    
+    # ==================== PLAYBACK ====================
+    
+    def load(self, node: wavelink.Node) -> float:
+        # Node chưa có stats: ước lượng theo số player bot đang giữ trên node đó
+        base = self.penalties.get(node.identifier, len(node.players))
+        return base + self._assigned[node.identifier]
+    
+    def node_for(self, guild_id: int | None) -> wavelink.Node | None:
+        """Node đã giữ player của guild nếu còn kết nối, không thì node nhẹ nhất."""
+        identifier = self.pinned.pop(guild_id, None)
+        node = wavelink.Pool.nodes.get(identifier) if identifier else None
+        if node is not None and node.status is wavelink.NodeStatus.CONNECTED:
+            return node
+        return self.best_node()
+    
+    def best_node(self, exclude: wavelink.Node | None = None) -> wavelink.Node | None:
+        """Node cho player mới (None nếu không node nào đang kết nối)."""
+        nodes = [node for node in self.connected_nodes() if node is not exclude]
+        if not nodes:
+            return None
+        
+        node = min(nodes, key=self.load)
+        self._assigned[node.identifier] += 1
+        return node
+    
+    async def refresh(self) -> None:
+        """Lấy stats của mọi node đang kết nối (song song)."""
+        nodes = self.connected_nodes()
+        results = await asyncio.gather(*(node.fetch_stats() for node in nodes), return_exceptions=True)
+        
+        for node, stats in zip(nodes, results):
+            if isinstance(stats, Exception):
+                logger.warning(f"[NODES] {node.identifier}: Không lấy được stats: {stats}")
+                continue
+            self.penalties[node.identifier] = node_penalty(stats)
+            self._assigned.pop(node.identifier, None)
+            self._check_frames(node, stats)
+        
+        # Node đã mất kết nối không còn được chọn, bỏ số liệu cũ
+        connected = {node.identifier for node in nodes}
+        for identifier in [identifier for identifier in self.penalties if identifier not in connected]:
+            del self.penalties[identifier]
+    
+    def _check_frames(self, node: wavelink.Node, stats: wavelink.StatsResponsePayload) -> None:
+        """Node thiếu frame quá `degraded_checks` lần liên tiếp → chuyển player sang node khác."""
+        # Lavalink gửi 50 frame/giây → 3000 frame mỗi player mỗi phút; deficit là tổng của
+        # mọi player đang phát trên node nên chia theo số player để ra tỉ lệ thiếu thật
+        if stats.frames is None or stats.frames.deficit / (3000 * max(1, stats.playing)) <= self.deficit_limit:
+            self._strikes.pop(node.identifier, None)
+            return
+        
+        self._strikes[node.identifier] += 1
+        logger.warning(
+            f"[NODES] {node.identifier}: Thiếu {stats.frames.deficit} frame/phút "
+            f"({self._strikes[node.identifier]}/{self.degraded_checks})"
+        )
+        if self._strikes[node.identifier] >= self.degraded_checks:
+            self._strikes.pop(node.identifier, None)
+            if node.identifier not in self._evacuations:
+                task = asyncio.create_task(self.evacuate(node))
+                self._evacuations[node.identifier] = task
+                task.add_done_callback(lambda _: self._evacuations.pop(node.identifier, None))
+    
+    # ==================== MIGRATION ====================
+    
+    def players_on(self, node: wavelink.Node) -> list[wavelink.Player]:
+        # Không dùng node.players: wavelink xóa danh sách này khi websocket của node đóng
+        return [
+            player for player in self.client.voice_clients
+            if isinstance(player, wavelink.Player) and player.node.identifier == node.identifier
+        ]
+    
+    async def evacuate(self, node: wavelink.Node) -> None:
+        """Chuyển mọi player đang ở node (mất kết nối / quá tải) sang các node còn lại."""
+        if node.identifier in self._evacuating:
+            return
+        
+        players = self.players_on(node)
+        if not players:
+            return
+        
+        self._evacuating.add(node.identifier)
+        try:
+            logger.warning(f"[MIGRATE] {node.identifier}: Chuyển {len(players)} player sang node khác")
+            await asyncio.gather(*(self.migrate(player, exclude=node) for player in players))
+        finally:
+            self._evacuating.discard(node.identifier)
+    
+    async def migrate(self, player: wavelink.Player, exclude: wavelink.Node) -> bool:
+        """Chuyển một player sang node nhẹ nhất còn lại, thử node tiếp theo nếu thất bại."""
+        guild_id = player.guild.id if player.guild else None
+        started = time.monotonic()
+        tried: set[str] = {exclude.identifier}
+        
+        while True:
+            candidates = [node for node in self.connected_nodes() if node.identifier not in tried]
+            if not candidates:
+                self.failed_migrations += 1
+                logger.error(f"[MIGRATE] Guild {guild_id}: Không còn node nào để chuyển sang")
+                return False
+            
+            target = min(candidates, key=self.load)
+            tried.add(target.identifier)
+            self._assigned[target.identifier] += 1
+            
+            # Bài đang phát được play lại trên node mới: track start đó không phải bài mới
+            if player.current is not None and hasattr(player, "migrating_track"):
+                player.migrating_track = player.current.encoded
+            try:
+                await player.switch_node(target)
+            except (RuntimeError, wavelink.WavelinkException, aiohttp.ClientError) as e:
+                logger.warning(f"[MIGRATE] Guild {guild_id}: Không chuyển được sang {target.identifier}: {e}")
+                if hasattr(player, "migrating_track"):
+                    player.migrating_track = None
+                continue
+            
+            elapsed = time.monotonic() - started
+            self.migrations.append(elapsed)
+            logger.info(
+                f"[MIGRATE] Guild {guild_id}: {exclude.identifier} -> {target.identifier} "
+                f"trong {elapsed:.2f}s (vị trí {player.position // 1000}s, queue {len(player.queue)} bài)"
+            )
+            return True
+    
+    async def _run(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+    
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        for task in self._evacuations.values():
+            task.cancel()
+    
+    # ==================== SEARCH ====================
+    
+    def search_order(self) -> list[wavelink.Node]:
+        """Node để search, ít search đang chạy nhất trước (hòa thì node ít được dùng hơn)."""
+        return sorted(
+            self.connected_nodes(),
+            key=lambda node: (self._searching[node.identifier], self.searches[node.identifier]),
+        )
+    
+    @contextlib.contextmanager
+    def searching(self, node: wavelink.Node) -> Iterator[None]:
+        self._searching[node.identifier] += 1
+        self.searches[node.identifier] += 1
+        try:
+            yield
+        finally:
+            self._searching[node.identifier] -= 1
+    
+    async def search(self, query: str) -> wavelink.Search:
+        """
+        wavelink.Playable.search trên node rảnh nhất; node lỗi kết nối thì thử
+        node tiếp theo.
+        """
+        nodes = self.search_order()
+        if not nodes:
+            return await wavelink.Playable.search(query)
+        
+        for node in nodes[:-1]:
+            try:
+                with self.searching(node):
+                    return await wavelink.Playable.search(query, node=node)
+            except (wavelink.NodeException, aiohttp.ClientError) as e:
+                logger.warning(f"[NODES] {node.identifier}: Search lỗi, thử node khác: {e}")
+        
+        with self.searching(nodes[-1]):
+            return await wavelink.Playable.search(query, node=nodes[-1])
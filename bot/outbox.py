@@ -0,0 +1,183 @@
+"""
+Outbox - Per-channel outbound message scheduler with an edit-in-place now-playing card
+"""
+import asyncio
+import logging
+import time
+from typing import Callable
+
+import discord
+import wavelink
+
+logger = logging.getLogger('outbox')
+
+
+class RouteBucket:
+    """Token bucket for one channel's message route (Discord: ~5 messages / 5s per channel)."""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+    
+    def delay(self) -> float:
+        """Số giây phải chờ trước request tiếp theo (0 = gửi được ngay)."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+    
+    def take(self) -> None:
+        self._tokens -= 1
+
+
+class CardState:
+    """What the now-playing card of a channel should currently show."""
+    
+    __slots__ = ("track", "source", "next_up", "notice", "final")
+    
+    def __init__(self):
+        self.track: wavelink.Playable | None = None
+        self.source: tuple[str, str] | None = None  # (track id, nhãn "🔄 Autoplay ...")
+        self.next_up: tuple[str, wavelink.Playable] | None = None  # (track id đang phát, bài tiếp theo)
+        self.notice: str | None = None
+        self.final = False  # Phiên kết thúc: lần gửi sau là message mới
+
+
+class ChannelOutbox:
+    """
+    Pending notifications of one text channel, merged into a single card.
+    
+    Updates only change `state` and wake the worker; the worker renders the
+    latest state once per bucket token, so several notifications that arrive
+    while it waits cost one request. The card is edited in place while it is
+    still the last message of the channel, otherwise a new one is sent.
+    """
+    
+    def __init__(self, channel: discord.abc.Messageable, render: Callable, bucket: RouteBucket):
+        self.channel = channel
+        self.render = render
+        self.bucket = bucket
+        self.state = CardState()
+        self.message: discord.Message | None = None
+        self.sent = 0
+        self.edited = 0
+        self._dirty = asyncio.Event()
+        self._task: asyncio.Task | None = None
+    
+    def touch(self) -> None:
+        self._dirty.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self) -> None:
+        while self._dirty.is_set():
+            delay = self.bucket.delay()
+            if delay:
+                # Chờ token, các update tới trong lúc này được gộp vào lần gửi sau
+                await asyncio.sleep(delay)
+                continue
+            self._dirty.clear()
+            self.bucket.take()
+            await self._flush()
+    
+    async def _flush(self) -> None:
+        content, embed = self.render(self.state)
+        final = self.state.final
+        try:
+            # Card còn là message cuối của channel → sửa tại chỗ, không thì gửi card mới
+            if self.message is not None and getattr(self.channel, "last_message_id", None) == self.message.id:
+                try:
+                    await self.message.edit(content=content, embed=embed)
+                    self.edited += 1
+                except discord.NotFound:
+                    self.message = None
+            else:
+                self.message = None
+            if self.message is None:
+                self.message = await self.channel.send(content=content, embed=embed)
+                self.sent += 1
+        except discord.HTTPException as e:
+            logger.warning(f"[OUTBOX] Channel {getattr(self.channel, 'id', '?')}: Gửi thất bại: {e}")
+            return
+        
+        if final:
+            # Card cũ giữ nguyên thông báo cuối, phiên sau bắt đầu card mới
+            self.message = None
+            if self.state.final:
+                self.state = CardState()
+    
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+class Outbox:
+    """All channel outboxes; the cog calls these instead of awaiting channel.send."""
+    
+    def __init__(self, render: Callable, rate: float, burst: int):
+        self.render = render
+        self.rate = rate
+        self.burst = burst
+        self._channels: dict[int, ChannelOutbox] = {}
+        self._sent = 0  # Của các outbox đã bỏ
+        self._edited = 0
+    
+    def _outbox(self, channel: discord.abc.Messageable) -> ChannelOutbox:
+        outbox = self._channels.get(channel.id)
+        if outbox is None:
+            outbox = ChannelOutbox(channel, self.render, RouteBucket(self.rate, self.burst))
+            self._channels[channel.id] = outbox
+        outbox.channel = channel
+        return outbox
+    
+    def track(self, channel: discord.abc.Messageable, track: wavelink.Playable) -> None:
+        """Bài mới bắt đầu phát."""
+        outbox = self._outbox(channel)
+        outbox.state.track = track
+        outbox.state.notice = None
+        outbox.state.final = False
+        outbox.touch()
+    
+    def source(self, channel: discord.abc.Messageable, track: wavelink.Playable, label: str) -> None:
+        """Nguồn của bài (vd. "🔄 Autoplay (YouTube Mix)"), có thể tới trước hoặc sau track start."""
+        outbox = self._outbox(channel)
+        outbox.state.source = (track.identifier, label)
+        outbox.touch()
+    
+    def next_up(self, channel: discord.abc.Messageable, current: wavelink.Playable, track: wavelink.Playable) -> None:
+        """Bài autoplay sẽ phát sau `current`."""
+        outbox = self._outbox(channel)
+        outbox.state.next_up = (current.identifier, track)
+        outbox.touch()
+    
+    def notice(self, channel: discord.abc.Messageable, text: str, final: bool = False) -> None:
+        """Thông báo ngắn trên card; final=True khi bot rời voice (card sau là message mới)."""
+        outbox = self._outbox(channel)
+        outbox.state.notice = text
+        outbox.state.final = final
+        outbox.touch()
+    
+    def forget_guild(self, guild_id: int) -> None:
+        """Bỏ outbox (card + message cuối) của mọi channel trong guild (state của guild bị evict)."""
+        for channel_id, outbox in list(self._channels.items()):
+            guild = getattr(outbox.channel, "guild", None)
+            if guild is not None and guild.id == guild_id:
+                outbox.cancel()
+                self._sent += outbox.sent
+                self._edited += outbox.edited
+                del self._channels[channel_id]
+    
+    def stats(self) -> dict[str, int]:
+        return {
+            "channels": len(self._channels),
+            "sent": self._sent + sum(outbox.sent for outbox in self._channels.values()),
+            "edited": self._edited + sum(outbox.edited for outbox in self._channels.values()),
+        }
+    
+    def close(self) -> None:
+        for outbox in self._channels.values():
+            outbox.cancel()
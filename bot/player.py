@@ -0,0 +1,54 @@
+"""
+Music Player - wavelink.Player using the bot's indexed queue
+"""
+import time
+
+import discord
+import wavelink
+from discord.utils import MISSING
+
+from bot.queues import IndexedQueue
+
+
+class MusicPlayer(wavelink.Player):
+    """
+    wavelink.Player whose queue supports O(log n) remove / jump / move, placed
+    on the least loaded Lavalink node (bot.nodes.NodeBalancer of the client).
+    
+    A player marked `detached` (bot shutting down for a redeploy) leaves the
+    Lavalink player running on disconnect so the next process can resume it.
+    """
+    
+    def __init__(
+        self,
+        client: discord.Client = MISSING,
+        channel: discord.abc.Connectable = MISSING,
+        *,
+        nodes: list[wavelink.Node] | None = None,
+    ):
+        balancer = getattr(client, "node_balancer", None)
+        if not nodes and balancer is not None:
+            node = balancer.node_for(channel.guild.id if channel is not MISSING else None)
+            nodes = [node] if node else None
+        super().__init__(client, channel, nodes=nodes)
+        self.queue = IndexedQueue()
+        # Encoded của bài được play lại khi chuyển node (track start của nó không phải bài mới)
+        self.migrating_track: str | None = None
+        self.detached = False
+    
+    def adopt(self, info: wavelink.PlayerResponsePayload) -> None:
+        """Nhận state của player Lavalink vẫn đang phát từ process trước (session resume)."""
+        self._current = info.track
+        self._original = info.track
+        self._volume = info.volume
+        self._paused = info.paused
+        self._filters = info.filters
+        self._last_position = info.state.position
+        self._last_update = time.monotonic_ns()
+    
+    async def disconnect(self, **kwargs) -> None:
+        if self.detached:
+            # Chỉ bỏ phía Python, player trên Lavalink tiếp tục phát chờ process mới resume
+            self.cleanup()
+            return
+        await super().disconnect(**kwargs)
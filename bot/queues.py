@@ -0,0 +1,387 @@
+"""
+Indexed Queue - wavelink.Queue backed by a chunked list with a Fenwick index
+"""
+import itertools
+import random
+from collections import Counter
+from typing import Callable, Iterable, Iterator
+
+import wavelink
+
+from bot.config import QUEUE_PAGE_SIZE
+
+
+class TrackRope:
+    """
+    List-like sequence of tracks stored as a list of small blocks.
+    
+    A Fenwick tree over the block lengths maps a global index to
+    (block, offset) in O(log n), so indexed get/insert/delete only touch one
+    block of at most 2 * LOAD items instead of shifting the whole list. The
+    total duration and per-source counts are kept up to date on every
+    mutation, and `on_change(index)` is called with the first index whose
+    track changed (everything after it may have shifted). When set,
+    `on_record(op)` receives every mutation as a replayable op:
+    ("insert", index, tracks), ("delete", start, stop), ("set", index, track)
+    or ("reset", tracks).
+    
+    Implements the subset of the list API that wavelink.Queue uses on `_items`.
+    """
+    
+    LOAD = 64  # Kích thước block mục tiêu; block > 2 * LOAD sẽ bị tách đôi
+    
+    def __init__(self, items: Iterable[wavelink.Playable] = ()):
+        self.on_change: Callable[[int], None] | None = None
+        self.on_record: Callable[[tuple], None] | None = None
+        self._build(list(items))
+    
+    def _build(self, items: list[wavelink.Playable]) -> None:
+        self._blocks = [items[i:i + self.LOAD] for i in range(0, len(items), self.LOAD)]
+        self.total_length = 0
+        self.sources: Counter[str] = Counter()
+        self._count(items, 1)
+        self._reindex()
+        self._changed(0)
+        self._record(("reset", items))
+    
+    def _count(self, tracks: Iterable[wavelink.Playable], sign: int) -> None:
+        """Cập nhật tổng thời lượng và số bài theo nguồn (sign = 1 thêm, -1 bớt)."""
+        for track in tracks:
+            self.total_length += sign * track.length
+            self.sources[track.source] += sign
+            if not self.sources[track.source]:
+                del self.sources[track.source]
+    
+    def _changed(self, index: int) -> None:
+        if self.on_change is not None:
+            self.on_change(index)
+    
+    def _record(self, op: tuple) -> None:
+        if self.on_record is not None:
+            self.on_record(op)
+    
+    def _reindex(self) -> None:
+        """Dựng lại Fenwick tree (O(số block), chỉ khi tách/xóa block)."""
+        count = len(self._blocks)
+        tree = [0] * (count + 1)
+        for i, block in enumerate(self._blocks, start=1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent <= count:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._len = sum(len(block) for block in self._blocks)
+    
+    def _tree_add(self, block_index: int, delta: int) -> None:
+        i = block_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+        self._len += delta
+    
+    def _locate(self, index: int) -> tuple[int, int]:
+        """(block, offset) của phần tử thứ index (0 <= index < len)."""
+        pos = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= index:
+                pos = nxt
+                index -= self._tree[nxt]
+            step >>= 1
+        return pos, index
+    
+    def _normalize(self, index: int) -> int:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("queue index out of range")
+        return index
+    
+    # ==================== READ ====================
+    
+    def __len__(self) -> int:
+        return self._len
+    
+    def __bool__(self) -> bool:
+        return self._len > 0
+    
+    def __iter__(self) -> Iterator[wavelink.Playable]:
+        return itertools.chain.from_iterable(self._blocks)
+    
+    def __reversed__(self) -> Iterator[wavelink.Playable]:
+        return itertools.chain.from_iterable(reversed(block) for block in reversed(self._blocks))
+    
+    def __contains__(self, item: object) -> bool:
+        return any(item in block for block in self._blocks)
+    
+    def __getitem__(self, index: int | slice):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return list(self)[index]
+            if start >= stop:
+                return []
+            block, offset = self._locate(start)
+            tail = itertools.chain(
+                self._blocks[block][offset:],
+                itertools.chain.from_iterable(self._blocks[block + 1:]),
+            )
+            return list(itertools.islice(tail, stop - start))
+        
+        block, offset = self._locate(self._normalize(index))
+        return self._blocks[block][offset]
+    
+    def index(self, item: wavelink.Playable) -> int:
+        for i, track in enumerate(self):
+            if track == item:
+                return i
+        raise ValueError(f"{item!r} is not in queue")
+    
+    # ==================== WRITE ====================
+    
+    def __setitem__(self, index: int, value: wavelink.Playable) -> None:
+        index = self._normalize(index)
+        block, offset = self._locate(index)
+        self._count((self._blocks[block][offset],), -1)
+        self._count((value,), 1)
+        self._blocks[block][offset] = value
+        self._changed(index)
+        self._record(("set", index, value))
+    
+    def __delitem__(self, index: int | slice) -> None:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                items = list(self)
+                del items[index]
+                self._build(items)
+                return
+            self._delete_range(start, stop)
+            return
+        self.pop(index)
+    
+    def _delete_range(self, start: int, stop: int) -> None:
+        """Xóa [start, stop): các block nằm trọn trong khoảng bị bỏ nguyên khối."""
+        if start >= stop:
+            return
+        
+        first, first_offset = self._locate(start)
+        last, last_offset = self._locate(stop - 1)
+        if first == last:
+            removed = self._blocks[first][first_offset:last_offset + 1]
+            del self._blocks[first][first_offset:last_offset + 1]
+        else:
+            removed = self._blocks[first][first_offset:]
+            for block in self._blocks[first + 1:last]:
+                removed.extend(block)
+            removed.extend(self._blocks[last][:last_offset + 1])
+            del self._blocks[first][first_offset:]
+            del self._blocks[last][:last_offset + 1]
+            del self._blocks[first + 1:last]
+        
+        self._count(removed, -1)
+        self._blocks = [block for block in self._blocks if block]
+        self._reindex()
+        self._changed(start)
+        self._record(("delete", start, stop))
+    
+    def insert(self, index: int, item: wavelink.Playable) -> None:
+        # Giống list.insert: index ngoài khoảng thì kẹp về đầu/cuối
+        if index < 0:
+            index = max(0, index + self._len)
+        index = min(index, self._len)
+        
+        self._count((item,), 1)
+        if not self._blocks:
+            self._blocks.append([item])
+            self._reindex()
+            self._changed(0)
+            self._record(("insert", 0, [item]))
+            return
+        
+        if index == self._len:
+            block, offset = len(self._blocks) - 1, len(self._blocks[-1])
+        else:
+            block, offset = self._locate(index)
+        
+        self._blocks[block].insert(offset, item)
+        if len(self._blocks[block]) > 2 * self.LOAD:
+            half = len(self._blocks[block]) // 2
+            self._blocks[block:block + 1] = [self._blocks[block][:half], self._blocks[block][half:]]
+            self._reindex()
+        else:
+            self._tree_add(block, 1)
+        self._changed(index)
+        self._record(("insert", index, [item]))
+    
+    def append(self, item: wavelink.Playable) -> None:
+        self.insert(self._len, item)
+    
+    def extend(self, items: Iterable[wavelink.Playable]) -> None:
+        items = list(items)
+        if not items:
+            return
+        
+        start = self._len
+        self._count(items, 1)
+        rest = items
+        if self._blocks and len(self._blocks[-1]) < self.LOAD:
+            room = self.LOAD - len(self._blocks[-1])
+            self._blocks[-1].extend(items[:room])
+            rest = items[room:]
+        self._blocks.extend(rest[i:i + self.LOAD] for i in range(0, len(rest), self.LOAD))
+        self._reindex()
+        self._changed(start)
+        self._record(("insert", start, items))
+    
+    def pop(self, index: int = -1) -> wavelink.Playable:
+        index = self._normalize(index)
+        block, offset = self._locate(index)
+        item = self._blocks[block].pop(offset)
+        self._count((item,), -1)
+        if self._blocks[block]:
+            self._tree_add(block, -1)
+        else:
+            del self._blocks[block]
+            self._reindex()
+        self._changed(index)
+        self._record(("delete", index, index + 1))
+        return item
+    
+    def remove(self, item: wavelink.Playable) -> None:
+        self.pop(self.index(item))
+    
+    def move(self, source: int, destination: int) -> wavelink.Playable:
+        """Chuyển track ở vị trí source tới vị trí destination."""
+        item = self.pop(source)
+        self.insert(destination, item)
+        return item
+    
+    def shuffle(self) -> None:
+        items = list(self)
+        random.shuffle(items)
+        self._build(items)
+    
+    def clear(self) -> None:
+        self._build([])
+    
+    def copy(self) -> "TrackRope":
+        return TrackRope(self)
+
+
+class PageCache:
+    """Rendered page bodies of a queue, keyed by 1-based page number."""
+    
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self._pages: dict[int, str] = {}
+    
+    def __len__(self) -> int:
+        return len(self._pages)
+    
+    def get(self, page: int) -> str | None:
+        return self._pages.get(page)
+    
+    def put(self, page: int, body: str) -> None:
+        self._pages[page] = body
+    
+    def invalidate(self, index: int) -> None:
+        """Bỏ các trang từ trang chứa vị trí index trở đi (các trang trước không đổi)."""
+        first_page = index // self.page_size + 1
+        for page in [page for page in self._pages if page >= first_page]:
+            del self._pages[page]
+    
+    def page_count(self, size: int) -> int:
+        """Số trang cho queue có `size` bài (ít nhất 1)."""
+        return max(1, -(-size // self.page_size))
+    
+    def clamp(self, page: int, size: int) -> int:
+        return min(max(page, 1), self.page_count(size))
+
+
+class IndexedQueue(wavelink.Queue):
+    """
+    wavelink.Queue with O(log n) indexed remove / jump / move and a running
+    total duration. Everything wavelink itself calls keeps working unchanged.
+    """
+    
+    def __init__(self, *, history: bool = True):
+        super().__init__(history=history)
+        self._items = TrackRope()
+        # Page body đã render (pqueue), bị xóa từ trang chứa vị trí đầu tiên thay đổi
+        self.pages = PageCache(QUEUE_PAGE_SIZE)
+        self._items.on_change = self.pages.invalidate
+        # Ghi lại mọi thay đổi của queue (bot.journal); cog gán khi tạo player
+        self.journal: Callable[[list], None] | None = None
+        self._items.on_record = self._journal_op
+    
+    def _journal_op(self, op: tuple) -> None:
+        """Chuyển op của TrackRope sang dạng JSON được (track -> raw_data của Lavalink)."""
+        if self.journal is None:
+            return
+        kind = op[0]
+        if kind == "insert":
+            self.journal([kind, op[1], [track.raw_data for track in op[2]]])
+        elif kind == "set":
+            self.journal([kind, op[1], op[2].raw_data])
+        elif kind == "reset":
+            self.journal([kind, [track.raw_data for track in op[1]]])
+        else:
+            self.journal(list(op))
+    
+    @property
+    def total_length(self) -> int:
+        """Tổng thời lượng (ms) các bài trong queue."""
+        return self._items.total_length
+    
+    @property
+    def sources(self) -> Counter[str]:
+        """Số bài theo nguồn (youtube, soundcloud, ...)."""
+        return self._items.sources
+    
+    def remove_at(self, index: int, /) -> wavelink.Playable:
+        """Xóa và trả về track ở vị trí index (không đổi `loaded` như get_at)."""
+        return self._items.pop(index)
+    
+    def jump(self, index: int, /) -> wavelink.Playable:
+        """Bỏ các track trước index và lấy ra track ở index."""
+        del self._items[:index]
+        return self._items.pop(0)
+    
+    def move(self, source: int, destination: int, /) -> wavelink.Playable:
+        return self._items.move(source, destination)
+    
+    def shuffle(self) -> None:
+        self._items.shuffle()
+    
+    def copy(self) -> "IndexedQueue":
+        copy_queue = IndexedQueue(history=self.history is not None)
+        copy_queue._items.extend(self._items)
+        return copy_queue
+
+
+class PlaylistProgress:
+    """Running counters of a playlist being added to the queue batch by batch."""
+    
+    def __init__(self, name: str, total: int, playing: bool):
+        self.name = name
+        self.total = total
+        self.playing = playing  # True nếu playlist bắt đầu phát ngay (không chỉ thêm vào queue)
+        self.processed = 0
+        self.added = 0
+        self.total_length = 0
+    
+    @property
+    def skipped(self) -> int:
+        return self.processed - self.added
+    
+    @property
+    def done(self) -> bool:
+        return self.processed >= self.total
+    
+    def add(self, tracks: list[wavelink.Playable], seen: int) -> None:
+        """Ghi nhận một batch: `seen` bài đã xét, `tracks` là các bài hợp lệ đã vào queue."""
+        self.processed += seen
+        self.added += len(tracks)
+        self.total_length += sum(track.length for track in tracks)
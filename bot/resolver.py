@@ -0,0 +1,123 @@
+"""
+Track Resolver - Single entry point for all Lavalink track lookups
+"""
+import asyncio
+import contextlib
+import logging
+
+import wavelink
+
+from bot.cache import ResolveCache, encode_result, decode_result
+from bot.nodes import NodeBalancer
+from bot.scheduler import Priority, SearchJob, SearchScheduler
+
+logger = logging.getLogger('resolver')
+
+
+def query_kind(query: str) -> str:
+    """Classify a query so each kind gets its own cache TTL."""
+    if "list=RD" in query:
+        return "mix"
+    if query.startswith(("http://", "https://")):
+        return "url"
+    return "search"
+
+
+class TrackResolver:
+    """
+    Wraps wavelink.Playable.search with the resolve cache and single-flight
+    coalescing: identical lookups that are already in flight share one request.
+    Requests that do reach Lavalink wait for a slot from `scheduler` (priority
+    + concurrency cap) and are spread over the nodes by `nodes`.
+    """
+
+    def __init__(
+        self,
+        cache: ResolveCache,
+        nodes: NodeBalancer | None = None,
+        scheduler: SearchScheduler | None = None,
+    ):
+        self.cache = cache
+        self.nodes = nodes
+        self.scheduler = scheduler
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._jobs: dict[str, SearchJob] = {}  # Job của request đang chờ / đang chạy
+        self._waiters: dict[str, int] = {}  # Số caller đang chờ mỗi request
+        self.coalesced = 0  # Số request được gộp vào request đang chạy
+
+    async def search(
+        self,
+        query: str,
+        priority: Priority = Priority.INTERACTIVE,
+        guild_id: int | None = None,
+        deadline: float | None = None,
+    ) -> wavelink.Search:
+        """
+        Resolve a query, serving it from cache or an in-flight request when possible.
+        Cache miss → chờ slot theo `priority`; `deadline` (giây) chỉ dùng cho
+        prefetch: chờ quá lâu thì raise SearchExpired thay vì gửi request đã cũ.
+        """
+        kind = query_kind(query)
+
+        payload = self.cache.get(kind, query)
+        if payload is not None:
+            logger.debug(f"[CACHE_HIT] {kind}: {query}")
+            return decode_result(payload)
+
+        task = self._inflight.get(query)
+        if task is not None:
+            self.coalesced += 1
+            logger.debug(f"[COALESCED] {kind}: {query}")
+            # Caller gấp hơn gộp vào request đang xếp hàng → request được nâng priority
+            job = self._jobs.get(query)
+            if job is not None:
+                self.scheduler.promote(job, priority, deadline)
+        else:
+            job = self.scheduler.job(priority, guild_id, deadline) if self.scheduler else None
+            task = asyncio.create_task(self._fetch(kind, query, job))
+            self._inflight[query] = task
+            if job is not None:
+                self._jobs[query] = job
+            task.add_done_callback(lambda done: self._forget(query, done))
+
+        # shield: một caller bị cancel không được hủy request của các caller khác
+        self._waiters[query] = self._waiters.get(query, 0) + 1
+        try:
+            payload = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Caller cuối cùng bỏ đi → hủy luôn request Lavalink
+            if self._waiters[query] == 1 and not task.done():
+                task.cancel()
+                # Bỏ ngay: caller tới sau (trước khi done-callback chạy) không được gộp vào task đã hủy
+                self._forget(query, task)
+            raise
+        finally:
+            self._waiters[query] -= 1
+            if not self._waiters[query]:
+                del self._waiters[query]
+
+        if payload is None:
+            return []
+        # Mỗi caller nhận object riêng, không share Playable giữa các guild
+        return decode_result(payload)
+
+    def _forget(self, query: str, task: asyncio.Task) -> None:
+        # Query có thể đã có request mới (request cũ bị hủy): chỉ bỏ entry của chính task này
+        if self._inflight.get(query) is task:
+            del self._inflight[query]
+            self._jobs.pop(query, None)
+
+    async def _fetch(self, kind: str, query: str, job: SearchJob | None) -> dict | None:
+        async with self.scheduler.slot(job) if job is not None else contextlib.nullcontext():
+            if self.nodes is not None:
+                results = await self.nodes.search(query)
+            else:
+                results = await wavelink.Playable.search(query)
+
+        # Chỉ cache kết quả có bài, kết quả rỗng có thể do lỗi tạm thời
+        if not results:
+            return None
+
+        payload = encode_result(results)
+        self.cache.put(kind, query, payload)
+        return payload
@@ -0,0 +1,173 @@
+"""
+Search Scheduler - Priority classes, a global concurrency cap and per-guild fairness for Lavalink lookups
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from enum import IntEnum
+from typing import AsyncIterator
+
+logger = logging.getLogger('scheduler')
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # User đang chờ (pplay)
+    AUTOPLAY = 1  # Không có gì đang phát, autoplay cần bài ngay
+    PREFETCH = 2  # Chuẩn bị trước cho bài sau (có deadline)
+
+
+class SearchExpired(Exception):
+    """Job prefetch chờ quá deadline, bị bỏ trước khi gửi tới Lavalink."""
+
+
+class SearchJob:
+    __slots__ = ("priority", "guild_id", "deadline", "future")
+    
+    def __init__(self, priority: Priority, guild_id: int | None, deadline: float | None):
+        self.priority = priority
+        self.guild_id = guild_id
+        self.deadline = deadline  # time.monotonic(), None = không hết hạn
+        self.future: asyncio.Future | None = None  # Done khi được cấp slot
+
+
+class SearchScheduler:
+    """
+    Admission control in front of every Lavalink REST lookup that misses the
+    resolve cache.
+    
+    At most `limit` lookups run at once; `reserve` of those slots are kept for
+    interactive searches so background work can never fill the node. Waiting
+    jobs are served by priority class, and round-robin by guild inside a
+    class, so one guild's autoplay storm doesn't delay another guild's.
+    Prefetch jobs carry a deadline and are dropped (SearchExpired) if they
+    are still waiting when it passes. A job can be promoted while it waits
+    (an interactive caller coalesced onto a prefetch request).
+    """
+    
+    def __init__(self, limit: int, reserve: int):
+        self.limit = limit
+        self.reserve = min(reserve, limit - 1)
+        self.active = 0
+        self._queues: list[OrderedDict[int | None, deque[SearchJob]]] = [OrderedDict() for _ in Priority]
+        self.granted: Counter[str] = Counter()
+        self.expired = 0
+    
+    def job(self, priority: Priority, guild_id: int | None = None, deadline: float | None = None) -> SearchJob:
+        """Job mới; `deadline` là số giây tối đa được chờ slot."""
+        return SearchJob(priority, guild_id, time.monotonic() + deadline if deadline is not None else None)
+    
+    def _capacity(self, priority: Priority) -> int:
+        return self.limit if priority is Priority.INTERACTIVE else self.limit - self.reserve
+    
+    # ==================== ACQUIRE / RELEASE ====================
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, job: SearchJob) -> AsyncIterator[None]:
+        await self._acquire(job)
+        try:
+            yield
+        finally:
+            self._release()
+    
+    async def _acquire(self, job: SearchJob) -> None:
+        job.future = asyncio.get_running_loop().create_future()
+        self._enqueue(job)
+        self._dispatch()  # Còn slot và không ai xếp trước → được cấp ngay
+        while not job.future.done():
+            timeout = job.deadline - time.monotonic() if job.deadline is not None else None
+            try:
+                await asyncio.wait_for(asyncio.shield(job.future), timeout)
+            except asyncio.TimeoutError:
+                # Deadline có thể đã bị bỏ (job được promote) trong lúc chờ
+                if job.deadline is not None and time.monotonic() >= job.deadline and not job.future.done():
+                    self._expire(job)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                elif not job.future.cancelled() and job.future.exception() is None:
+                    # Slot đã được cấp nhưng caller bị hủy → trả lại slot
+                    self._release()
+                raise
+        job.future.result()  # SearchExpired nếu job bị bỏ
+    
+    def _grant(self, job: SearchJob) -> None:
+        self.active += 1
+        self.granted[job.priority.name.lower()] += 1
+        job.future.set_result(None)
+    
+    def _expire(self, job: SearchJob) -> None:
+        self.expired += 1
+        job.future.set_exception(SearchExpired(f"Guild {job.guild_id}: chờ slot quá deadline"))
+    
+    def _release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+    
+    # ==================== QUEUE ====================
+    
+    def _enqueue(self, job: SearchJob) -> None:
+        queue = self._queues[job.priority]
+        jobs = queue.get(job.guild_id)
+        if jobs is None:
+            jobs = queue[job.guild_id] = deque()
+        jobs.append(job)
+    
+    def promote(self, job: SearchJob, priority: Priority, deadline: float | None) -> None:
+        """Caller mới gộp vào job: nâng priority và nới deadline theo caller gấp nhất."""
+        if deadline is None:
+            job.deadline = None
+        elif job.deadline is not None:
+            job.deadline = max(job.deadline, time.monotonic() + deadline)
+        
+        if priority < job.priority:
+            job.priority = priority
+            # Entry cũ ở class thấp hơn bị bỏ qua khi dispatch (priority không khớp)
+            if job.future is not None and not job.future.done():
+                self._enqueue(job)
+                self._dispatch()
+    
+    def _next(self, priority: Priority) -> SearchJob | None:
+        """Job kế tiếp của một class, xoay vòng giữa các guild."""
+        queue = self._queues[priority]
+        now = time.monotonic()
+        while queue:
+            guild_id, jobs = next(iter(queue.items()))
+            job = jobs.popleft()
+            if jobs:
+                queue.move_to_end(guild_id)
+            else:
+                del queue[guild_id]
+            
+            if job.future.done() or job.priority != priority:
+                continue  # Caller đã bỏ / job đã chuyển class
+            if job.deadline is not None and now >= job.deadline:
+                self._expire(job)
+                continue
+            return job
+        return None
+    
+    def _dispatch(self) -> None:
+        for priority in Priority:
+            while self.active < self._capacity(priority):
+                job = self._next(priority)
+                if job is None:
+                    break
+                self._grant(job)
+    
+    def stats(self) -> dict:
+        waiting = {
+            priority.name.lower(): sum(
+                1 for jobs in self._queues[priority].values() for job in jobs
+                if not job.future.done() and job.priority == priority
+            )
+            for priority in Priority
+        }
+        return {
+            "active": self.active,
+            "limit": self.limit,
+            "waiting": waiting,
+            "granted": dict(self.granted),
+            "expired": self.expired,
+        }
@@ -0,0 +1,116 @@
+"""
+Candidate Scoring - Vectorized batch scoring for autoplay ranking
+"""
+import numpy as np
+import wavelink
+
+from bot.config import SCORE_WEIGHTS
+from bot.diversity import ChannelWindow, channel_key
+from bot.features import track_features
+from bot.taste import MASK_BITS, TasteProfile
+
+# Popcount lookup cho bitmask genre/language (tối đa 16 bit)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(1 << MASK_BITS)], dtype=np.float64)
+_BIT_SHIFTS = np.arange(MASK_BITS, dtype=np.uint16)
+
+
+class CandidateVectors:
+    """Column arrays (one entry per candidate) fed to score_batch."""
+    
+    __slots__ = ("tracks", "features", "genres", "languages", "channels", "durations", "relatedness")
+    
+    def __init__(self, tracks: list[wavelink.Playable], relatedness: list[float] | None = None):
+        count = len(tracks)
+        features = [track_features(track) for track in tracks]
+        
+        self.tracks = tracks
+        self.features = features
+        self.genres = np.fromiter((f.genres for f in features), dtype=np.uint16, count=count)
+        self.languages = np.fromiter((f.languages for f in features), dtype=np.uint16, count=count)
+        self.channels = np.fromiter((hash(channel_key(track.author)) for track in tracks), dtype=np.int64, count=count)
+        self.durations = np.fromiter((track.length for track in tracks), dtype=np.float64, count=count)
+        self.relatedness = (
+            np.zeros(count) if relatedness is None
+            else np.asarray(relatedness, dtype=np.float64)
+        )
+
+
+def _mask_affinity(masks: np.ndarray, bit_weights: list[float]) -> np.ndarray:
+    """Tổng trọng số các bit đang bật của mỗi mask."""
+    bits = (masks[:, None] >> _BIT_SHIFTS) & 1
+    return bits @ np.asarray(bit_weights, dtype=np.float64)
+
+
+def score_batch(
+    seed: wavelink.Playable,
+    vectors: CandidateVectors,
+    weights: dict[str, float] = SCORE_WEIGHTS,
+    profile: TasteProfile | None = None,
+    channels: ChannelWindow | None = None,
+) -> np.ndarray:
+    """Score every candidate against the seed track (and the guild's taste profile) in one NumPy pass."""
+    source = track_features(seed)
+    
+    # Thể loại / ngôn ngữ chung: popcount của AND bitmask
+    scores = _POPCOUNT[vectors.genres & source.genres] * weights["genre"]
+    scores += _POPCOUNT[vectors.languages & source.languages] * weights["language"]
+    
+    # Đa dạng kênh: phạt theo số bài của kênh đó trong các bài vừa phát
+    if channels and weights["channel_repeat"]:
+        # Chỉ tra Counter một lần cho mỗi kênh khác nhau
+        unique, first, inverse = np.unique(vectors.channels, return_index=True, return_inverse=True)
+        counts = np.fromiter(
+            (channels.count(vectors.tracks[i].author) for i in first),
+            dtype=np.float64,
+            count=len(unique),
+        )
+        scores -= counts[inverse] * weights["channel_repeat"]
+    
+    # Lệch thời lượng: phạt theo số lần gấp đôi/giảm nửa so với bài nguồn
+    if weights["duration"] and seed.length > 0:
+        ratio = np.maximum(vectors.durations, 1000.0) / max(seed.length, 1000)
+        scores -= np.abs(np.log2(ratio)) * weights["duration"]
+    
+    # Khẩu vị của guild qua các bài gần đây (HISTORY_LIMIT bài, có decay)
+    if profile:
+        scores += _mask_affinity(vectors.genres, profile.genre_weights()) * weights["profile_genre"]
+        scores += _mask_affinity(vectors.languages, profile.language_weights()) * weights["profile_language"]
+        scores += np.fromiter(
+            (profile.token_affinity(f.tokens) for f in vectors.features),
+            dtype=np.float64,
+            count=len(vectors.features),
+        ) * weights["profile_tokens"]
+    
+    # Độ liên quan tới seed theo graph local (điểm walk, bài gần nhất = 1)
+    if weights["graph"]:
+        scores += vectors.relatedness * weights["graph"]
+    
+    return scores
+
+
+def rank_candidates(
+    seed: wavelink.Playable,
+    tracks: list[wavelink.Playable],
+    k: int | None = None,
+    weights: dict[str, float] = SCORE_WEIGHTS,
+    profile: TasteProfile | None = None,
+    channels: ChannelWindow | None = None,
+    relatedness: list[float] | None = None,
+) -> list[tuple[wavelink.Playable, float]]:
+    """
+    Score candidates against the seed and return the top k (all if k is None),
+    best first, with scores attached. Ties keep the original order.
+    """
+    if not tracks or (k is not None and k <= 0):
+        return []
+    
+    scores = score_batch(seed, CandidateVectors(tracks, relatedness), weights, profile, channels)
+    
+    if k is not None and k < len(tracks):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(tracks))
+    # Sắp theo điểm giảm dần, hòa điểm thì giữ thứ tự ban đầu
+    order = top[np.lexsort((top, -scores[top]))]
+    
+    return [(tracks[i], float(scores[i])) for i in order]
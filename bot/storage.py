@@ -0,0 +1,34 @@
+"""
+Local storage - SQLite helpers shared by the on-disk stores
+"""
+import os
+import sqlite3
+
+from bot.config import DATA_DIR, SQLITE_BUSY_TIMEOUT
+
+
+def open_database(filename: str, cluster_id: int | None = None) -> sqlite3.Connection:
+    """
+    Open (or create) a SQLite database inside DATA_DIR.
+
+    WAL mode lets readers and the single writer work concurrently, and
+    synchronous=NORMAL is durable enough for data we can always rebuild.
+
+    Cluster processes share a file unless it is opened with their
+    `cluster_id` (process-local caches: cache.db -> cache.cluster2.db). On a
+    shared file a write waits up to SQLITE_BUSY_TIMEOUT seconds for another
+    process's lock, then fails with "database is locked" (see is_locked).
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    if cluster_id is not None:
+        stem, ext = os.path.splitext(filename)
+        filename = f"{stem}.cluster{cluster_id}{ext}"
+    conn = sqlite3.connect(os.path.join(DATA_DIR, filename), timeout=SQLITE_BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def is_locked(error: sqlite3.OperationalError) -> bool:
+    """True if a write gave up because another process held the lock past the busy timeout."""
+    return error.sqlite_errorcode in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
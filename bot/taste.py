@@ -0,0 +1,103 @@
+"""
+Taste Profile - Incrementally maintained per-guild genre/language/token profile
+"""
+from collections import deque
+
+from bot.features import TrackFeatures
+
+# Số bit tối đa của bitmask genre/language (khớp với bot/scoring.py)
+MASK_BITS = 16
+
+# Khi scale nhỏ hơn ngưỡng này thì nhân lại toàn bộ trọng số để tránh tràn số
+_RESCALE_BELOW = 1e-6
+
+
+class TasteProfile:
+    """
+    Decayed term-frequency profile over the last `limit` tracks of a guild.
+    
+    Each new track multiplies every older contribution by `decay`. Instead of
+    touching every weight, the decay is applied lazily: a global `scale`
+    shrinks and the new track is added with weight 1 / scale, so a real weight
+    is always raw * scale. Adding or evicting a track is O(its tokens).
+    """
+    
+    def __init__(self, limit: int, decay: float):
+        self.limit = limit
+        self.decay = decay
+        self.scale = 1.0
+        
+        self._window: deque[tuple[TrackFeatures, float]] = deque()  # (features, raw weight đã cộng)
+        self._total = 0.0  # Tổng raw weight của window
+        self._genres = [0.0] * MASK_BITS
+        self._languages = [0.0] * MASK_BITS
+        self._tokens: dict[str, float] = {}
+        self._token_counts: dict[str, int] = {}  # Số track trong window chứa token
+    
+    def __len__(self) -> int:
+        return len(self._window)
+    
+    def add(self, features: TrackFeatures) -> None:
+        """Đưa một track vào profile (và đẩy track cũ nhất ra nếu đầy)."""
+        self.scale *= self.decay
+        if self.scale < _RESCALE_BELOW:
+            self._rescale()
+        
+        weight = 1.0 / self.scale
+        self._window.append((features, weight))
+        self._apply(features, weight, 1)
+        
+        if len(self._window) > self.limit:
+            old_features, old_weight = self._window.popleft()
+            self._apply(old_features, -old_weight, -1)
+    
+    def _apply(self, features: TrackFeatures, weight: float, count: int) -> None:
+        self._total += weight
+        self._add_bits(self._genres, features.genres, weight)
+        self._add_bits(self._languages, features.languages, weight)
+        
+        for token in features.tokens:
+            remaining = self._token_counts.get(token, 0) + count
+            if remaining:
+                self._token_counts[token] = remaining
+                self._tokens[token] = self._tokens.get(token, 0.0) + weight
+            else:
+                # Token không còn trong window → xóa hẳn (tránh sai số float tích lũy)
+                del self._token_counts[token]
+                del self._tokens[token]
+    
+    @staticmethod
+    def _add_bits(target: list[float], mask: int, weight: float) -> None:
+        while mask:
+            low = mask & -mask
+            target[low.bit_length() - 1] += weight
+            mask ^= low
+    
+    def _rescale(self) -> None:
+        """Nhân scale vào raw weights và đặt scale = 1 (O(vocab), rất hiếm khi chạy)."""
+        scale = self.scale
+        self._window = deque((features, weight * scale) for features, weight in self._window)
+        self._total *= scale
+        self._genres = [weight * scale for weight in self._genres]
+        self._languages = [weight * scale for weight in self._languages]
+        self._tokens = {token: weight * scale for token, weight in self._tokens.items()}
+        self.scale = 1.0
+    
+    # Các giá trị dưới đây đã chuẩn hóa theo tổng trọng số: nằm trong [0, 1],
+    # là tỷ lệ (có decay) các bài gần đây mang genre / language / token đó
+    
+    def genre_weights(self) -> list[float]:
+        if not self._total:
+            return [0.0] * MASK_BITS
+        return [weight / self._total for weight in self._genres]
+    
+    def language_weights(self) -> list[float]:
+        if not self._total:
+            return [0.0] * MASK_BITS
+        return [weight / self._total for weight in self._languages]
+    
+    def token_affinity(self, tokens: tuple[str, ...]) -> float:
+        """Tổng trọng số chuẩn hóa của các token có trong profile."""
+        if not self._total:
+            return 0.0
+        return sum(self._tokens.get(token, 0.0) for token in tokens) / self._total
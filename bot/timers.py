@@ -0,0 +1,163 @@
+"""
+Timer Wheel - One hierarchical timing wheel for every per-guild deadline
+"""
+import asyncio
+import inspect
+import logging
+import math
+import time
+from typing import Callable, Hashable
+
+logger = logging.getLogger('timers')
+
+
+class Timer:
+    __slots__ = ("key", "deadline", "callback", "level", "slot")
+    
+    def __init__(self, key: Hashable, deadline: int, callback: Callable):
+        self.key = key
+        self.deadline = deadline  # Tick hết hạn
+        self.callback = callback
+        self.level = 0
+        self.slot = 0
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel: `levels` wheels of `slots` buckets each, level
+    L covering slots ** (L + 1) ticks. Arm / re-arm / cancel are O(1) (a dict
+    insert or delete in one bucket); timers far in the future sit in a coarse
+    bucket and cascade down as their time approaches.
+    
+    A single driver task ticks while at least one timer is live and exits
+    when the wheel is empty. Callbacks may be plain functions or coroutine
+    functions (run as a task so a slow callback never delays the tick).
+    """
+    
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._wheels: list[list[dict[Hashable, Timer]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self._timers: dict[Hashable, Timer] = {}
+        self._origin = time.monotonic()
+        self._now = 0  # Tick đã xử lý gần nhất
+        self._task: asyncio.Task | None = None
+        self._callbacks: set[asyncio.Task] = set()  # Callback coroutine đang chạy
+        self.fired = 0
+    
+    def __len__(self) -> int:
+        return len(self._timers)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+    
+    def _elapsed_ticks(self) -> int:
+        return int((time.monotonic() - self._origin) / self.tick)
+    
+    # ==================== ARM / CANCEL ====================
+    
+    def arm(self, key: Hashable, delay: float, callback: Callable) -> None:
+        """Đặt (hoặc đặt lại) timer `key` chạy `callback` sau `delay` giây."""
+        self.cancel(key)
+        if not self._timers:
+            # Wheel đang trống: đồng bộ tick hiện tại với đồng hồ thật
+            self._now = max(self._now, self._elapsed_ticks())
+        
+        ticks = max(1, math.ceil(delay / self.tick))
+        ticks = min(ticks, self.slots ** self.levels - 1)
+        timer = Timer(key, self._now + ticks, callback)
+        self._timers[key] = timer
+        self._place(timer)
+        
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def cancel(self, key: Hashable) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        del self._wheels[timer.level][timer.slot][key]
+        return True
+    
+    def remaining(self, key: Hashable) -> float | None:
+        """Số giây còn lại của timer (None nếu không có)."""
+        timer = self._timers.get(key)
+        if timer is None:
+            return None
+        return max(0.0, timer.deadline * self.tick - (time.monotonic() - self._origin))
+    
+    def _place(self, timer: Timer) -> None:
+        delta = timer.deadline - self._now
+        level = 0
+        while level < self.levels - 1 and delta >= self.slots ** (level + 1):
+            level += 1
+        timer.level = level
+        timer.slot = (timer.deadline // self.slots ** level) % self.slots
+        self._wheels[level][timer.slot][timer.key] = timer
+    
+    # ==================== DRIVER ====================
+    
+    def _advance(self) -> list[Timer]:
+        """Sang tick tiếp theo, trả về các timer hết hạn."""
+        self._now += 1
+        
+        # Đầu mỗi vòng của level dưới: đổ bucket hiện tại của level trên xuống
+        for level in range(1, self.levels):
+            if self._now % self.slots ** level:
+                break
+        else:
+            level = self.levels
+        for cascade in range(level - 1, 0, -1):
+            slot = (self._now // self.slots ** cascade) % self.slots
+            bucket = self._wheels[cascade][slot]
+            self._wheels[cascade][slot] = {}
+            for timer in bucket.values():
+                self._place(timer)
+        
+        slot = self._now % self.slots
+        bucket = self._wheels[0][slot]
+        if not bucket:
+            return []
+        self._wheels[0][slot] = {}
+        for key in bucket:
+            del self._timers[key]
+        return list(bucket.values())
+    
+    def _fire(self, timer: Timer) -> None:
+        self.fired += 1
+        try:
+            result = timer.callback()
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._callbacks.add(task)
+                task.add_done_callback(lambda done: self._callback_done(timer.key, done))
+        except Exception as e:
+            logger.error(f"[TIMER] {timer.key}: Callback lỗi: {e}")
+    
+    def _callback_done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._callbacks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"[TIMER] {key}: Callback lỗi: {task.exception()}")
+    
+    async def _run(self) -> None:
+        while self._timers:
+            wake = self._origin + (self._now + 1) * self.tick
+            await asyncio.sleep(max(0.0, wake - time.monotonic()))
+            # Bắt kịp nếu event loop bị chậm (xử lý mọi tick đã qua)
+            target = self._elapsed_ticks()
+            while self._now < target and self._timers:
+                for timer in self._advance():
+                    self._fire(timer)
+            if not self._timers:
+                self._now = max(self._now, target)
+    
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self._timers.clear()
+        for wheel in self._wheels:
+            for bucket in wheel:
+                bucket.clear()
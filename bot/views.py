@@ -0,0 +1,49 @@
+"""
+UI Views - Discord buttons for paginated embeds
+"""
+from typing import Callable
+
+import discord
+
+
+class PageButtons(discord.ui.View):
+    """
+    ◀ / ▶ buttons that re-render an embed through `render(page)`.
+    
+    `render` returns (embed, page_count) and is expected to be cheap (pages
+    are cached by the caller), so every click is a single message edit.
+    """
+    
+    def __init__(self, render: Callable[[int], tuple[discord.Embed, int]], page: int, page_count: int, timeout: float = 120):
+        super().__init__(timeout=timeout)
+        self.render = render
+        self.page = page
+        self.page_count = page_count
+        self.message: discord.Message | None = None
+        self._update_buttons()
+    
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page <= 1
+        self.next_page.disabled = self.page >= self.page_count
+    
+    async def _show(self, interaction: discord.Interaction, page: int):
+        embed, self.page_count = self.render(page)
+        self.page = min(max(page, 1), self.page_count)
+        self._update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+    
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page - 1)
+    
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page + 1)
+    
+    async def on_timeout(self):
+        # Hết hạn → bỏ nút
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
@@ -1,16 +1,30 @@
 """
 Entry point for hosting services that run Python files directly.
 This adds the project root to sys.path so imports work correctly.
+    
+    python run.py          # 1 process (hoặc nhiều process nếu CLUSTER_COUNT > 1)
+    python run.py stats    # Xem stats tổng của các cluster đang chạy
 """
 import sys
 import os
 import asyncio
+import json
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Now import and run the bot
 from bot.main import main
+from bot.config import DISCORD_TOKEN, SHARD_COUNT, CLUSTER_COUNT, CLUSTER_STATS_PORT
+from bot.cluster import launch, read_stats, ipc_key
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    address = ("127.0.0.1", CLUSTER_STATS_PORT)
+    
+    if sys.argv[1:] == ["stats"]:
+        print(json.dumps(read_stats(address, ipc_key(DISCORD_TOKEN or "")), indent=2))
+    elif CLUSTER_COUNT > 1:
+        # Mỗi cluster một process (một khoảng shard), dùng hết các core của máy
+        launch(SHARD_COUNT or CLUSTER_COUNT, CLUSTER_COUNT, address, ipc_key(DISCORD_TOKEN or ""))
+    else:
+        asyncio.run(main())
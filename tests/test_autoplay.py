@@ -0,0 +1,112 @@
+"""
+Autoplay - Track end with an empty candidate buffer must still find the next song
+"""
+import os
+import tempfile
+import unittest
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp()
+
+import wavelink
+
+from bot.cogs.music import Music
+from bot.journal import SessionJournal
+from bot.storage import open_database
+
+GUILD_ID = 1
+
+
+def make_track(identifier: str, title: str, author: str) -> wavelink.Playable:
+    return wavelink.Playable({
+        "encoded": identifier,
+        "info": {
+            "identifier": identifier,
+            "isSeekable": True,
+            "author": author,
+            "length": 200_000,
+            "isStream": False,
+            "position": 0,
+            "title": title,
+            "uri": f"https://www.youtube.com/watch?v={identifier}",
+            "artworkUrl": None,
+            "isrc": None,
+            "sourceName": "youtube",
+        },
+        "pluginInfo": {},
+    })
+
+
+class FakeBot:
+    def __init__(self):
+        self.journal = SessionJournal(open_database("journal.db"), 500)
+        self.voice_clients = []
+        self.user = None
+
+
+class FakeQueue(list):
+    journal = None
+
+
+class FakePlayer:
+    """Player ngay sau track end: wavelink đã bỏ `current`, queue trống."""
+    
+    def __init__(self):
+        self.guild = type("Guild", (), {"id": GUILD_ID})()
+        self.current = None
+        self.queue = FakeQueue()
+        self.connected = True
+        self.playing = False
+        self.text_channel = None
+        self.played: list[wavelink.Playable] = []
+    
+    async def play(self, track: wavelink.Playable, **kwargs) -> None:
+        self.played.append(track)
+        self.current = track
+
+
+class ColdAutoplayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.bot = FakeBot()
+        self.cog = Music(self.bot)
+        self.seed = make_track("seed0000001", "Chill Song One", "Artist A")
+        self.mix = [
+            self.seed,
+            make_track("next0000001", "Chill Song Two", "Artist B"),
+            make_track("next0000002", "Chill Song Three", "Artist C"),
+        ]
+        self.searches: list[str] = []
+        
+        async def search(query, priority=None, guild_id=None, deadline=None):
+            self.searches.append(query)
+            return list(self.mix)
+        
+        self.cog.resolver.search = search
+    
+    async def asyncTearDown(self):
+        self.cog.cog_unload()
+        self.bot.journal.close()
+    
+    async def test_empty_buffer_plays_from_mix_of_ended_track(self):
+        player = FakePlayer()
+        token = self.cog._actor(GUILD_ID).generation
+        
+        await self.cog._do_autoplay(player, token, self.seed)
+        
+        self.assertEqual(len(player.played), 1)
+        self.assertNotEqual(player.played[0].identifier, self.seed.identifier)
+        self.assertIn(f"list=RD{self.seed.identifier}", self.searches[0])
+        self.assertNotIn((GUILD_ID, "idle"), self.cog.timers)
+    
+    async def test_track_end_with_empty_buffer_plays_next(self):
+        player = FakePlayer()
+        payload = type("Payload", (), {"player": player, "track": self.seed, "reason": "finished"})()
+        token = self.cog._actor(GUILD_ID).generation
+        
+        await self.cog._advance(player, payload, token)
+        
+        self.assertEqual(len(player.played), 1)
+        self.assertNotEqual(player.played[0].identifier, self.seed.identifier)
+
+
+if __name__ == "__main__":
+    unittest.main()